@@ -0,0 +1,89 @@
+"""
+Compare the sync (threadpool) and async database paths at high concurrency.
+
+Each simulated request runs one slow report-style query (SELECT SLEEP) followed by
+a short write-sized query. The sync mode pushes requests through a thread limiter
+the same size as Starlette's default threadpool (40); the async mode awaits them
+on the event loop and is only bounded by the connection pool.
+
+Run from app_api/ against a running database:
+
+    python -m benchmarks.async_vs_sync --requests 400 --concurrency 200 --sleep 0.2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import DATABASE_URL, ASYNC_DATABASE_URL
+
+STARLETTE_THREADPOOL_SIZE = 40
+
+
+def _report(mode: str, latencies: list, elapsed: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{mode:>5}: {len(latencies)} requests in {elapsed:.2f}s "
+        f"({len(latencies) / elapsed:.1f} req/s), "
+        f"latency avg {statistics.mean(latencies) * 1000:.0f} ms, "
+        f"p95 {p95 * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms"
+    )
+
+
+def run_sync(args) -> None:
+    engine = create_engine(DATABASE_URL, pool_size=args.pool_size, max_overflow=0)
+
+    def one_request(submitted_at: float) -> float:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT SLEEP(:s)"), {"s": args.sleep})
+            conn.execute(text("SELECT 1"))
+        return time.perf_counter() - submitted_at
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=STARLETTE_THREADPOOL_SIZE) as pool:
+        futures = [pool.submit(one_request, time.perf_counter()) for _ in range(args.requests)]
+        latencies = [f.result() for f in futures]
+    _report("sync", latencies, time.perf_counter() - started)
+    engine.dispose()
+
+
+async def run_async(args) -> None:
+    engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=args.pool_size, max_overflow=0)
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one_request() -> float:
+        submitted_at = time.perf_counter()
+        async with gate:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT SLEEP(:s)"), {"s": args.sleep})
+                await conn.execute(text("SELECT 1"))
+        return time.perf_counter() - submitted_at
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(one_request() for _ in range(args.requests)))
+    _report("async", list(latencies), time.perf_counter() - started)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200, help="in-flight requests in async mode")
+    parser.add_argument("--pool-size", type=int, default=100, help="connections per engine")
+    parser.add_argument("--sleep", type=float, default=0.2, help="seconds each simulated query holds a connection")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    args = parser.parse_args()
+
+    if args.mode in ("sync", "both"):
+        run_sync(args)
+    if args.mode in ("async", "both"):
+        asyncio.run(run_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Fill the database with a synthetic catalog, stock-in history and sales for benchmarking.
+
+Volumes are configurable (e.g. 100k products and 10M sale lines). The dates are skewed the
+way a shop's are: volume grows over the period, weekends are busier, most sales fall around
+lunch and evening, and product popularity follows a Zipf curve. Products are restocked
+whenever their stock drops to the reorder level.
+
+Rows are written in bulk with the triggers temporarily dropped (they are saved with
+SHOW CREATE TRIGGER and restored afterwards, even on failure). The generator fills in
+everything the triggers would have: sale totals, frozen unit costs, movements, stock
+balances and the daily rollup. Generated rows are added to what is already in the database.
+
+Run from app_api/ against a running database:
+
+    python -m benchmarks.generate_data --products 100000 --sale-lines 10000000 --days 730
+"""
+import argparse
+import bisect
+import itertools
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from config import DATABASE_URL
+
+# Share of the day's sales per hour, 09:00 to 21:00: lunch and evening peaks
+HOUR_WEIGHTS = {9: 3, 10: 5, 11: 8, 12: 12, 13: 10, 14: 6, 15: 5, 16: 6, 17: 9, 18: 12, 19: 11, 20: 8, 21: 5}
+# Relative volume by weekday (Monday = 0)
+WEEKDAY_WEIGHTS = (0.9, 0.9, 0.95, 1.0, 1.2, 1.45, 1.35)
+PAYMENT_METHODS = ("Cash", "Card", "QR")
+PAYMENT_WEIGHTS = (0.3, 0.35, 0.35)
+NOTE_WORDS = ("ลูกค้าประจำ", "ส่งด่วน", "ของขวัญ", "โปรโมชั่น", "member", "online", "pickup", "promo", "gift")
+PRODUCT_WORDS = ("Pro", "Max", "Mini", "Ultra", "Lite", "Plus", "Air", "Neo", "Prime", "Go")
+BRANDS = ("Apple", "Samsung", "Google", "Sony", "Bose", "Dell", "Lenovo", "Garmin", "Anker", "Logitech", "Ugreen", "Xiaomi")
+
+INSERTS = {
+    "category": "INSERT INTO category (category_id, name) VALUES (%s, %s)",
+    "product": "INSERT INTO product (product_id, name, category_id, sku, price, reorder_level) VALUES (%s, %s, %s, %s, %s, %s)",
+    "stock_in": "INSERT INTO stock_in (stock_in_id, ref_no, stock_in_date, total_cost, notes) VALUES (%s, %s, %s, %s, %s)",
+    "stock_in_item": "INSERT INTO stock_in_item (stock_in_item_id, stock_in_id, product_id, quantity, unit_cost) VALUES (%s, %s, %s, %s, %s)",
+    "sale": "INSERT INTO sale (sale_id, sale_datetime, total_amount, payment_method, notes) VALUES (%s, %s, %s, %s, %s)",
+    "sale_item": "INSERT INTO sale_item (sale_item_id, sale_id, product_id, quantity, unit_price, discount, unit_cost) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+    "inventory_movement": (
+        "INSERT INTO inventory_movement (movement_id, product_id, movement_type, quantity, unit_cost, sale_price, "
+        "movement_date, stock_in_item_id, sale_item_id) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+    ),
+}
+
+
+class Loader:
+    """
+    Buffers rows per table and writes them with multi-row INSERTs, parents before children.
+    """
+
+    def __init__(self, conn, batch_size: int):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.buffers = {table: [] for table in INSERTS}
+        self.written = dict.fromkeys(INSERTS, 0)
+
+    def add(self, table: str, row: tuple):
+        self.buffers[table].append(row)
+        if len(self.buffers[table]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table, rows in self.buffers.items():
+            if rows:
+                self.conn.exec_driver_sql(INSERTS[table], rows)
+                self.written[table] += len(rows)
+                rows.clear()
+        self.conn.commit()
+
+
+def _next_id(conn, table: str, column: str) -> int:
+    return conn.execute(text(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}")).scalar()
+
+
+def _save_and_drop_triggers(conn) -> list:
+    names = conn.execute(text(
+        "SELECT trigger_name FROM information_schema.triggers "
+        "WHERE trigger_schema = DATABASE() ORDER BY event_object_table, action_order"
+    )).scalars().all()
+    statements = [
+        conn.exec_driver_sql(f"SHOW CREATE TRIGGER `{name}`").mappings().one()["SQL Original Statement"]
+        for name in names
+    ]
+    for name in names:
+        conn.exec_driver_sql(f"DROP TRIGGER `{name}`")
+    return statements
+
+
+def _restore_triggers(conn, statements: list):
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+
+
+def _day_weights(first: date, days: int, growth: float) -> list:
+    return [
+        growth ** (offset / max(days - 1, 1)) * WEEKDAY_WEIGHTS[(first + timedelta(days=offset)).weekday()]
+        for offset in range(days)
+    ]
+
+
+def generate(conn, args):
+    rng = random.Random(args.seed)
+    loader = Loader(conn, args.batch_size)
+    today = date.today()
+    first_day = today - timedelta(days=args.days)
+
+    archived_before = conn.execute(text("SELECT archived_before FROM archive_state WHERE id = 1")).scalar()
+    if archived_before is not None and datetime.combine(first_day, datetime.min.time()) < archived_before:
+        raise SystemExit(f"--days reaches into the archived period (before {archived_before}); use fewer days")
+
+    ids = {
+        "category": _next_id(conn, "category", "category_id"),
+        "product": _next_id(conn, "product", "product_id"),
+        "stock_in": _next_id(conn, "stock_in", "stock_in_id"),
+        "stock_in_item": _next_id(conn, "stock_in_item", "stock_in_item_id"),
+        "sale": _next_id(conn, "sale", "sale_id"),
+        "sale_item": _next_id(conn, "sale_item", "sale_item_id"),
+        "inventory_movement": _next_id(conn, "inventory_movement", "movement_id"),
+    }
+    counters = {table: itertools.count(start) for table, start in ids.items()}
+    first_product_id = ids["product"]
+
+    # ---- Catalog -----------------------------------------------------------
+    category_ids = []
+    for _ in range(args.categories):
+        category_id = next(counters["category"])
+        category_ids.append(category_id)
+        loader.add("category", (category_id, f"หมวดสินค้า {category_id}"))
+
+    products = []  # index -> [product_id, price, reorder_level, base_cost, stock, cost_quantity, cost_value]
+    for _ in range(args.products):
+        product_id = next(counters["product"])
+        price = round(rng.lognormvariate(7.5, 1.1), 2) + 1
+        reorder_level = rng.choice((5, 8, 10, 12, 15, 20, 25, 30))
+        name = f"{rng.choice(BRANDS)} {rng.choice(PRODUCT_WORDS)} {product_id}"
+        loader.add("product", (product_id, name, rng.choice(category_ids), f"BEN-{product_id:08d}", price, reorder_level))
+        products.append([product_id, price, reorder_level, round(price * rng.uniform(0.55, 0.8), 2), 0, 0, 0.0])
+
+    # Zipf popularity over a shuffled catalog
+    popularity = list(range(len(products)))
+    rng.shuffle(popularity)
+    cumulative, running = [], 0.0
+    for rank in range(1, len(products) + 1):
+        running += 1 / rank ** args.zipf
+        cumulative.append(running)
+
+    def pick_product():
+        return popularity[bisect.bisect_left(cumulative, rng.random() * running)]
+
+    hours = list(HOUR_WEIGHTS)
+    hour_weights = list(HOUR_WEIGHTS.values())
+
+    def stock_in(day: date, items: list, ref_prefix: str, movement_type: str):
+        """
+        Write one stock-in dated `day` for the (product index, quantity) items.
+        """
+        stock_in_id = next(counters["stock_in"])
+        moved_at = datetime.combine(day, datetime.min.time())
+        total_cost = 0.0
+        rows = []
+        for index, quantity in items:
+            product = products[index]
+            unit_cost = round(product[3] * rng.uniform(0.95, 1.05), 2)
+            item_id = next(counters["stock_in_item"])
+            rows.append((item_id, stock_in_id, product[0], quantity, unit_cost))
+            total_cost += quantity * unit_cost
+            product[4] += quantity
+            product[5] += quantity
+            product[6] += quantity * unit_cost
+            loader.add("inventory_movement", (
+                next(counters["inventory_movement"]), product[0], movement_type, quantity, unit_cost, None,
+                moved_at, item_id, None
+            ))
+        loader.add("stock_in", (stock_in_id, f"{ref_prefix}-{day:%Y%m%d}-{stock_in_id}", day, round(total_cost, 2), None))
+        for row in rows:
+            loader.add("stock_in_item", row)
+
+    def restock_quantity(product) -> int:
+        return product[2] * rng.randint(3, 6)
+
+    # ---- Opening stock -----------------------------------------------------
+    for start in range(0, len(products), 1000):
+        chunk = range(start, min(start + 1000, len(products)))
+        stock_in(first_day, [(index, restock_quantity(products[index])) for index in chunk], "OPEN", "OPENING")
+
+    # ---- Daily sales and restocking ---------------------------------------
+    sales_total = max(round(args.sale_lines / args.avg_lines), 1)
+    day_weights = _day_weights(first_day, args.days, args.growth)
+    weight_sum = sum(day_weights)
+    started = time.perf_counter()
+    carry = 0.0
+    for offset, weight in enumerate(day_weights):
+        day = first_day + timedelta(days=offset)
+        carry += sales_total * weight / weight_sum
+        sales_today, carry = int(carry), carry - int(carry)
+
+        low_stock = set()
+        sale_times = sorted(
+            datetime.combine(day, datetime.min.time())
+            + timedelta(hours=hour, minutes=rng.randrange(60), seconds=rng.randrange(60))
+            for hour in rng.choices(hours, hour_weights, k=sales_today)
+        )
+        for sold_at in sale_times:
+            line_count = min(1 + int(rng.expovariate(1 / max(args.avg_lines - 1, 0.01))), 10)
+            lines = {pick_product() for _ in range(line_count)}
+            sale_id = next(counters["sale"])
+            total = 0.0
+            item_rows = []
+            for index in lines:
+                product = products[index]
+                quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+                if product[4] < quantity:
+                    low_stock.add(index)
+                    continue
+                discount = 0 if rng.random() < 0.85 else rng.choice((0.05, 0.1, 0.15))
+                unit_cost = round(product[6] / product[5], 4)
+                item_id = next(counters["sale_item"])
+                item_rows.append((item_id, sale_id, product[0], quantity, product[1], discount, unit_cost))
+                total += quantity * product[1] * (1 - discount)
+                product[4] -= quantity
+                if product[4] <= product[2]:
+                    low_stock.add(index)
+                loader.add("inventory_movement", (
+                    next(counters["inventory_movement"]), product[0], "SALE", -quantity, None,
+                    round(product[1] * (1 - discount), 2), sold_at, None, item_id
+                ))
+            if not item_rows:
+                continue
+            notes = " ".join(rng.sample(NOTE_WORDS, 2)) if rng.random() < args.notes_ratio else None
+            loader.add("sale", (sale_id, sold_at, round(total, 2), rng.choices(PAYMENT_METHODS, PAYMENT_WEIGHTS)[0], notes))
+            for row in item_rows:
+                loader.add("sale_item", row)
+
+        if low_stock and offset + 1 < args.days:
+            restock = sorted(low_stock)
+            for start in range(0, len(restock), 200):
+                items = [(index, restock_quantity(products[index])) for index in restock[start:start + 200]]
+                stock_in(day + timedelta(days=1), items, "STKIN", "STOCK_IN")
+
+        if offset % 30 == 29 or offset == args.days - 1:
+            loader.flush()
+            elapsed = time.perf_counter() - started
+            print(f"{day}: {loader.written['sale_item']:,} sale lines, {loader.written['sale']:,} sales ({elapsed:.0f}s)")
+    loader.flush()
+    return first_product_id, first_day, loader.written
+
+
+def derive(conn, first_product_id: int, first_day: date):
+    """
+    Rebuild what the triggers and the API would have maintained for the generated rows.
+    """
+    conn.execute(text("""
+        INSERT INTO product_stock_balance (product_id, stock_on_hand, needs_restock, last_movement_at,
+                                           cost_quantity, cost_value, last_cost_at, last_sale_at)
+        SELECT
+            p.product_id,
+            COALESCE(SUM(im.quantity), 0),
+            COALESCE(SUM(im.quantity), 0) <= p.reorder_level,
+            MAX(im.movement_date),
+            COALESCE(SUM(CASE WHEN im.movement_type IN ('STOCK_IN', 'OPENING') THEN im.quantity END), 0),
+            COALESCE(SUM(CASE WHEN im.movement_type IN ('STOCK_IN', 'OPENING') THEN im.quantity * im.unit_cost END), 0),
+            MAX(CASE WHEN im.movement_type IN ('STOCK_IN', 'OPENING') THEN im.movement_date END),
+            MAX(CASE WHEN im.movement_type = 'SALE' THEN im.movement_date END)
+        FROM product p
+        LEFT JOIN inventory_movement im ON p.product_id = im.product_id
+        WHERE p.product_id >= :first_product_id
+        GROUP BY p.product_id, p.reorder_level
+    """), {"first_product_id": first_product_id})
+    conn.commit()
+
+    # Whole days of the generated period, recomputed from every line on those days
+    conn.execute(text("DELETE FROM sales_daily_rollup WHERE sale_date >= :first_day"), {"first_day": first_day})
+    conn.execute(text("""
+        INSERT INTO sales_daily_rollup (sale_date, product_id, payment_method, line_count, quantity, revenue, cogs, gross_profit)
+        SELECT
+            DATE(s.sale_datetime),
+            si.product_id,
+            s.payment_method,
+            COUNT(*),
+            SUM(si.quantity),
+            SUM(si.quantity * si.unit_price * (1 - si.discount)),
+            SUM(si.quantity * si.unit_cost),
+            SUM(si.quantity * si.unit_price * (1 - si.discount) - si.quantity * si.unit_cost)
+        FROM sale_item si
+        JOIN sale s ON s.sale_id = si.sale_id
+        WHERE s.sale_datetime >= :first_day
+        GROUP BY DATE(s.sale_datetime), si.product_id, s.payment_method
+    """), {"first_day": first_day})
+
+    # Any stock snapshot may now be missing movements
+    conn.execute(text("DELETE FROM stock_snapshot_period"))
+    conn.commit()
+
+    for table in ("product", "sale", "sale_item", "stock_in", "stock_in_item", "inventory_movement", "sales_daily_rollup"):
+        conn.exec_driver_sql(f"ANALYZE TABLE {table}").all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--sale-lines", type=int, default=1_000_000, help="approximate number of sale_item rows")
+    parser.add_argument("--days", type=int, default=365, help="length of the history, ending yesterday")
+    parser.add_argument("--avg-lines", type=float, default=2.5, help="average lines per sale")
+    parser.add_argument("--growth", type=float, default=2.0, help="daily volume at the end relative to the start")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of product popularity")
+    parser.add_argument("--notes-ratio", type=float, default=0.05, help="share of sales with notes")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per multi-row INSERT")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SET SESSION foreign_key_checks = 0")
+        triggers = _save_and_drop_triggers(conn)
+        conn.commit()
+        try:
+            first_product_id, first_day, written = generate(conn, args)
+            derive(conn, first_product_id, first_day)
+        finally:
+            conn.rollback()
+            _restore_triggers(conn, triggers)
+            conn.exec_driver_sql("SET SESSION foreign_key_checks = 1")
+            conn.commit()
+    engine.dispose()
+
+    print(f"done in {time.perf_counter() - started:.0f}s: " + ", ".join(f"{table} {count:,}" for table, count in written.items()))
+
+
+if __name__ == "__main__":
+    main()
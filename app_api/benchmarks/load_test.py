@@ -0,0 +1,321 @@
+"""
+End-to-end load benchmark over every router.
+
+A closed loop of --concurrency workers runs a weighted mix of scenarios for --duration
+seconds: POS writes (sales, stock-ins) and SKU scans, list browsing and search, deep
+pagination (OFFSET and keyset) and report pages and summaries. It reports throughput and
+p50/p95/p99 latency per scenario, plus SQL statements and DB time per request per route,
+taken from the API's own /metrics before and after the run. Each run is saved as JSON under
+benchmarks/results/ with the git commit, so runs can be compared across commits.
+
+The API can be a running server (--base-url) or the app embedded in this process through
+httpx's ASGI transport (--embedded, no uvicorn or network hop). Either way it needs a MySQL
+database with data, e.g. the compose `db` service filled by benchmarks.generate_data. The
+schema relies on MySQL triggers, stored routines and n-gram FULLTEXT indexes, so there is
+no embedded database stand-in.
+
+Requires httpx (pip install httpx). Run from app_api/:
+
+    python -m benchmarks.load_test --base-url http://localhost:8000 --duration 60 --concurrency 32
+    python -m benchmarks.load_test --embedded --duration 30
+    python -m benchmarks.load_test --compare benchmarks/results/A.json benchmarks/results/B.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# scenario -> relative weight in the mix
+SCENARIO_WEIGHTS = {
+    "pos_sale": 20,
+    "pos_scan": 20,
+    "stock_in": 2,
+    "list_products": 8,
+    "search_products": 6,
+    "list_categories": 2,
+    "list_sales": 8,
+    "list_stock_in": 3,
+    "list_movements": 6,
+    "deep_offset_sales": 3,
+    "deep_keyset_movements": 4,
+    "report_product_stock": 4,
+    "report_profitability": 3,
+    "summary_product_stock": 4,
+    "summary_profitability": 4,
+}
+
+SEARCH_TERMS = ("Pro", "Max", "Apple", "Samsung", "Sony", "Ultra", "Air", "BEN-0001")
+
+_METRIC_LINE = re.compile(r'^(db_statements_total|db_time_seconds_total|http_requests_total)\{method="([^"]+)",route="([^"]+)"(?:,status="\d+")?\} (\S+)$')
+
+
+class Workload:
+    """
+    Builds the requests of each scenario from a sample of real products (IDs and SKUs).
+    Keyset walks keep their cursor between calls so successive calls go deeper.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, products: list, rng: random.Random, keyset_depth: int):
+        self.client = client
+        self.product_ids = [product["product_id"] for product in products]
+        self.skus = [product["sku"] for product in products if product.get("sku")] or [None]
+        self.rng = rng
+        self.keyset_depth = keyset_depth
+        self.keyset_cursor = ""
+        self.keyset_page = 0
+
+    def _window(self, days: int):
+        end = date.today() - timedelta(days=self.rng.randrange(0, 60))
+        return (end - timedelta(days=days)).isoformat(), end.isoformat()
+
+    async def run(self, scenario: str) -> httpx.Response:
+        rng, client = self.rng, self.client
+        if scenario == "pos_sale":
+            items = [
+                {"product_id": product_id, "quantity": 1 if rng.random() < 0.8 else 2}
+                for product_id in rng.sample(self.product_ids, rng.randint(1, 3))
+            ]
+            return await client.post("/sales/", json={
+                "payment_method": rng.choice(("Cash", "Card", "QR")), "items": items
+            })
+        if scenario == "pos_scan":
+            return await client.get(f"/products/by-sku/{rng.choice(self.skus)}")
+        if scenario == "stock_in":
+            items = [
+                {"product_id": product_id, "quantity": rng.randint(10, 50), "unit_cost": round(rng.uniform(100, 5000), 2)}
+                for product_id in rng.sample(self.product_ids, rng.randint(1, 5))
+            ]
+            return await client.post("/stock-in/", json={"ref_no": f"LOAD-{time.time_ns()}", "items": items})
+        if scenario == "list_products":
+            return await client.get("/products/", params={"page": rng.randint(1, 5), "limit": 20})
+        if scenario == "search_products":
+            return await client.get("/products/", params={"search": rng.choice(SEARCH_TERMS), "limit": 20})
+        if scenario == "list_categories":
+            return await client.get("/categories/", params={"limit": 50})
+        if scenario == "list_sales":
+            return await client.get("/sales/", params={"limit": 20, "page": rng.randint(1, 3)})
+        if scenario == "list_stock_in":
+            return await client.get("/stock-in/", params={"limit": 20})
+        if scenario == "list_movements":
+            return await client.get("/inventory-movements/", params={
+                "product_id": rng.choice(self.product_ids), "limit": 20
+            })
+        if scenario == "deep_offset_sales":
+            return await client.get("/sales/", params={
+                "page": rng.randint(200, 2000), "limit": 20, "include_total": "false", "include_items": "false"
+            })
+        if scenario == "deep_keyset_movements":
+            response = await client.get("/inventory-movements/", params={"cursor": self.keyset_cursor, "limit": 100})
+            self.keyset_page += 1
+            next_cursor = response.json().get("next_cursor") if response.status_code == 200 else None
+            if next_cursor and self.keyset_page < self.keyset_depth:
+                self.keyset_cursor = next_cursor
+            else:
+                self.keyset_cursor, self.keyset_page = "", 0
+            return response
+        if scenario == "report_product_stock":
+            return await client.get("/reports/product-stock", params={
+                "productFilter": rng.choice(("r", "nr", "")), "limit": 20, "include_total": "estimated"
+            })
+        if scenario == "report_profitability":
+            start, end = self._window(7)
+            return await client.get("/reports/profitability", params={"start_date": start, "end_date": end, "limit": 20})
+        if scenario == "summary_product_stock":
+            return await client.get("/reports/product-stock/summary", params={"needs_restock_only": rng.random() < 0.3})
+        if scenario == "summary_profitability":
+            start, end = self._window(rng.choice((1, 7, 30, 90)))
+            return await client.get("/reports/profitability/summary", params={"start_date": start, "end_date": end})
+        raise ValueError(scenario)
+
+
+async def _sample_products(client: httpx.AsyncClient, limit: int) -> list:
+    products, cursor = [], ""
+    while len(products) < limit:
+        response = await client.get("/products/", params={"cursor": cursor, "limit": 100, "fields": "product_id,sku"})
+        response.raise_for_status()
+        page = response.json()
+        products += page["items"]
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+    if not products:
+        raise SystemExit("no products found; fill the database first (python -m benchmarks.generate_data)")
+    return products
+
+
+async def _scrape(client: httpx.AsyncClient) -> dict:
+    """
+    (method, route) -> {"requests", "statements", "db_seconds"} from /metrics.
+    """
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    routes = {}
+    for line in response.text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match is None:
+            continue
+        name, method, route, value = match.groups()
+        entry = routes.setdefault((method, route), {"requests": 0, "statements": 0, "db_seconds": 0.0})
+        key = {"http_requests_total": "requests", "db_statements_total": "statements", "db_time_seconds_total": "db_seconds"}[name]
+        entry[key] += float(value)
+    return routes
+
+
+def _route_costs(before: dict, after: dict) -> dict:
+    costs = {}
+    for (method, route), end in sorted(after.items()):
+        if route in ("/metrics", "<unmatched>"):
+            continue
+        start = before.get((method, route), {"requests": 0, "statements": 0, "db_seconds": 0.0})
+        requests = end["requests"] - start["requests"]
+        if requests <= 0:
+            continue
+        costs[f"{method} {route}"] = {
+            "requests": int(requests),
+            "sql_per_request": round((end["statements"] - start["statements"]) / requests, 2),
+            "db_ms_per_request": round((end["db_seconds"] - start["db_seconds"]) * 1000 / requests, 2),
+        }
+    return costs
+
+
+def _latency_stats(samples: list) -> dict:
+    latencies = sorted(sample[0] for sample in samples)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "count": len(samples),
+        "errors": sum(1 for sample in samples if not sample[1]),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p95_ms": round(cuts[94] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+    }
+
+
+async def run(args) -> dict:
+    if args.embedded:
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://embedded", timeout=args.timeout)
+    else:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+
+    async with client:
+        rng = random.Random(args.seed)
+        workload = Workload(client, await _sample_products(client, args.products), rng, args.keyset_depth)
+        scenarios = [name for name in SCENARIO_WEIGHTS if not args.only or name in args.only]
+        weights = [SCENARIO_WEIGHTS[name] for name in scenarios]
+        samples = {name: [] for name in scenarios}
+        recording = False
+
+        async def worker(deadline: float):
+            while time.perf_counter() < deadline:
+                scenario = rng.choices(scenarios, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await workload.run(scenario)
+                    ok = response.status_code < 500
+                except httpx.HTTPError:
+                    ok = False
+                if recording:
+                    samples[scenario].append((time.perf_counter() - started, ok))
+
+        if args.warmup > 0:
+            await asyncio.gather(*(worker(time.perf_counter() + args.warmup) for _ in range(args.concurrency)))
+
+        before = await _scrape(client)
+        recording = True
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(started + args.duration) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        recording = False
+        after = await _scrape(client)
+
+    total = sum(len(values) for values in samples.values())
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "target": "embedded" if args.embedded else args.base_url,
+        "params": {"duration": args.duration, "concurrency": args.concurrency, "seed": args.seed, "scenarios": scenarios},
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "overall": _latency_stats([sample for values in samples.values() for sample in values]) if total else {},
+        "scenarios": {name: _latency_stats(values) for name, values in samples.items() if values},
+        "routes": _route_costs(before, after),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _print_result(result: dict):
+    print(f"{result['requests']} requests, {result['throughput_rps']} req/s ({result['target']}, {result['commit']})")
+    print(f"{'scenario':<24}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in result["scenarios"].items():
+        print(f"{name:<24}{stats['count']:>8}{stats['errors']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"\n{'route':<40}{'requests':>10}{'SQL/req':>10}{'DB ms/req':>12}")
+    for route, cost in result["routes"].items():
+        print(f"{route:<40}{cost['requests']:>10}{cost['sql_per_request']:>10}{cost['db_ms_per_request']:>12}")
+
+
+def _compare(old_path: str, new_path: str):
+    old, new = (json.loads(Path(path).read_text()) for path in (old_path, new_path))
+    print(f"{old['commit']} -> {new['commit']}: throughput {old['throughput_rps']} -> {new['throughput_rps']} req/s")
+    print(f"{'scenario':<24}{'p95 old':>10}{'p95 new':>10}{'change':>9}")
+    for name in new["scenarios"]:
+        if name in old["scenarios"]:
+            before, after = old["scenarios"][name]["p95_ms"], new["scenarios"][name]["p95_ms"]
+            change = f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
+            print(f"{name:<24}{before:>10}{after:>10}{change:>9}")
+    print(f"\n{'route':<40}{'SQL/req old':>12}{'SQL/req new':>12}")
+    for route in new["routes"]:
+        if route in old["routes"]:
+            print(f"{route:<40}{old['routes'][route]['sql_per_request']:>12}{new['routes'][route]['sql_per_request']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--base-url", default="http://localhost:8000", help="URL of a running API")
+    target.add_argument("--embedded", action="store_true", help="serve the app in-process through the ASGI transport")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent simulated clients")
+    parser.add_argument("--products", type=int, default=2000, help="product IDs sampled for writes and filters")
+    parser.add_argument("--keyset-depth", type=int, default=50, help="pages walked by the keyset scenario before restarting")
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIO_WEIGHTS), help="run only these scenarios")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two saved results and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        _compare(*args.compare)
+        return
+
+    result = asyncio.run(run(args))
+    _print_result(result)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}_{result['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"\nsaved {output}")
+
+
+if __name__ == "__main__":
+    main()
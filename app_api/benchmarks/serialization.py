@@ -0,0 +1,188 @@
+"""
+Micro-benchmark of the per-row cost of serializing list pages.
+
+Compares, on synthetic rows shaped like the ORM objects the list endpoints return:
+
+- response_model: what FastAPI does with a returned page: dump the PaginatedResponse,
+  validate it against PaginatedResponse[Model] (from_attributes on every row and nested
+  item), dump that to JSON-compatible data and encode it with json.dumps
+- fast json:      services.serialization.page_payload + orjson
+- fast msgpack:   services.serialization.page_payload + MessagePack
+
+Every fast JSON body is checked to decode to the same data as the response_model one.
+Before timing, every response model is also checked byte for byte: render(row_serializer(M)(row))
+against M.model_validate(row).model_dump_json(), on generated rows with DECIMAL ints, 0/1
+bools, NULLs and DATE values in datetime fields. No database is needed. Run from app_api/:
+
+    python -m benchmarks.serialization --rows 100 --items 3 --repeat 200
+"""
+import argparse
+import json
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import List, get_args, get_origin
+
+from pydantic import BaseModel
+
+from models import response_models
+from services import serialization
+
+
+def _sale(i: int, items: int):
+    return SimpleNamespace(
+        sale_id=i,
+        sale_datetime=datetime(2024, 1, 1, 9) + timedelta(minutes=17 * i),
+        total_amount=Decimal("1234.50") + i,
+        payment_method=("Cash", "Card", "QR")[i % 3],
+        notes=None if i % 4 else f"note {i}",
+        items=[
+            SimpleNamespace(
+                sale_item_id=i * 10 + n, sale_id=i, product_id=n + 1, quantity=n + 1,
+                unit_price=Decimal("399.00") + n, discount=Decimal("0.05")
+            )
+            for n in range(items)
+        ],
+    )
+
+
+def _profitability(i: int, items: int):
+    return SimpleNamespace(
+        sale_item_id=i, sale_id=i // 3, sale_datetime=datetime(2024, 1, 1, 9) + timedelta(minutes=7 * i),
+        product_id=i % 50, product_name=f"สินค้า {i}", quantity=2, unit_price=Decimal("399.00"),
+        discount=Decimal("0.00"), total_revenue=Decimal("798.0000"), average_cost_at_sale=Decimal("250.1234"),
+        total_cogs=Decimal("500.2468"), gross_profit=Decimal("297.7532"),
+    )
+
+
+def _product_stock(i: int, items: int):
+    return SimpleNamespace(
+        product_id=i, name=f"Product {i}", price=Decimal("1290.00"), reorder_level=10,
+        stock_on_hand=i % 25, needs_restock=int(i % 25 <= 10), last_movement_at=datetime(2024, 1, 1),
+    )
+
+
+SHAPES = {
+    "Sale": (response_models.Sale, _sale),
+    "ProfitabilityReport": (response_models.ProfitabilityReport, _profitability),
+    "ProductStock": (response_models.ProductStock, _product_stock),
+}
+
+
+def _sample_value(annotation, i: int, date_valued: bool):
+    if serialization._without_none(annotation) is not annotation:
+        if i % 2 == 0:
+            return None
+        annotation = serialization._without_none(annotation)
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _sample_row(annotation, i, date_valued)
+    if get_origin(annotation) in (list, List):
+        return [_sample_value(get_args(annotation)[0], i * 10 + n, date_valued) for n in range(1, 3)]
+    if annotation is bool:
+        return i % 2  # TINYINT
+    if annotation is int:
+        return Decimal(i) if i % 2 == 0 else i  # SUM() and arithmetic come back as DECIMAL
+    if annotation is float:
+        return Decimal("12.34") + i
+    if annotation is datetime:
+        return date(2025, 1, 2) if date_valued else datetime(2025, 1, 2, 9, 30, 15, 123000)
+    if annotation is str:
+        return f"ค่า {i}"
+    raise TypeError(f"No sample value for {annotation!r}")
+
+
+def _sample_row(model, i: int, date_valued: bool):
+    return SimpleNamespace(**{
+        name: _sample_value(field.annotation, i, date_valued) for name, field in model.model_fields.items()
+    })
+
+
+def check_parity() -> list:
+    """
+    Response models whose fast JSON body differs byte for byte from the pydantic one.
+    """
+    models = [
+        model for model in vars(response_models).values()
+        if isinstance(model, type) and issubclass(model, BaseModel) and model.__module__ == response_models.__name__
+        and not model.__pydantic_generic_metadata__["parameters"]
+    ]
+    different = []
+    for model in models:
+        for i in (1, 2):
+            for date_valued in (False, True):
+                row = _sample_row(model, i, date_valued)
+                fast = serialization.render(serialization.row_serializer(model)(row)).body
+                expected = model.model_validate(row, from_attributes=True).model_dump_json().encode()
+                if fast != expected:
+                    different.append((model.__name__, fast, expected))
+    return different
+
+
+def _page(rows: list):
+    return response_models.PaginatedResponse(
+        items=rows, total=10_000, page=1, limit=len(rows), total_pages=10_000 // len(rows),
+        has_next=True, has_prev=False
+    )
+
+
+def response_model_path(page, item_model) -> bytes:
+    validated = response_models.PaginatedResponse[item_model].model_validate(page.model_dump(), from_attributes=True)
+    data = validated.model_dump(mode="json")
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def fast_json_path(page, item_model) -> bytes:
+    return serialization.render(serialization.page_payload(page, item_model)).body
+
+
+def fast_msgpack_path(page, item_model) -> bytes:
+    return serialization.render(serialization.page_payload(page, item_model), serialization.MSGPACK_MEDIA_TYPE).body
+
+
+PATHS = {
+    "response_model": response_model_path,
+    "fast json": fast_json_path,
+    "fast msgpack": fast_msgpack_path,
+}
+
+
+def _per_row_us(path, page, item_model, repeat: int) -> tuple:
+    path(page, item_model)  # warm up caches (compiled serializers, pydantic generics)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = path(page, item_model)
+        best = min(best, time.perf_counter() - started)
+    return best / len(page.items) * 1e6, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100, help="Rows per page")
+    parser.add_argument("--items", type=int, default=3, help="Nested items per sale")
+    parser.add_argument("--repeat", type=int, default=200, help="Runs per measurement (the best one is kept)")
+    args = parser.parse_args()
+
+    different = check_parity()
+    for name, fast, expected in different:
+        print(f"DIFFERENT {name}:\n  fast:     {fast.decode()}\n  pydantic: {expected.decode()}")
+    if different:
+        raise SystemExit(1)
+
+    print(f"{args.rows} rows per page, {args.items} items per sale, best of {args.repeat}")
+    for shape, (item_model, make_row) in SHAPES.items():
+        page = _page([make_row(i, args.items) for i in range(1, args.rows + 1)])
+        expected = json.loads(response_model_path(page, item_model))
+        if json.loads(fast_json_path(page, item_model)) != expected:
+            raise SystemExit(f"{shape}: fast JSON body differs from the response_model body")
+
+        baseline = None
+        for name, path in PATHS.items():
+            per_row, size = _per_row_us(path, page, item_model, args.repeat)
+            baseline = baseline or per_row
+            print(f"{shape:>20} {name:>15}: {per_row:7.2f} us/row  {size:>8} bytes  x{baseline / per_row:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Sale throughput under contention for a few hot products, with and without the stock lock.
+
+Simulated registers submit multi-line sales concurrently, each line for one of --hot
+products picked at random and in random order, through the same transaction as POST
+/sales: services.reservation, services.ledger and the deadlock retry of services.retry.
+
+- locked:   the balance rows are locked in product_id order and checked (SALE_STOCK_CHECK)
+- unlocked: the lines are written without the lock or the check, as before
+
+Each concurrency level reports throughput, latency, transactions rerun after a deadlock or
+lock wait timeout, and sales refused for lack of stock. The hot products are stocked first
+with --stock units each, so refusals only show up once that runs out.
+
+Run from app_api/ against a development database; the sales and the stock in written are
+deleted again at the end:
+
+    python -m benchmarks.stock_contention --hot 5 --sales 400 --concurrency 1,4,16,32
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import select, insert, delete
+
+from config import SALE_STOCK_CHECK
+from database import AsyncSessionLocal, async_engine
+from models import sqlalchemy_models, request_models
+from services import catalog, ledger, reservation, retry, rollup
+from services.retry import retry_stats
+
+
+def _build_sales(product_ids: list, count: int, lines: int, seed: int) -> list:
+    generator = random.Random(seed)
+    sales = []
+    for _ in range(count):
+        chosen = generator.sample(product_ids, min(lines, len(product_ids)))  # random line order
+        sales.append(request_models.SaleCreate(
+            payment_method="Cash",
+            items=[request_models.SaleItemCreate(product_id=product_id, quantity=generator.randint(1, 3)) for product_id in chosen],
+        ))
+    return sales
+
+
+async def _astock(product_ids: list, quantity: int) -> int:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(insert(sqlalchemy_models.StockInDB).values(
+            ref_no="bench-contention", stock_in_date=datetime.now(), total_cost=0
+        ))
+        stock_in_id = result.inserted_primary_key[0]
+        await ledger.ainsert_stock_in_items(db, stock_in_id, [
+            {"product_id": product_id, "quantity": quantity, "unit_cost": 1} for product_id in product_ids
+        ])
+        await db.commit()
+    return stock_in_id
+
+
+async def _acleanup(sale_ids: list, stock_in_id: int):
+    async with AsyncSessionLocal() as db:
+        if sale_ids:
+            keys = await rollup.asale_keys(db, sale_ids)
+            await db.execute(delete(sqlalchemy_models.SaleDB).filter(sqlalchemy_models.SaleDB.sale_id.in_(sale_ids)))
+            await rollup.arefresh(db, keys)
+        await db.execute(delete(sqlalchemy_models.StockInDB).filter(sqlalchemy_models.StockInDB.stock_in_id == stock_in_id))
+        await db.commit()
+
+
+async def _run_level(sales: list, prices: dict, concurrency: int, locked: bool, sale_ids: list) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+    latencies, refused, failed = [], 0, 0
+
+    async def one_sale(sale):
+        nonlocal refused, failed
+        async with gate, AsyncSessionLocal() as db:
+            async def insert_sale():
+                if locked:
+                    await reservation.areserve(db, reservation.sale_demand(sale.items))
+                sale_id, = await ledger.ainsert_sales(db, [sale], prices)
+                await db.commit()
+                return sale_id
+
+            started = time.perf_counter()
+            try:
+                sale_ids.append(await retry.arun_transaction(db, insert_sale))
+            except HTTPException:
+                refused += 1
+            except Exception:
+                failed += 1
+            latencies.append(time.perf_counter() - started)
+
+    before = {(entry["reason"], entry["outcome"]): entry["count"] for entry in retry_stats.snapshot()}
+    started = time.perf_counter()
+    await asyncio.gather(*(one_sale(sale) for sale in sales))
+    elapsed = time.perf_counter() - started
+    after = {(entry["reason"], entry["outcome"]): entry["count"] for entry in retry_stats.snapshot()}
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "throughput": len(sales) / elapsed,
+        "avg_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+        "retried": sum(count - before.get(key, 0) for key, count in after.items() if key[1] == "retried"),
+        "gave_up": sum(count - before.get(key, 0) for key, count in after.items() if key[1] == "gave_up"),
+        "refused": refused,
+        "failed": failed,
+    }
+
+
+async def main_async(args):
+    async with AsyncSessionLocal() as db:
+        product_ids = (await db.scalars(
+            select(sqlalchemy_models.ProductDB.product_id).order_by(sqlalchemy_models.ProductDB.product_id).limit(args.hot)
+        )).all()
+        prices = await catalog.afetch_product_prices(db, product_ids)
+    if len(product_ids) < args.hot:
+        raise SystemExit(f"Need at least {args.hot} products")
+    modes = {"locked": [True], "unlocked": [False], "both": [True, False]}[args.mode]
+    if True in modes and not SALE_STOCK_CHECK:
+        raise SystemExit("SALE_STOCK_CHECK is off: the locked mode would not lock anything")
+
+    stock_in_id = await _astock(product_ids, args.stock)
+    sale_ids = []
+    try:
+        print(f"{args.sales} sales of {args.lines} lines over {args.hot} hot products")
+        print(f"{'mode':>8} {'conc':>5} {'sales/s':>9} {'avg ms':>8} {'p95 ms':>8} {'retried':>8} {'gave up':>8} {'refused':>8} {'failed':>7}")
+        for concurrency in args.concurrency:
+            for locked in modes:
+                sales = _build_sales(product_ids, args.sales, args.lines, args.seed + concurrency)
+                result = await _run_level(sales, prices, concurrency, locked, sale_ids)
+                print(
+                    f"{'locked' if locked else 'unlocked':>8} {concurrency:>5} {result['throughput']:>9.1f} "
+                    f"{result['avg_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['retried']:>8} "
+                    f"{result['gave_up']:>8} {result['refused']:>8} {result['failed']:>7}"
+                )
+    finally:
+        await _acleanup(sale_ids, stock_in_id)
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hot", type=int, default=5, help="Products every sale draws its lines from")
+    parser.add_argument("--lines", type=int, default=3, help="Lines per sale (capped by --hot)")
+    parser.add_argument("--sales", type=int, default=400, help="Sales per concurrency level and mode")
+    parser.add_argument("--stock", type=int, default=1_000_000, help="Units stocked per hot product before the run")
+    parser.add_argument(
+        "--concurrency", type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 2, 4, 8, 16, 32], help="Comma separated numbers of concurrent registers"
+    )
+    parser.add_argument("--mode", choices=["locked", "unlocked", "both"], default="both")
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+Parity check of the set-based sale and stock in write path (services.ledger) against the
+per-row triggers it replaced (retired by mysql/migrations/009_set_based_writes.sql).
+
+The same scenario runs twice on real products, each time in a transaction that is rolled
+back afterwards:
+
+- triggers: the legacy sale_item / stock_in_item triggers are created for the duration of
+  the pass and the lines are written with plain row statements, as the API used to
+- ledger:   the lines are written through services.ledger, as the API does now
+
+The scenario is a backdated stock in (re-freezing the cost of later sales), a sale with
+--lines lines and fractional discounts, then adding, editing (quantity, price, discount,
+product) and deleting lines of both. After each pass the header totals, lines and frozen
+unit costs, movements, stock balances of the products involved and the re-frozen costs of
+their earlier sales are captured; the two captures must be identical.
+
+Run from app_api/ against a development database with 009 applied (the legacy triggers
+exist while the first pass runs, so nothing else should write meanwhile):
+
+    python -m benchmarks.write_parity --lines 200 --seed 7
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, insert, update, delete, text
+
+from database import async_engine, AsyncSessionLocal
+from models import sqlalchemy_models
+from services import ledger
+
+SaleDB = sqlalchemy_models.SaleDB
+SaleItemDB = sqlalchemy_models.SaleItemDB
+StockInDB = sqlalchemy_models.StockInDB
+StockInItemDB = sqlalchemy_models.StockInItemDB
+MovementDB = sqlalchemy_models.InventoryMovementDB
+BalanceDB = sqlalchemy_models.ProductStockBalanceDB
+ProductDB = sqlalchemy_models.ProductDB
+
+# The per-row triggers as they were before 009
+LEGACY_TRIGGERS = {
+    "trg_after_stock_in_item_insert": """
+CREATE TRIGGER trg_after_stock_in_item_insert
+AFTER INSERT ON stock_in_item
+FOR EACH ROW
+BEGIN
+    UPDATE stock_in
+    SET total_cost = total_cost + (NEW.quantity * NEW.unit_cost)
+    WHERE stock_in_id = NEW.stock_in_id;
+
+    INSERT INTO inventory_movement(product_id, movement_type, quantity, unit_cost, stock_in_item_id, movement_date)
+    SELECT NEW.product_id, 'STOCK_IN', NEW.quantity, NEW.unit_cost, NEW.stock_in_item_id, si.stock_in_date
+    FROM stock_in si WHERE si.stock_in_id = NEW.stock_in_id;
+
+    CALL sp_refreeze_sale_costs(NEW.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = NEW.stock_in_id));
+END""",
+    "trg_after_stock_in_item_update": """
+CREATE TRIGGER trg_after_stock_in_item_update
+AFTER UPDATE ON stock_in_item
+FOR EACH ROW
+BEGIN
+    CALL sp_assert_not_archived((SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+
+    UPDATE stock_in
+    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost) + (NEW.quantity * NEW.unit_cost)
+    WHERE stock_in_id = OLD.stock_in_id;
+
+    UPDATE inventory_movement im
+    JOIN stock_in si ON si.stock_in_id = OLD.stock_in_id
+    SET
+        im.quantity = NEW.quantity,
+        im.unit_cost = NEW.unit_cost,
+        im.product_id = NEW.product_id,
+        im.movement_date = si.stock_in_date
+    WHERE im.stock_in_item_id = OLD.stock_in_item_id;
+
+    IF NEW.quantity <> OLD.quantity OR NEW.unit_cost <> OLD.unit_cost OR NEW.product_id <> OLD.product_id THEN
+        CALL sp_refreeze_sale_costs(OLD.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+        IF NEW.product_id <> OLD.product_id THEN
+            CALL sp_refreeze_sale_costs(NEW.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+        END IF;
+    END IF;
+END""",
+    "trg_before_stock_in_item_delete": """
+CREATE TRIGGER trg_before_stock_in_item_delete
+BEFORE DELETE ON stock_in_item
+FOR EACH ROW
+BEGIN
+    CALL sp_assert_not_archived((SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+
+    UPDATE stock_in
+    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost)
+    WHERE stock_in_id = OLD.stock_in_id;
+
+    DELETE FROM inventory_movement WHERE stock_in_item_id = OLD.stock_in_item_id;
+
+    CALL sp_refreeze_sale_costs(OLD.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+END""",
+    "trg_before_sale_item_insert": """
+CREATE TRIGGER trg_before_sale_item_insert
+BEFORE INSERT ON sale_item
+FOR EACH ROW
+BEGIN
+  SET NEW.unit_cost = fn_avg_cost_at(NEW.product_id, (SELECT sale_datetime FROM sale WHERE sale_id = NEW.sale_id));
+END""",
+    "trg_before_sale_item_update": """
+CREATE TRIGGER trg_before_sale_item_update
+BEFORE UPDATE ON sale_item
+FOR EACH ROW
+BEGIN
+  IF NEW.product_id <> OLD.product_id THEN
+    SET NEW.unit_cost = fn_avg_cost_at(NEW.product_id, (SELECT sale_datetime FROM sale WHERE sale_id = NEW.sale_id));
+  END IF;
+END""",
+    "trg_after_sale_item_insert": """
+CREATE TRIGGER trg_after_sale_item_insert
+AFTER INSERT ON sale_item
+FOR EACH ROW
+BEGIN
+  UPDATE sale
+  SET total_amount = total_amount + (NEW.quantity * NEW.unit_price * (1 - NEW.discount))
+  WHERE sale_id = NEW.sale_id;
+
+  INSERT INTO inventory_movement (product_id, movement_type, quantity, sale_price, sale_item_id, movement_date)
+  SELECT NEW.product_id, 'SALE', -NEW.quantity, NEW.unit_price * (1 - NEW.discount), NEW.sale_item_id, s.sale_datetime
+  FROM sale s WHERE s.sale_id = NEW.sale_id;
+END""",
+    "trg_after_sale_item_update": """
+CREATE TRIGGER trg_after_sale_item_update
+AFTER UPDATE ON sale_item
+FOR EACH ROW
+BEGIN
+  IF NEW.quantity <> OLD.quantity
+     OR NEW.unit_price <> OLD.unit_price
+     OR NEW.discount <> OLD.discount
+     OR NEW.product_id <> OLD.product_id THEN
+    UPDATE sale
+    SET total_amount = total_amount - (OLD.quantity * OLD.unit_price * (1 - OLD.discount)) + (NEW.quantity * NEW.unit_price * (1 - NEW.discount))
+    WHERE sale_id = NEW.sale_id;
+
+    UPDATE inventory_movement im
+    SET im.quantity = -NEW.quantity, im.sale_price = NEW.unit_price * (1 - NEW.discount), im.product_id = NEW.product_id
+    WHERE sale_item_id = NEW.sale_item_id;
+  END IF;
+END""",
+    "trg_before_sale_item_delete": """
+CREATE TRIGGER trg_before_sale_item_delete
+BEFORE DELETE ON sale_item
+FOR EACH ROW
+BEGIN
+  UPDATE sale
+  SET total_amount = total_amount - (OLD.quantity * OLD.unit_price * (1 - OLD.discount))
+  WHERE sale_id = OLD.sale_id;
+
+  DELETE FROM inventory_movement WHERE sale_item_id = OLD.sale_item_id;
+END""",
+}
+
+
+def _money(rng: random.Random, low: int, high: int) -> Decimal:
+    return Decimal(rng.randint(low * 100, high * 100)) / 100
+
+
+def build_scenario(product_ids: list, lines: int, seed: int) -> dict:
+    """
+    The writes of one pass, as plain data, so both passes do exactly the same.
+    """
+    rng = random.Random(seed)
+    products = rng.sample(product_ids, len(product_ids))
+    lines = min(lines, len(products) - 2)
+    stock_lines = min(5, lines)
+    now = datetime.now().replace(microsecond=0)
+    return {
+        "stock_in_date": (now - timedelta(days=30)).replace(hour=0, minute=0, second=0),
+        "stock_lines": [
+            {"product_id": pid, "quantity": rng.randint(5, 50), "unit_cost": _money(rng, 100, 30000)}
+            for pid in products[:stock_lines]
+        ],
+        "stock_added": {"product_id": products[-1], "quantity": 7, "unit_cost": _money(rng, 100, 30000)},
+        "stock_update": {"quantity": 60, "unit_cost": _money(rng, 100, 30000)},
+        "sale_datetime": now,
+        "sale_lines": [
+            {
+                "product_id": pid, "quantity": rng.randint(1, 5), "unit_price": _money(rng, 100, 50000),
+                "discount": rng.choice((Decimal("0"), Decimal("0.05"), Decimal("0.13"), Decimal("0.33")))
+            }
+            for pid in products[:lines]
+        ],
+        "sale_added": {"product_id": products[lines], "quantity": 3, "unit_price": _money(rng, 100, 50000), "discount": Decimal("0.07")},
+        "sale_update": {"quantity": 9, "unit_price": _money(rng, 100, 50000), "discount": Decimal("0.17")},
+        "sale_move": {"product_id": products[lines + 1]},
+    }
+
+
+class TriggerPass:
+    """
+    Row statements, with the legacy triggers doing the rest.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def insert_stock_in_items(self, stock_in_id, rows):
+        await self.db.execute(insert(StockInItemDB), [{**row, "stock_in_id": stock_in_id} for row in rows])
+
+    async def insert_stock_in_item(self, stock_in_id, row):
+        result = await self.db.execute(insert(StockInItemDB).values(**row, stock_in_id=stock_in_id))
+        return result.inserted_primary_key[0]
+
+    async def update_stock_in_item(self, item, values):
+        await self.db.execute(update(StockInItemDB).filter(StockInItemDB.stock_in_item_id == item.stock_in_item_id).values(**values))
+
+    async def delete_stock_in_item(self, item):
+        await self.db.execute(delete(StockInItemDB).filter(StockInItemDB.stock_in_item_id == item.stock_in_item_id))
+
+    async def insert_sale_items(self, rows):
+        await self.db.execute(insert(SaleItemDB), rows)
+
+    async def insert_sale_item(self, row):
+        return (await self.db.execute(insert(SaleItemDB).values(**row))).inserted_primary_key[0]
+
+    async def update_sale_item(self, item, values):
+        await self.db.execute(update(SaleItemDB).filter(SaleItemDB.sale_item_id == item.sale_item_id).values(**values))
+
+    async def delete_sale_item(self, item):
+        await self.db.execute(delete(SaleItemDB).filter(SaleItemDB.sale_item_id == item.sale_item_id))
+
+
+class LedgerPass:
+    """
+    services.ledger, as the routers call it.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def insert_stock_in_items(self, stock_in_id, rows):
+        await ledger.ainsert_stock_in_items(self.db, stock_in_id, rows)
+
+    async def insert_stock_in_item(self, stock_in_id, row):
+        return await ledger.ainsert_stock_in_item(self.db, stock_in_id, row)
+
+    async def update_stock_in_item(self, item, values):
+        await ledger.aupdate_stock_in_item(self.db, item, values)
+
+    async def delete_stock_in_item(self, item):
+        await ledger.adelete_stock_in_item(self.db, item)
+
+    async def insert_sale_items(self, rows):
+        await ledger.ainsert_sale_items(self.db, rows)
+
+    async def insert_sale_item(self, row):
+        return await ledger.ainsert_sale_item(self.db, row)
+
+    async def update_sale_item(self, item, values):
+        await ledger.aupdate_sale_item(self.db, item, values)
+
+    async def delete_sale_item(self, item):
+        await ledger.adelete_sale_item(self.db, item)
+
+
+async def _line(db, model, line_id):
+    return await db.get(model, line_id, populate_existing=True)
+
+
+async def _line_ids(db, column, parent_column, parent_id) -> list:
+    return (await db.scalars(select(column).filter(parent_column == parent_id).order_by(column))).all()
+
+
+async def run_scenario(db, path, scenario: dict) -> dict:
+    """
+    Apply the scenario through `path` (a TriggerPass or LedgerPass) and capture the result.
+    """
+    result = await db.execute(insert(StockInDB).values(
+        ref_no="PARITY", stock_in_date=scenario["stock_in_date"], total_cost=0
+    ))
+    stock_in_id = result.inserted_primary_key[0]
+    await path.insert_stock_in_items(stock_in_id, scenario["stock_lines"])
+    await path.insert_stock_in_item(stock_in_id, scenario["stock_added"])
+    stock_item_ids = await _line_ids(db, StockInItemDB.stock_in_item_id, StockInItemDB.stock_in_id, stock_in_id)
+    await path.update_stock_in_item(await _line(db, StockInItemDB, stock_item_ids[0]), scenario["stock_update"])
+    if len(stock_item_ids) > 2:
+        await path.delete_stock_in_item(await _line(db, StockInItemDB, stock_item_ids[1]))
+
+    result = await db.execute(insert(SaleDB).values(
+        sale_datetime=scenario["sale_datetime"], total_amount=0, payment_method="Cash", notes="PARITY"
+    ))
+    sale_id = result.inserted_primary_key[0]
+    await path.insert_sale_items([{**row, "sale_id": sale_id} for row in scenario["sale_lines"]])
+    await path.insert_sale_item({**scenario["sale_added"], "sale_id": sale_id})
+    sale_item_ids = await _line_ids(db, SaleItemDB.sale_item_id, SaleItemDB.sale_id, sale_id)
+    await path.update_sale_item(await _line(db, SaleItemDB, sale_item_ids[0]), scenario["sale_update"])
+    if len(sale_item_ids) > 3:
+        await path.update_sale_item(await _line(db, SaleItemDB, sale_item_ids[1]), scenario["sale_move"])
+        await path.delete_sale_item(await _line(db, SaleItemDB, sale_item_ids[2]))
+
+    return await capture(db, stock_in_id, sale_id)
+
+
+async def capture(db, stock_in_id: int, sale_id: int) -> dict:
+    """
+    Everything the write path maintains for one stock in and one sale, keyed by product
+    rather than by the generated IDs, which differ between passes.
+    """
+    stock_lines = (await db.execute(
+        select(StockInItemDB.product_id, StockInItemDB.quantity, StockInItemDB.unit_cost)
+        .filter(StockInItemDB.stock_in_id == stock_in_id)
+    )).all()
+    sale_lines = (await db.execute(
+        select(SaleItemDB.product_id, SaleItemDB.quantity, SaleItemDB.unit_price, SaleItemDB.discount, SaleItemDB.unit_cost)
+        .filter(SaleItemDB.sale_id == sale_id)
+    )).all()
+    product_ids = {row.product_id for row in stock_lines} | {row.product_id for row in sale_lines}
+
+    movement_columns = (
+        MovementDB.movement_type, MovementDB.product_id, MovementDB.quantity,
+        MovementDB.unit_cost, MovementDB.sale_price, MovementDB.movement_date
+    )
+    movements = (await db.execute(
+        select(*movement_columns).join(StockInItemDB, StockInItemDB.stock_in_item_id == MovementDB.stock_in_item_id)
+        .filter(StockInItemDB.stock_in_id == stock_in_id)
+        .union_all(
+            select(*movement_columns).join(SaleItemDB, SaleItemDB.sale_item_id == MovementDB.sale_item_id)
+            .filter(SaleItemDB.sale_id == sale_id)
+        )
+    )).all()
+    balances = (await db.execute(
+        select(BalanceDB.__table__).filter(BalanceDB.product_id.in_(product_ids))
+    )).all()
+    earlier_costs = (await db.execute(
+        select(SaleItemDB.sale_item_id, SaleItemDB.unit_cost)
+        .filter(SaleItemDB.product_id.in_(product_ids), SaleItemDB.sale_id != sale_id)
+    )).all()
+
+    return {
+        "stock in total": await db.scalar(select(StockInDB.total_cost).filter(StockInDB.stock_in_id == stock_in_id)),
+        "stock in lines": sorted(tuple(row) for row in stock_lines),
+        "sale total": await db.scalar(select(SaleDB.total_amount).filter(SaleDB.sale_id == sale_id)),
+        "sale lines": sorted(tuple(row) for row in sale_lines),
+        "movements": sorted(tuple(row) for row in movements),
+        "balances": sorted(tuple(row) for row in balances),
+        "earlier sale costs": sorted(tuple(row) for row in earlier_costs),
+    }
+
+
+async def _existing_triggers() -> set:
+    async with async_engine.connect() as connection:
+        return set((await connection.execute(text(
+            "SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = DATABASE()"
+        ))).scalars())
+
+
+async def _timed_pass(make_path, scenario: dict) -> tuple:
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        try:
+            result = await run_scenario(db, make_path(db), scenario)
+            return result, time.perf_counter() - started
+        finally:
+            await db.rollback()
+
+
+async def main_async(args):
+    legacy = set(LEGACY_TRIGGERS)
+    if legacy & await _existing_triggers():
+        raise SystemExit("The per-row triggers are still installed: apply mysql/migrations/009_set_based_writes.sql first")
+
+    async with AsyncSessionLocal() as db:
+        product_ids = (await db.scalars(select(ProductDB.product_id))).all()
+    if len(product_ids) < 4:
+        raise SystemExit("Need at least 4 products")
+    scenario = build_scenario(product_ids, args.lines, args.seed)
+
+    async with async_engine.begin() as connection:
+        for statement in LEGACY_TRIGGERS.values():
+            await connection.exec_driver_sql(statement)
+    try:
+        expected, trigger_seconds = await _timed_pass(TriggerPass, scenario)
+    finally:
+        async with async_engine.begin() as connection:
+            for name in LEGACY_TRIGGERS:
+                await connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS `{name}`")
+    actual, ledger_seconds = await _timed_pass(LedgerPass, scenario)
+    await async_engine.dispose()
+
+    print(f"{len(scenario['sale_lines'])} sale lines, {len(scenario['stock_lines'])} stock in lines")
+    print(f"triggers: {trigger_seconds * 1000:8.1f} ms")
+    print(f"ledger:   {ledger_seconds * 1000:8.1f} ms")
+    differences = [name for name in expected if expected[name] != actual[name]]
+    for name in differences:
+        print(f"DIFFERENT {name}:")
+        print(f"  triggers: {expected[name]}")
+        print(f"  ledger:   {actual[name]}")
+    if differences:
+        raise SystemExit(1)
+    print("identical: " + ", ".join(expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200, help="Lines of the sale (capped by the number of products)")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for products, quantities and prices")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,3 +7,80 @@ DB_NAME = os.getenv("DB_NAME", "myapp")
 DB_PORT = os.getenv("DB_PORT", "3306")
 
 DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Optional read replica for GET list and report traffic. Leave REPLICA_DB_HOST empty to
+# send every read to the primary. User and password default to the primary's.
+REPLICA_DB_HOST = os.getenv("REPLICA_DB_HOST", "")
+REPLICA_DB_PORT = os.getenv("REPLICA_DB_PORT", "3306")
+REPLICA_DB_USER = os.getenv("REPLICA_DB_USER", DB_USER)
+REPLICA_DB_PASSWORD = os.getenv("REPLICA_DB_PASSWORD", DB_PASSWORD)
+REPLICA_DATABASE_URL = ASYNC_REPLICA_DATABASE_URL = None
+if REPLICA_DB_HOST:
+    REPLICA_DATABASE_URL = f"mysql+pymysql://{REPLICA_DB_USER}:{REPLICA_DB_PASSWORD}@{REPLICA_DB_HOST}:{REPLICA_DB_PORT}/{DB_NAME}"
+    ASYNC_REPLICA_DATABASE_URL = f"mysql+aiomysql://{REPLICA_DB_USER}:{REPLICA_DB_PASSWORD}@{REPLICA_DB_HOST}:{REPLICA_DB_PORT}/{DB_NAME}"
+# Reads fall back to the primary while the replica is more than REPLICA_MAX_LAG seconds
+# behind (Seconds_Behind_Source), or its lag has not been checked for three intervals
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+
+# Connection pool, shared by the sync and async engines (each engine gets its own pool).
+# Keep DB_POOL_RECYCLE below MySQL's wait_timeout so idle connections are replaced
+# before the server drops them.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# In-process cache for the report summary endpoints
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "60"))
+
+# In-process product catalog (id and SKU lookups for sales, stock in and POS scans); the TTL
+# bounds how stale a product can get from writes made by other worker processes
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "50000"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+# Cached COUNT(*) results behind include_total=estimated; the TTL is the staleness bound
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "1024"))
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+
+# Stock snapshots for /reports/product-stock?as_of=...: period length (day, week or month)
+# and how often the API checks for finished periods to snapshot (seconds, 0 disables)
+STOCK_SNAPSHOT_PERIOD = os.getenv("STOCK_SNAPSHOT_PERIOD", "month")
+STOCK_SNAPSHOT_INTERVAL = float(os.getenv("STOCK_SNAPSHOT_INTERVAL", "3600"))
+
+# Rows moved per transaction by `python manage.py archive`; smaller batches hold locks for less time
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+# Low-stock alert stream (GET /alerts/low-stock/stream). Each worker reads new stock_alert_event
+# rows right after its own writes commit, and every STOCK_ALERT_POLL_INTERVAL seconds for writes
+# made by other processes. The last STOCK_ALERT_BUFFER_SIZE events are kept in memory for
+# reconnecting clients; older resume points are read back from the table.
+STOCK_ALERT_POLL_INTERVAL = float(os.getenv("STOCK_ALERT_POLL_INTERVAL", "2"))
+STOCK_ALERT_BUFFER_SIZE = int(os.getenv("STOCK_ALERT_BUFFER_SIZE", "1000"))
+# How long a hole in the seq order (a transaction still open, or rolled back) holds delivery back
+STOCK_ALERT_GAP_TIMEOUT = float(os.getenv("STOCK_ALERT_GAP_TIMEOUT", "5"))
+# How long a hole passed over is still watched for its event to commit; well above the
+# longest transaction a write can hold (innodb_lock_wait_timeout is 50 s, plus deadlock retries)
+STOCK_ALERT_LATE_WINDOW = float(os.getenv("STOCK_ALERT_LATE_WINDOW", "300"))
+
+# Write-ahead queue for POST /sales/ with `Prefer: respond-async`: the sale is appended to a
+# local log (fsynced in groups every SALE_QUEUE_FSYNC_INTERVAL seconds) and answered with
+# 202 and a provisional id, and a worker drains the log into MySQL in batches. Leave
+# SALE_QUEUE_DIR empty to disable it. The directory must be on durable local storage and
+# belongs to one API process; other processes answer those requests synchronously.
+SALE_QUEUE_DIR = os.getenv("SALE_QUEUE_DIR", "")
+SALE_QUEUE_FSYNC_INTERVAL = float(os.getenv("SALE_QUEUE_FSYNC_INTERVAL", "0.005"))
+SALE_QUEUE_BATCH_SIZE = int(os.getenv("SALE_QUEUE_BATCH_SIZE", "200"))
+SALE_QUEUE_SEGMENT_BYTES = int(os.getenv("SALE_QUEUE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Wait before retrying a batch after a database error
+SALE_QUEUE_RETRY_INTERVAL = float(os.getenv("SALE_QUEUE_RETRY_INTERVAL", "2"))
+
+# Reject sales (409) whose lines ask for more than the products' stock on hand. The balance
+# rows are locked in product_id order for the check, see services/reservation.py.
+SALE_STOCK_CHECK = os.getenv("SALE_STOCK_CHECK", "true").lower() in ("1", "true", "yes")
+# Transactions rerun after a deadlock or lock wait timeout, with jittered exponential backoff
+TX_RETRY_ATTEMPTS = int(os.getenv("TX_RETRY_ATTEMPTS", "5"))
+TX_RETRY_BASE_DELAY = float(os.getenv("TX_RETRY_BASE_DELAY", "0.02"))
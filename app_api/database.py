@@ -1,15 +1,81 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from config import DATABASE_URL
-from typing import Annotated
-from fastapi import Depends
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from config import (
+    DATABASE_URL, ASYNC_DATABASE_URL, REPLICA_DATABASE_URL, ASYNC_REPLICA_DATABASE_URL,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+)
+from services import pool_stats, request_metrics, replica
+from services.replica import CONSISTENCY_TOKEN_HEADER
+from typing import Annotated, Optional
+from fastapi import Depends, Header
+
+pool_options = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
 
 # Create database engine
-engine = create_engine(DATABASE_URL)
+sync_pool_stats = pool_stats.register("sync")
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=pool_stats.instrumented_pool_class(QueuePool, sync_pool_stats),
+    **pool_options
+)
+sync_pool_stats.attach(engine)
+request_metrics.attach(engine)
+
+# Create async database engine (aiomysql), used by the async routers
+async_pool_stats = pool_stats.register("async")
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=pool_stats.instrumented_pool_class(AsyncAdaptedQueuePool, async_pool_stats),
+    **pool_options
+)
+async_pool_stats.attach(async_engine.sync_engine)
+request_metrics.attach(async_engine.sync_engine)
+
+# Read replica engines (optional, see REPLICA_DB_HOST). Only reads are routed here.
+replica_engine = async_replica_engine = None
+if REPLICA_DATABASE_URL:
+    replica_pool_stats = pool_stats.register("sync_replica")
+    replica_engine = create_engine(
+        REPLICA_DATABASE_URL,
+        poolclass=pool_stats.instrumented_pool_class(QueuePool, replica_pool_stats),
+        **pool_options
+    )
+    replica_pool_stats.attach(replica_engine)
+    request_metrics.attach(replica_engine)
+
+    async_replica_pool_stats = pool_stats.register("async_replica")
+    async_replica_engine = create_async_engine(
+        ASYNC_REPLICA_DATABASE_URL,
+        poolclass=pool_stats.instrumented_pool_class(AsyncAdaptedQueuePool, async_replica_pool_stats),
+        **pool_options
+    )
+    async_replica_pool_stats.attach(async_replica_engine.sync_engine)
+    request_metrics.attach(async_replica_engine.sync_engine)
 
 # Create session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Replica sessions are marked in session.info so the report cache can tell their reads apart
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine, info={"replica": True})
+    if replica_engine else None
+)
+
+# Create async session. Objects stay loaded after commit: an expired attribute
+# would need implicit IO, which an AsyncSession cannot do on attribute access.
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+AsyncReplicaSessionLocal = (
+    async_sessionmaker(bind=async_replica_engine, autoflush=False, expire_on_commit=False, info={"replica": True})
+    if async_replica_engine else None
+)
 
 # Base class for models
 Base = declarative_base()
@@ -22,4 +88,83 @@ def get_db():
     finally:
         db.close()
 
-db_dependency = Annotated[Session, Depends(get_db)]
\ No newline at end of file
+# Function to get async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Read routing. GET list and report endpoints read from the replica while it is within
+# REPLICA_MAX_LAG of the primary, and from the primary otherwise (or without a replica).
+
+def _replica_reason() -> Optional[str]:
+    """
+    Why reads cannot use the replica right now, or None when they can.
+    """
+    if ReplicaSessionLocal is None:
+        return "no_replica"
+    if not replica.monitor.usable():
+        return "lagging"
+    return None
+
+def get_read_db():
+    reason = _replica_reason()
+    replica.monitor.count("primary" if reason else "replica", reason or "ok")
+    db = (SessionLocal if reason else ReplicaSessionLocal)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    reason = _replica_reason()
+    replica.monitor.count("primary" if reason else "replica", reason or "ok")
+    async with (AsyncSessionLocal if reason else AsyncReplicaSessionLocal)() as db:
+        yield db
+
+# Read-your-writes: like the read sessions, but a request carrying the X-Consistency-Token
+# of an earlier write only reads the replica once the replica has applied that write.
+
+ConsistencyToken = Annotated[Optional[str], Header(
+    alias=CONSISTENCY_TOKEN_HEADER,
+    description="Token returned by a write; the read then sees that write"
+)]
+
+def get_consistent_read_db(token: ConsistencyToken = None):
+    reason = _replica_reason()
+    if reason is None:
+        db = ReplicaSessionLocal()
+        if not token or replica.has_applied(db, token):
+            replica.monitor.count("replica", "ok")
+            try:
+                yield db
+            finally:
+                db.close()
+            return
+        db.close()
+        reason = "token_not_applied"
+    replica.monitor.count("primary", reason)
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_consistent_read_db(token: ConsistencyToken = None):
+    reason = _replica_reason()
+    if reason is None:
+        async with AsyncReplicaSessionLocal() as db:
+            if not token or await replica.ahas_applied(db, token):
+                replica.monitor.count("replica", "ok")
+                yield db
+                return
+        reason = "token_not_applied"
+    replica.monitor.count("primary", reason)
+    async with AsyncSessionLocal() as db:
+        yield db
+
+db_dependency = Annotated[Session, Depends(get_db)]
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
+async_read_db_dependency = Annotated[AsyncSession, Depends(get_async_read_db)]
+consistent_read_db_dependency = Annotated[Session, Depends(get_consistent_read_db)]
+async_consistent_read_db_dependency = Annotated[AsyncSession, Depends(get_async_consistent_read_db)]
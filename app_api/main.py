@@ -1,9 +1,43 @@
-from fastapi import FastAPI
-from database import Base, engine
-from routers import categories, products, stocks, sales, inventories, report
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
+from database import Base, engine, async_engine, async_replica_engine
+from config import STOCK_SNAPSHOT_PERIOD, STOCK_SNAPSHOT_INTERVAL, SALE_QUEUE_DIR
+from services import snapshots, archive, stock_alerts, replica, sale_queue
+from services.request_metrics import RequestMetricsMiddleware
+from routers import categories, products, stocks, sales, inventories, report, monitoring, alerts
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Periodic stock snapshots for /reports/product-stock?as_of=; STOCK_SNAPSHOT_INTERVAL=0 disables them
+    task = None
+    if STOCK_SNAPSHOT_INTERVAL > 0:
+        task = asyncio.create_task(snapshots.run_periodically(STOCK_SNAPSHOT_PERIOD, STOCK_SNAPSHOT_INTERVAL))
+    # Feeds GET /alerts/low-stock/stream
+    alert_task = asyncio.create_task(stock_alerts.hub.run())
+    # Replica lag checks; reads stay on the primary until the first check succeeds
+    lag_task = None
+    if async_replica_engine is not None:
+        lag_task = asyncio.create_task(replica.monitor.run(async_replica_engine))
+    # Write-ahead queue for POST /sales/ with Prefer: respond-async; replays what a
+    # previous run left undrained
+    queue_task = None
+    if SALE_QUEUE_DIR and sale_queue.queue.open():
+        queue_task = asyncio.create_task(sale_queue.queue.run())
+    yield
+    if queue_task is not None:
+        queue_task.cancel()
+        await sale_queue.queue.stop()
+    alert_task.cancel()
+    if lag_task is not None:
+        lag_task.cancel()
+    if task is not None:
+        task.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(categories.router)
 app.include_router(products.router)
@@ -11,6 +45,9 @@ app.include_router(stocks.router)
 app.include_router(sales.router)
 app.include_router(inventories.router)
 app.include_router(report.router)
+app.include_router(alerts.router)
+app.include_router(monitoring.router)
+app.include_router(monitoring.metrics_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,8 +55,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[replica.CONSISTENCY_TOKEN_HEADER],
 )
 
+# Per route latency and SQL counts for /metrics; added last so it wraps the CORS middleware too
+app.add_middleware(RequestMetricsMiddleware)
+
+# Read-your-writes tokens on write responses, only needed when reads can go to a replica
+if async_replica_engine is not None:
+    app.add_middleware(replica.ConsistencyTokenMiddleware, engine=async_engine)
+
+@app.exception_handler(DBAPIError)
+async def archived_period_handler(request: Request, exc: DBAPIError):
+    # sp_assert_not_archived: the write is dated inside the archived (read-only) period
+    if archive.is_archived_period_error(exc):
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"detail": "ไม่สามารถแก้ไขข้อมูลในช่วงเวลาที่ถูกเก็บถาวรแล้ว"}
+        )
+    raise exc
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Inventory and Sales API"}
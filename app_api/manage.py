@@ -0,0 +1,76 @@
+"""
+Maintenance commands, run from app_api/:
+
+    python manage.py snapshot-stock [--period month] [--until 2024-01-01]
+    python manage.py archive (--before 2024-01-01 | --keep-months 12) [--batch-size 500]
+    python manage.py prune-alerts [--keep-days 30]
+    python manage.py prune-sale-receipts [--keep-days 30]
+"""
+import argparse
+from datetime import date, datetime
+
+from config import STOCK_SNAPSHOT_PERIOD, ARCHIVE_BATCH_SIZE
+from services import snapshots, archive, stock_alerts, sale_queue
+
+
+def snapshot_stock(args):
+    until = datetime.fromisoformat(args.until) if args.until else None
+    built = snapshots.ensure_snapshots(args.period, until)
+    if built:
+        for end in built:
+            print(f"snapshot written for {end}")
+    else:
+        print("nothing to do (all finished periods are up to date, or another worker holds the lock)")
+
+
+def archive_old_rows(args):
+    if args.before:
+        before = date.fromisoformat(args.before)
+    else:
+        today = date.today()
+        months = today.year * 12 + today.month - 1 - args.keep_months
+        before = date(months // 12, months % 12 + 1, 1)
+    moved = archive.archive_before(before, args.batch_size)
+    print(f"archived {moved['sales']} sales and {moved['movements']} other movements dated before {before:%Y-%m}-01")
+
+
+def prune_alerts(args):
+    deleted = stock_alerts.prune(args.keep_days)
+    print(f"deleted {deleted} low-stock alert events older than {args.keep_days} days")
+
+
+def prune_sale_receipts(args):
+    deleted = sale_queue.prune(args.keep_days)
+    print(f"deleted {deleted} sale queue receipts older than {args.keep_days} days")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = commands.add_parser("snapshot-stock", help="Write stock snapshots for every finished period that lacks one")
+    snapshot.add_argument("--period", choices=snapshots.PERIODS, default=STOCK_SNAPSHOT_PERIOD)
+    snapshot.add_argument("--until", help="Only periods finished before this date/datetime (default: now)")
+    snapshot.set_defaults(handler=snapshot_stock)
+
+    archiving = commands.add_parser("archive", help="Move whole months of sales and movements into the archive tables")
+    window = archiving.add_mutually_exclusive_group(required=True)
+    window.add_argument("--before", help="Archive every month before the one containing this date (YYYY-MM-DD)")
+    window.add_argument("--keep-months", type=int, help="Keep this many months before the current one in the hot tables")
+    archiving.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Sales or movements moved per transaction")
+    archiving.set_defaults(handler=archive_old_rows)
+
+    pruning = commands.add_parser("prune-alerts", help="Delete old low-stock alert events")
+    pruning.add_argument("--keep-days", type=int, default=30, help="Keep events from this many days back")
+    pruning.set_defaults(handler=prune_alerts)
+
+    receipts = commands.add_parser("prune-sale-receipts", help="Delete old receipts of queued sale submissions")
+    receipts.add_argument("--keep-days", type=int, default=30, help="Keep receipts from this many days back")
+    receipts.set_defaults(handler=prune_sale_receipts)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
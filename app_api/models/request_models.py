@@ -69,6 +69,9 @@ class InventoryMovementUpdate(BaseModel):
 class PaginationParams(BaseModel):
     page: int = Field(default=1, ge=1, description="Page number (starts from 1)")
     limit: int = Field(default=10, ge=1, le=100, description="Items per page (max 100)")
+    cursor: Optional[str] = Field(default=None, description="Keyset cursor from next_cursor. Send an empty value to start keyset paging; page is ignored in this mode")
+    include_total: str = Field(default="true", pattern="^(true|false|estimated)$", description="Page mode only: 'true' counts exactly, 'false' skips the count, 'estimated' may reuse a count up to COUNT_CACHE_TTL seconds old")
+    fields: Optional[str] = Field(default=None, description="Comma-separated fields to return per item, e.g. product_id,name,price; all fields when omitted")
     
 class ProductSearchParams(PaginationParams):
     search: Optional[str] = Field(default=None, description="Search in product name or SKU")
@@ -81,11 +84,13 @@ class SaleSearchParams(PaginationParams):
     payment_method: Optional[str] = Field(default=None, description="Filter by payment method")
     start_date: Optional[str] = Field(default=None, description="Start date (YYYY-MM-DD)")
     end_date: Optional[str] = Field(default=None, description="End date (YYYY-MM-DD)")
+    include_items: bool = Field(default=True, description="Load sale items; false returns headers only")
 
 class StockInSearchParams(PaginationParams):
     search: Optional[str] = Field(default=None, description="Search in ref no. or notes")
     start_date: Optional[str] = Field(default=None, description="Start date (YYYY-MM-DD)")
     end_date: Optional[str] = Field(default=None, description="End date (YYYY-MM-DD)")
+    include_items: bool = Field(default=True, description="Load stock in items; false returns headers only")
 
 class InventoryMovementSearchParams(PaginationParams):
     product_id: Optional[int] = Field(None, description="Filter by product ID")
@@ -94,11 +99,12 @@ class InventoryMovementSearchParams(PaginationParams):
     end_date: Optional[str] = Field(None, description="End date (YYYY-MM-DD)")
 
 class ProductStockSearchParams(PaginationParams):
-    search: Optional[str] = Field(default=None, description="Search in product name")
+    search: Optional[str] = Field(default=None, description="Search in product name or SKU")
     productFilter: Optional[str] = Field(default=None, description="Filter products 1. All product (Leave Blank) 2. Needs Restock products ('r') 3. Does not need restock ('nr')")
+    as_of: Optional[str] = Field(default=None, description="Stock as of a past moment: YYYY-MM-DD (end of that day) or an ISO datetime. Leave blank for current stock")
 
 class ProfitabilityReportSearchParams(PaginationParams):
-    search: Optional[str] = Field(default=None, description="Search in product name")
+    search: Optional[str] = Field(default=None, description="Search in product name or SKU")
     product_id: Optional[int] = Field(default=None, description="Filter by specific product ID")
     start_date: Optional[str] = Field(default=None, description="Start date (YYYY-MM-DD)")
     end_date: Optional[str] = Field(default=None, description="End date (YYYY-MM-DD)")
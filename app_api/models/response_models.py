@@ -109,12 +109,14 @@ T = TypeVar('T')
 
 class PaginatedResponse(BaseModel, Generic[T]):
     items: List[T]
-    total: int
-    page: int
+    total: Optional[int] = None        # Not computed in cursor mode or with include_total=false
+    total_estimated: bool = False      # True when total came from the count cache
+    page: Optional[int] = None         # Not used in cursor mode
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None  # Not computed in cursor mode
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None  # Only in cursor mode, pass back as `cursor`
 
 class MostProfitableProduct(BaseModel):
     name: str = Field(description="Product name")
@@ -132,4 +134,20 @@ class ProfitabilitySummary(BaseModel):
     total_cogs: float = Field(ge=0)
     total_gross_profit: float = Field(ge=0)
     average_profit_margin: float = Field(ge=0, le=100)
-    top_profitable_products: Optional[List[MostProfitableProduct]] = None
\ No newline at end of file
+    top_profitable_products: Optional[List[MostProfitableProduct]] = None
+
+class BulkSaleResult(BaseModel):
+    line: int = Field(description="1-based line number in the uploaded NDJSON body")
+    sale_id: Optional[int] = None     # Set when the sale was created
+    error: Optional[str] = None       # Set when the record was rejected
+
+class QueuedSaleStatus(BaseModel):
+    provisional_id: str
+    status: str = Field(description="queued, created or rejected")
+    sale_id: Optional[int] = None     # Set once the sale was created
+    error: Optional[str] = None       # Set when the submission was rejected
+
+class BulkSaleResponse(BaseModel):
+    created: int = Field(ge=0)
+    failed: int = Field(ge=0)
+    results: List[BulkSaleResult]
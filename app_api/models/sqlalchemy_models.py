@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, DateTime, Enum, ForeignKey, Index
+from sqlalchemy import Column, Integer, BigInteger, String, DECIMAL, DateTime, Date, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -54,6 +54,7 @@ class SaleItemDB(Base):
     quantity = Column(Integer, nullable=False)
     unit_price = Column(DECIMAL(10, 2), nullable=False)
     discount = Column(DECIMAL(10, 2), nullable=False, default=0)
+    unit_cost = Column(DECIMAL(14, 4), nullable=True)  # Frozen at the sale date by services.ledger
     
     # Relationships
     sale = relationship("SaleDB", back_populates="items")
@@ -105,6 +106,109 @@ class InventoryMovementDB(Base):
     # Relationships
     product = relationship("ProductDB", back_populates="inventory_movements")
 
+class ProductStockBalanceDB(Base):
+    __tablename__ = "product_stock_balance"
+    
+    # Maintained by the inventory_movement triggers, never written by the API
+    product_id = Column(Integer, ForeignKey("product.product_id"), primary_key=True)
+    stock_on_hand = Column(Integer, nullable=False, default=0)
+    needs_restock = Column(Integer, nullable=False, default=1)  # 0 or 1
+    last_movement_at = Column(DateTime, nullable=True)
+    cost_quantity = Column(Integer, nullable=False, default=0)
+    cost_value = Column(DECIMAL(18, 4), nullable=False, default=0)
+    last_cost_at = Column(DateTime, nullable=True)
+    last_sale_at = Column(DateTime, nullable=True)
+
+class StockSnapshotPeriodDB(Base):
+    __tablename__ = "stock_snapshot_period"
+    
+    # Deleted by sp_apply_movement when a movement is written at or before period_end
+    period_end = Column(DateTime, primary_key=True)
+    taken_at = Column(DateTime, nullable=False, default=func.current_timestamp())
+
+class StockSnapshotDB(Base):
+    __tablename__ = "stock_snapshot"
+    
+    period_end = Column(DateTime, ForeignKey("stock_snapshot_period.period_end"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("product.product_id"), primary_key=True)
+    stock_on_hand = Column(Integer, nullable=False)
+    last_movement_at = Column(DateTime, nullable=True)
+
+class SalesDailyRollupDB(Base):
+    __tablename__ = "sales_daily_rollup"
+    
+    # Maintained by services.rollup on every sale and stock-in write
+    sale_date = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("product.product_id"), primary_key=True)
+    payment_method = Column(Enum('Cash', 'Card', 'QR'), primary_key=True)
+    line_count = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    revenue = Column(DECIMAL(18, 4), nullable=False)
+    cogs = Column(DECIMAL(18, 4), nullable=True)
+    gross_profit = Column(DECIMAL(18, 4), nullable=True)
+
+class ArchiveStateDB(Base):
+    __tablename__ = "archive_state"
+    
+    # Single row (id = 1), advanced by services.archive
+    id = Column(Integer, primary_key=True)
+    archived_before = Column(DateTime, nullable=False)
+
+class SaleArchiveDB(Base):
+    __tablename__ = "sale_archive"
+    
+    # Partitioned by month on sale_datetime, no foreign keys
+    sale_id = Column(Integer, primary_key=True)
+    sale_datetime = Column(DateTime, primary_key=True)
+    total_amount = Column(DECIMAL(10, 2), nullable=False)
+    payment_method = Column(Enum('Cash', 'Card', 'QR'), nullable=False)
+    notes = Column(String(255), nullable=True)
+
+class SaleItemArchiveDB(Base):
+    __tablename__ = "sale_item_archive"
+    
+    sale_item_id = Column(Integer, primary_key=True)
+    sale_id = Column(Integer, nullable=False)
+    sale_datetime = Column(DateTime, primary_key=True)  # Copied from the sale, for partitioning
+    product_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(DECIMAL(10, 2), nullable=False)
+    discount = Column(DECIMAL(10, 2), nullable=False, default=0)
+    unit_cost = Column(DECIMAL(14, 4), nullable=True)
+
+class InventoryMovementArchiveDB(Base):
+    __tablename__ = "inventory_movement_archive"
+    
+    movement_id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    movement_type = Column(Enum('OPENING', 'STOCK_IN', 'SALE'), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_cost = Column(DECIMAL(10, 2), nullable=True)
+    sale_price = Column(DECIMAL(10, 2), nullable=True)
+    sale_item_id = Column(Integer, nullable=True)
+    stock_in_item_id = Column(Integer, nullable=True)
+    movement_date = Column(DateTime, primary_key=True)
+
+class StockAlertEventDB(Base):
+    __tablename__ = "stock_alert_event"
+    
+    # Written by the product_stock_balance triggers whenever needs_restock flips
+    seq = Column(BigInteger, primary_key=True, autoincrement=True)
+    product_id = Column(Integer, nullable=False)
+    needs_restock = Column(Integer, nullable=False)  # 1: at or below reorder_level, 0: recovered above it
+    stock_on_hand = Column(Integer, nullable=False)
+    reorder_level = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.current_timestamp())
+
+class SaleQueueReceiptDB(Base):
+    __tablename__ = "sale_queue_receipt"
+    
+    # Written by services.sale_queue in the same transaction as the sale it records
+    provisional_id = Column(String(32), primary_key=True)
+    sale_id = Column(Integer, nullable=True)  # NULL when the submission was rejected
+    error = Column(String(255), nullable=True)
+    queued_at = Column(DateTime, nullable=False)
+    processed_at = Column(DateTime, nullable=False, default=func.current_timestamp())
 
 class ProductStockView(Base):
     __tablename__ = "v_product_stock"
@@ -115,6 +219,7 @@ class ProductStockView(Base):
     reorder_level = Column(Integer)
     stock_on_hand = Column(Integer)
     needs_restock = Column(Integer)  # 0 or 1
+    last_movement_at = Column(DateTime)
 
 class ProfitabilityReportView(Base):
     __tablename__ = "v_profitability_report"
@@ -130,4 +235,62 @@ class ProfitabilityReportView(Base):
     total_revenue = Column(DECIMAL(22, 4))
     average_cost_at_sale = Column(DECIMAL(22, 4))
     total_cogs = Column(DECIMAL(22, 4))
-    gross_profit = Column(DECIMAL(22, 4))
\ No newline at end of file
+    gross_profit = Column(DECIMAL(22, 4))
+
+class SaleHistoryView(Base):
+    __tablename__ = "v_sale_history"
+    
+    # sale UNION ALL sale_archive
+    sale_id = Column(Integer, primary_key=True)
+    sale_datetime = Column(DateTime)
+    total_amount = Column(DECIMAL(10, 2))
+    payment_method = Column(Enum('Cash', 'Card', 'QR'))
+    notes = Column(String(255))
+    
+    items = relationship(
+        "SaleItemHistoryView",
+        primaryjoin="SaleHistoryView.sale_id == foreign(SaleItemHistoryView.sale_id)",
+        viewonly=True
+    )
+
+class SaleItemHistoryView(Base):
+    __tablename__ = "v_sale_item_history"
+    
+    sale_item_id = Column(Integer, primary_key=True)
+    sale_id = Column(Integer)
+    product_id = Column(Integer)
+    quantity = Column(Integer)
+    unit_price = Column(DECIMAL(10, 2))
+    discount = Column(DECIMAL(10, 2))
+    unit_cost = Column(DECIMAL(14, 4))
+
+class InventoryMovementHistoryView(Base):
+    __tablename__ = "v_inventory_movement_history"
+    
+    # inventory_movement UNION ALL inventory_movement_archive
+    movement_id = Column(Integer, primary_key=True)
+    product_id = Column(Integer)
+    movement_type = Column(Enum('OPENING', 'STOCK_IN', 'SALE'))
+    quantity = Column(Integer)
+    unit_cost = Column(DECIMAL(10, 2))
+    sale_price = Column(DECIMAL(10, 2))
+    sale_item_id = Column(Integer)
+    stock_in_item_id = Column(Integer)
+    movement_date = Column(DateTime)
+
+class ProfitabilityReportHistoryView(Base):
+    __tablename__ = "v_profitability_report_history"
+    
+    # v_profitability_report UNION ALL the same columns over sale_item_archive
+    sale_item_id = Column(Integer, primary_key=True)
+    sale_id = Column(Integer)
+    sale_datetime = Column(DateTime)
+    product_id = Column(Integer)
+    product_name = Column(String(150))
+    quantity = Column(Integer)
+    unit_price = Column(DECIMAL(10, 2))
+    discount = Column(DECIMAL(10, 2))
+    total_revenue = Column(DECIMAL(22, 4))
+    average_cost_at_sale = Column(DECIMAL(22, 4))
+    total_cogs = Column(DECIMAL(22, 4))
+    gross_profit = Column(DECIMAL(22, 4))
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from services.stock_alerts import hub, sse_message
+
+router = APIRouter(
+    prefix="/alerts",
+    tags=["Alerts"]
+)
+
+# Client reconnect delay sent with the first message (milliseconds)
+SSE_RETRY_MS = 3000
+
+@router.get("/low-stock/stream", response_class=StreamingResponse)
+async def stream_low_stock_alerts(
+    since: Optional[int] = Query(None, ge=0, description="Resume after this id (the `id` of the last event received)"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Server-Sent Events stream of low-stock crossings, replacing polling of
+    /reports/product-stock?productFilter=r.
+
+    A new subscriber first gets a `reset` event listing every product at or below its
+    reorder level, then a `crossing` event each time a sale, stock-in or movement write
+    takes a product to or below its reorder level or back above it. Every event has an
+    `id` (a resume position: its seq, or lower while an earlier event is still pending); a
+    reconnecting EventSource sends the last one as Last-Event-ID (or pass `since`) and
+    receives the events it missed, possibly with a few it already applied.
+    """
+    if last_event_id is not None and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def body():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        async for kind, payload, resume in hub.subscribe(since):
+            yield sse_message(kind, payload, resume)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
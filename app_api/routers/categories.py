@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 
-from database import db_dependency 
+from database import db_dependency, consistent_read_db_dependency
 from models import sqlalchemy_models, request_models, response_models
+from services import pagination, serialization, fieldsets, catalog
 
 # Create an APIRouter instance
 router = APIRouter(
@@ -28,8 +29,9 @@ def create_category(category: request_models.CategoryCreate, db: db_dependency):
 
 @router.get("/", response_model=response_models.PaginatedResponse[response_models.Category])
 def get_all_categories(
-    db: db_dependency,
-    search_params: request_models.CategorySearchParams = Depends()
+    db: consistent_read_db_dependency,
+    search_params: request_models.CategorySearchParams = Depends(),
+    accept: serialization.AcceptHeader = None
 ):
     """
     Retrieve all categories with pagination and search functionality.
@@ -37,38 +39,41 @@ def get_all_categories(
     - **search**: Search in category name
     - **page**: Page number (starts from 1)
     - **limit**: Items per page (max 100)
+    - **cursor**: Keyset paging, pass an empty value first and then `next_cursor`
+    - **include_total**: `true` (exact count), `false` (no count) or `estimated` (recent cached count)
+    - **fields**: Comma-separated fields per category, e.g. `name`
     """
-    query = db.query(sqlalchemy_models.CategoryDB)
+    # Sort keys (the primary key is already unique)
+    sort_keys = [
+        (sqlalchemy_models.CategoryDB.category_id, False)
+    ]
+
+    fields = fieldsets.parse_fields(search_params.fields, response_models.Category)
+    columns = fieldsets.columns(sqlalchemy_models.CategoryDB, fields, sort_keys)
+    query = db.query(*columns) if columns is not None else db.query(sqlalchemy_models.CategoryDB)
 
     # Apply search filter
     if search_params.search:
         search_term = f"%{search_params.search}%"
         query = query.filter(sqlalchemy_models.CategoryDB.name.ilike(search_term))
 
-    total = query.count()
+    # Keyset mode: seek on (category_id) instead of OFFSET
+    if search_params.cursor is not None:
+        page = pagination.keyset_paginate(query, sort_keys, search_params.cursor, search_params.limit)
+        if not page.items and not search_params.cursor:
+            raise HTTPException(status_code=404, detail="ไม่พบหมวดหมู่")
+        return serialization.page_response(page, response_models.Category, accept, fields)
 
-    categories = query.order_by(sqlalchemy_models.CategoryDB.category_id)\
-        .offset((search_params.page - 1) * search_params.limit)\
-        .limit(search_params.limit)\
-        .all()
+    # Page mode: limit+1 rows for has_next, total as requested by include_total
+    page = pagination.offset_paginate(query, pagination.order_by_keys(sort_keys), search_params)
 
-    if not categories and search_params.page == 1:
+    if not page.items and search_params.page == 1:
         raise HTTPException(status_code=404, detail="ไม่พบหมวดหมู่")
 
-    total_pages = (total + search_params.limit - 1) // search_params.limit
-
-    return response_models.PaginatedResponse(
-        items=categories,
-        total=total,
-        page=search_params.page,
-        limit=search_params.limit,
-        total_pages=total_pages,
-        has_next=search_params.page < total_pages,
-        has_prev=search_params.page > 1
-    )
+    return serialization.page_response(page, response_models.Category, accept, fields)
 
 @router.get("/{category_id}", response_model=response_models.Category)
-def get_category_by_id(category_id: int, db: db_dependency):
+def get_category_by_id(category_id: int, db: consistent_read_db_dependency):
     """
     Retrieve a single category by its ID.
     """
@@ -96,6 +101,8 @@ def update_category(category_id: int, category_update: request_models.CategoryCr
 
     db_category.name = category_update.name
     db.commit()
+    # Cached products carry their category's name
+    catalog.product_cache.clear()
     db.refresh(db_category)
     return db_category
 
@@ -111,5 +118,6 @@ def delete_category(category_id: int, db: db_dependency):
 
     db.delete(db_category)
     db.commit()
+    catalog.product_cache.clear()
 
     return {"detail": f"หมวดหมู่ {db_category.name} ถูกลบเรียบร้อยแล้ว"}
\ No newline at end of file
@@ -1,28 +1,39 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime
-from database import db_dependency
+from database import db_dependency, read_db_dependency, consistent_read_db_dependency
 from models import sqlalchemy_models, request_models, response_models
+from services import pagination, export, archive, serialization, fieldsets
+from sqlalchemy import select
 
 router = APIRouter(
     prefix="/inventory-movements",
     tags=["Inventory Movements"]
 )
 
-@router.get("/", response_model=response_models.PaginatedResponse[response_models.InventoryMovement])
-def get_all_inventory_movements(
-    db: db_dependency,
-    search_params: request_models.InventoryMovementSearchParams = Depends()
-):
+def _movement_model(db, search_params: request_models.InventoryMovementSearchParams):
     """
-    Retrieve all inventory movements with pagination and filtering.
+    InventoryMovementDB, or InventoryMovementHistoryView when the date window reaches into the archived period.
+    """
+    if archive.needs_history(db, search_params.start_date, search_params.end_date):
+        return sqlalchemy_models.InventoryMovementHistoryView
+    return sqlalchemy_models.InventoryMovementDB
+
+def _movement_sort_keys(model=sqlalchemy_models.InventoryMovementDB):
+    """
+    Sort keys for movement lists, ending with the primary key as tie-breaker.
+    """
+    return [(model.movement_date, True), (model.movement_id, True)]
+
+def _apply_movement_filters(query, search_params: request_models.InventoryMovementSearchParams, model=sqlalchemy_models.InventoryMovementDB):
+    """
+    Apply the movement search params to an ORM query or select() on InventoryMovementDB
+    or InventoryMovementHistoryView.
     """
-    # Start with base query
-    query = db.query(sqlalchemy_models.InventoryMovementDB)
-    
     # Apply filters
     if search_params.product_id:
-        query = query.filter(sqlalchemy_models.InventoryMovementDB.product_id == search_params.product_id)
+        query = query.filter(model.product_id == search_params.product_id)
         
     if search_params.movement_type:
         # Validate movement_type
@@ -32,13 +43,13 @@ def get_all_inventory_movements(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"ประเภท movement_type ไม่ถูกต้อง ค่าที่อนุญาตคือ: {', '.join(allowed_types)}"
             )
-        query = query.filter(sqlalchemy_models.InventoryMovementDB.movement_type == search_params.movement_type.upper())
+        query = query.filter(model.movement_type == search_params.movement_type.upper())
     
     # Date filtering
     if search_params.start_date:
         try:
             start_datetime = datetime.strptime(search_params.start_date, "%Y-%m-%d")
-            query = query.filter(sqlalchemy_models.InventoryMovementDB.movement_date >= start_datetime)
+            query = query.filter(model.movement_date >= start_datetime)
         except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -50,50 +61,84 @@ def get_all_inventory_movements(
             end_datetime = datetime.strptime(search_params.end_date, "%Y-%m-%d")
             # Add 23:59:59 to include the entire end date
             end_datetime = end_datetime.replace(hour=23, minute=59, second=59)
-            query = query.filter(sqlalchemy_models.InventoryMovementDB.movement_date <= end_datetime)
+            query = query.filter(model.movement_date <= end_datetime)
         except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="รูปแบบวันที่สิ้นสุดไม่ถูกต้อง ใช้รูปแบบ YYYY-MM-DD"
             )
-    
-    # Get total count before pagination
-    total = query.count()
-    
-    # Apply ordering and pagination
-    movements = query.order_by(
-        sqlalchemy_models.InventoryMovementDB.movement_date.desc()
-    ).offset(
-        (search_params.page - 1) * search_params.limit
-    ).limit(search_params.limit).all()
-    
-    if not movements and search_params.page == 1:
-        raise HTTPException(status_code=404, detail="ไม่พบข้อมูลการเคลื่อนไหวสินค้าที่ระบุ")
 
-    # Calculate pagination info
-    total_pages = (total + search_params.limit - 1) // search_params.limit
+    return query
+
+@router.get("/", response_model=response_models.PaginatedResponse[response_models.InventoryMovement])
+def get_all_inventory_movements(
+    db: consistent_read_db_dependency,
+    search_params: request_models.InventoryMovementSearchParams = Depends(),
+    accept: serialization.AcceptHeader = None
+):
+    """
+    Retrieve all inventory movements with pagination and filtering.
+    Archived movements are included when start_date/end_date reach into the archived period.
+    `fields` (e.g. `movement_id,movement_type,quantity`) narrows the columns read and returned.
+    """
+    # Start with base query: the selected columns only when fields is given
+    model = _movement_model(db, search_params)
+    sort_keys = _movement_sort_keys(model)
+    fields = fieldsets.parse_fields(search_params.fields, response_models.InventoryMovement)
+    columns = fieldsets.columns(model, fields, sort_keys)
+    query = db.query(*columns) if columns is not None else db.query(model)
+    query = _apply_movement_filters(query, search_params, model)
+
+    # Keyset mode: seek on (movement_date, movement_id) along idx_im_product_date when
+    # filtering by product, idx_im_movement_date otherwise, instead of OFFSET
+    if search_params.cursor is not None:
+        page = pagination.keyset_paginate(query, sort_keys, search_params.cursor, search_params.limit)
+        if not page.items and not search_params.cursor:
+            raise HTTPException(status_code=404, detail="ไม่พบข้อมูลการเคลื่อนไหวสินค้าที่ระบุ")
+        return serialization.page_response(page, response_models.InventoryMovement, accept, fields)
+
+    # Apply ordering and pagination; the total follows include_total
+    page = pagination.offset_paginate(query, pagination.order_by_keys(sort_keys), search_params)
     
+    if not page.items and search_params.page == 1:
+        raise HTTPException(status_code=404, detail="ไม่พบข้อมูลการเคลื่อนไหวสินค้าที่ระบุ")
     
-    return response_models.PaginatedResponse(
-        items=movements,
-        total=total,
-        page=search_params.page,
-        limit=search_params.limit,
-        total_pages=total_pages,
-        has_next=search_params.page < total_pages,
-        has_prev=search_params.page > 1
-    )
+    return serialization.page_response(page, response_models.InventoryMovement, accept, fields)
 
 
 
+@router.get("/export", response_class=StreamingResponse)
+def export_inventory_movements(
+    db: read_db_dependency,
+    search_params: request_models.InventoryMovementSearchParams = Depends(),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$", description="csv or ndjson")
+):
+    """
+    Stream the full movement ledger matching the /inventory-movements/ filters as CSV or NDJSON.
+    Rows come from one query over a server-side cursor; page, limit and cursor are ignored.
+    """
+    model = _movement_model(db, search_params)
+    query = _apply_movement_filters(select(*model.__table__.columns), search_params, model)
+    return export.export_response(
+        export.stream_rows(
+            query.order_by(*pagination.order_by_keys(_movement_sort_keys(model))), export_format, bind=db.get_bind()
+        ),
+        export_format,
+        "inventory-movements"
+    )
+
 @router.get("/{movement_id}", response_model=response_models.InventoryMovement)
-def get_inventory_movement_by_id(movement_id: int, db: db_dependency):
+def get_inventory_movement_by_id(movement_id: int, db: consistent_read_db_dependency):
     """
-    Retrieve a single inventory movement by its ID.
+    Retrieve a single inventory movement by its ID, archived movements included.
     """
     movement = db.query(sqlalchemy_models.InventoryMovementDB).filter(
         sqlalchemy_models.InventoryMovementDB.movement_id == movement_id
     ).first()
+    if movement is None:
+        movement = db.query(sqlalchemy_models.InventoryMovementHistoryView).filter(
+            sqlalchemy_models.InventoryMovementHistoryView.movement_id == movement_id
+        ).first()
     
     if movement is None:
         raise HTTPException(
@@ -0,0 +1,140 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services import pool_stats, replica, sale_queue, catalog
+from services.retry import retry_stats
+from services.report_cache import report_cache
+from services.request_metrics import request_metrics
+
+router = APIRouter(
+    prefix="/monitoring",
+    tags=["Monitoring"]
+)
+
+# Served at the conventional /metrics path, outside the /monitoring prefix
+metrics_router = APIRouter(tags=["Monitoring"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/pool")
+def get_pool_stats():
+    """
+    Live connection pool statistics for the sync and async engines:
+    checked-out connections, overflow in use, checkout wait-time histogram
+    (cumulative buckets in seconds) and connection churn counters.
+    """
+    return {name: stats.snapshot() for name, stats in pool_stats.registry.items()}
+
+@router.get("/cache")
+def get_cache_stats():
+    """
+    Report response cache counters: hits, misses, size evictions, TTL expirations
+    and entries dropped by write invalidation.
+    """
+    return report_cache.stats()
+
+@router.get("/catalog-cache")
+def get_catalog_cache_stats():
+    """
+    Product catalog cache counters (id and SKU lookups): hits, misses, size evictions,
+    TTL expirations and products dropped by product writes.
+    """
+    return catalog.product_cache.stats()
+
+@router.get("/replica")
+def get_replica_stats():
+    """
+    Read replica state: last measured lag, whether reads currently use it, and how many
+    reads went to the replica or the primary (by reason: ok, no_replica, lagging,
+    token_not_applied).
+    """
+    return replica.monitor.snapshot()
+
+@router.get("/sale-queue")
+def get_sale_queue_stats():
+    """
+    Write-ahead sale queue state: whether this process owns it, submissions not drained
+    yet (depth), and appended, drained, rejected and group fsync counters.
+    """
+    return sale_queue.queue.snapshot()
+
+@router.get("/retries")
+def get_retry_stats():
+    """
+    Write transactions rerun after a deadlock or lock wait timeout (outcome retried), and
+    those that still failed on the last attempt (outcome gave_up).
+    """
+    return retry_stats.snapshot()
+
+def _pool_lines() -> list:
+    lines = []
+    gauges = ("checked_out", "checked_in", "overflow_in_use")
+    counters = ("checkout_timeouts", "connections_opened", "connections_closed", "connections_invalidated")
+    snapshots = [stats.snapshot() for stats in pool_stats.registry.values()]
+    for key in gauges + counters:
+        name = f"db_pool_{key}" + ("_total" if key in counters else "")
+        lines.append(f"# TYPE {name} {'counter' if key in counters else 'gauge'}")
+        lines += [f'{name}{{pool="{snapshot["name"]}"}} {snapshot[key]}' for snapshot in snapshots]
+    lines.append("# TYPE db_pool_checkout_wait_seconds histogram")
+    for snapshot in snapshots:
+        wait = snapshot["checkout_wait_seconds"]
+        for bucket in wait["buckets"]:
+            lines.append(f'db_pool_checkout_wait_seconds_bucket{{pool="{snapshot["name"]}",le="{bucket["le"]}"}} {bucket["count"]}')
+        lines.append(f'db_pool_checkout_wait_seconds_sum{{pool="{snapshot["name"]}"}} {wait["sum"]}')
+        lines.append(f'db_pool_checkout_wait_seconds_count{{pool="{snapshot["name"]}"}} {wait["count"]}')
+    return lines
+
+def _cache_lines() -> list:
+    stats = report_cache.stats()
+    lines = ["# TYPE report_cache_entries gauge", f"report_cache_entries {stats['entries']}"]
+    for key in ("hits", "misses", "evictions", "expirations", "invalidations"):
+        lines += [f"# TYPE report_cache_{key}_total counter", f"report_cache_{key}_total {stats[key]}"]
+    return lines
+
+def _catalog_cache_lines() -> list:
+    stats = catalog.product_cache.stats()
+    lines = ["# TYPE catalog_cache_entries gauge", f"catalog_cache_entries {stats['entries']}"]
+    for key in ("hits", "misses", "evictions", "expirations", "invalidations"):
+        lines += [f"# TYPE catalog_cache_{key}_total counter", f"catalog_cache_{key}_total {stats[key]}"]
+    return lines
+
+def _replica_lines() -> list:
+    stats = replica.monitor.snapshot()
+    lines = ["# TYPE db_replica_usable gauge", f"db_replica_usable {int(stats['usable'])}"]
+    if stats["lag_seconds"] is not None:
+        lines += ["# TYPE db_replica_lag_seconds gauge", f"db_replica_lag_seconds {stats['lag_seconds']}"]
+    lines.append("# TYPE db_read_routing_total counter")
+    lines += [
+        f'db_read_routing_total{{target="{entry["target"]}",reason="{entry["reason"]}"}} {entry["count"]}'
+        for entry in stats["routed"]
+    ]
+    return lines
+
+def _sale_queue_lines() -> list:
+    stats = sale_queue.queue.snapshot()
+    if not stats["enabled"]:
+        return []
+    lines = ["# TYPE sale_queue_depth gauge", f"sale_queue_depth {stats['depth']}"]
+    for key in ("appended", "drained", "rejected", "fsyncs"):
+        lines += [f"# TYPE sale_queue_{key}_total counter", f"sale_queue_{key}_total {stats[key]}"]
+    return lines
+
+def _retry_lines() -> list:
+    lines = ["# TYPE db_transaction_retries_total counter"]
+    lines += [
+        f'db_transaction_retries_total{{reason="{entry["reason"]}",outcome="{entry["outcome"]}"}} {entry["count"]}'
+        for entry in retry_stats.snapshot()
+    ]
+    return lines
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus text exposition: per route latency histograms, request counts by status,
+    SQL statement counts and DB time, plus the connection pool, report and catalog cache, read
+    replica routing, sale queue and transaction retry counters.
+    """
+    lines = (
+        request_metrics.render() + _pool_lines() + _cache_lines() + _catalog_cache_lines()
+        + _replica_lines() + _sale_queue_lines() + _retry_lines()
+    )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy import or_, and_
+from sqlalchemy import and_
 from typing import List
-from database import db_dependency
+from database import db_dependency, consistent_read_db_dependency
 from models import sqlalchemy_models, request_models, response_models
+from services import pagination, search, serialization, fieldsets, catalog
 
 router = APIRouter(
     prefix="/products",
@@ -30,34 +31,47 @@ def create_product(product: request_models.ProductCreate, db: db_dependency):
     db.add(new_product)
     db.commit()
     db.refresh(new_product)
+    catalog.product_cache.invalidate(new_product.product_id, new_product.sku)
     return new_product
 
 @router.get("/", response_model=response_models.PaginatedResponse[response_models.Product])
 def get_all_products(
-    db: db_dependency,
-    search_params: request_models.ProductSearchParams = Depends()
+    db: consistent_read_db_dependency,
+    search_params: request_models.ProductSearchParams = Depends(),
+    accept: serialization.AcceptHeader = None
 ):
     """
     Retrieve all products with pagination and search functionality.
     
-    - **search**: Search in product name or SKU
+    - **search**: Search in product name or SKU, ranked by relevance (keyset mode keeps ID order)
     - **category_id**: Filter by specific category
     - **min_price/max_price**: Price range filtering
     - **page**: Page number (starts from 1)
     - **limit**: Items per page (max 100)
+    - **cursor**: Keyset paging, pass an empty value first and then `next_cursor`
+    - **include_total**: `true` (exact count), `false` (no count) or `estimated` (recent cached count)
+    - **fields**: Comma-separated fields per product, e.g. `product_id,name,price`
     """
-    # Build base query
-    query = db.query(sqlalchemy_models.ProductDB)
+    # Sort keys (the primary key is already unique)
+    sort_keys = [
+        (sqlalchemy_models.ProductDB.product_id, False)
+    ]
+
+    # Build base query: the selected columns only, or whole products when the category is returned
+    fields = fieldsets.parse_fields(search_params.fields, response_models.Product)
+    columns = fieldsets.columns(sqlalchemy_models.ProductDB, fields, sort_keys)
+    if columns is not None:
+        query = db.query(*columns)
+    else:
+        query = db.query(sqlalchemy_models.ProductDB).options(
+            *fieldsets.load_only(sqlalchemy_models.ProductDB, fields, sort_keys)
+        )
     
-    # Apply search filters
+    # Apply search filters through the ft_product_name_sku n-gram index
+    rank = None
     if search_params.search:
-        search_term = f"%{search_params.search}%"
-        query = query.filter(
-            or_(
-                sqlalchemy_models.ProductDB.name.ilike(search_term),
-                sqlalchemy_models.ProductDB.sku.ilike(search_term)
-            )
-        )
+        query = query.filter(search.search_condition(search.PRODUCT_SEARCH_COLUMNS, search_params.search))
+        rank = search.search_rank(search.PRODUCT_SEARCH_COLUMNS, search_params.search)
     
     if search_params.category_id:
         query = query.filter(sqlalchemy_models.ProductDB.category_id == search_params.category_id)
@@ -68,33 +82,37 @@ def get_all_products(
     if search_params.max_price is not None:
         query = query.filter(sqlalchemy_models.ProductDB.price <= search_params.max_price)
     
-    # Get total count before pagination
-    total = query.count()
-    
-    # Apply ordering and pagination
-    products = query.order_by(sqlalchemy_models.ProductDB.product_id)\
-                   .offset((search_params.page - 1) * search_params.limit)\
-                   .limit(search_params.limit)\
-                   .all()
+    # Keyset mode: seek on (product_id) instead of OFFSET
+    if search_params.cursor is not None:
+        page = pagination.keyset_paginate(query, sort_keys, search_params.cursor, search_params.limit)
+        if not page.items and not search_params.cursor:
+            raise HTTPException(status_code=404, detail="ไม่พบสินค้า")
+        return serialization.page_response(page, response_models.Product, accept, fields)
+
+    # Apply ordering and pagination, best search matches first
+    order = pagination.order_by_keys(sort_keys)
+    if rank is not None:
+        order.insert(0, rank)
+    page = pagination.offset_paginate(query, order, search_params)
     
-    if not products and search_params.page == 1:
+    if not page.items and search_params.page == 1:
         raise HTTPException(status_code=404, detail="ไม่พบสินค้า")
     
-    # Calculate pagination metadata
-    total_pages = (total + search_params.limit - 1) // search_params.limit
-    
-    return response_models.PaginatedResponse(
-        items=products,
-        total=total,
-        page=search_params.page,
-        limit=search_params.limit,
-        total_pages=total_pages,
-        has_next=search_params.page < total_pages,
-        has_prev=search_params.page > 1
-    )
+    return serialization.page_response(page, response_models.Product, accept, fields)
+
+@router.get("/by-sku/{sku}", response_model=response_models.Product)
+def get_product_by_sku(sku: str, db: db_dependency):
+    """
+    Retrieve a single product by its SKU (barcode scans at the register).
+    Served from the in-process catalog cache; a miss is one indexed query on the primary.
+    """
+    product = catalog.fetch_product_by_sku(db, sku)
+    if product is None:
+        raise HTTPException(status_code=404, detail=f"ไม่พบสินค้าที่มี SKU '{sku}'")
+    return product
 
 @router.get("/{product_id}", response_model=response_models.Product)
-def get_product_by_id(product_id: int, db: db_dependency):
+def get_product_by_id(product_id: int, db: consistent_read_db_dependency):
     """
     Retrieve a single product by its ID.
     """
@@ -127,11 +145,13 @@ def update_product(product_id: int, product_update: request_models.ProductUpdate
         if existing_sku:
             raise HTTPException(status_code=400, detail=f"มีสินค้าอื่นใช้ SKU '{product_update.sku}' นี้แล้ว")
 
+    old_sku = db_product.sku
     update_data = product_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_product, key, value)
     
     db.commit()
+    catalog.product_cache.invalidate(product_id, old_sku)
     db.refresh(db_product)
     return db_product
 
@@ -146,6 +166,7 @@ def delete_product(product_id: int, db: db_dependency):
 
     db.delete(db_product)
     db.commit()
+    catalog.product_cache.invalidate(product_id, db_product.sku)
 
     return {"detail": f"{db_product.name} ถูกลบเรียบร้อยแล้ว"}
 
@@ -1,83 +1,43 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from typing import List, Optional
-from database import db_dependency
+from database import async_read_db_dependency
 from models import sqlalchemy_models, response_models, request_models
+from services import pagination, export, rollup, search, snapshots, archive, serialization, fieldsets
+from services.report_cache import cached
 from datetime import timedelta, datetime
-from sqlalchemy import or_, func
+from sqlalchemy import or_, func, select
+from fastapi.responses import StreamingResponse
 
 router = APIRouter(
     prefix="/reports",
     tags=["Reports"]
 )
 
-@router.get("/product-stock", response_model=response_models.PaginatedResponse[response_models.ProductStock])
-def get_product_stock_report(
-    db: db_dependency,
-    search_params: request_models.ProductStockSearchParams = Depends()
-):
+def _profitability_view(reaches_archive: bool):
     """
-    Retrieve the current product stock data from the v_product_stock view with search and pagination.
+    v_profitability_report covers the hot sales only; windows reaching into the archived
+    period read v_profitability_report_history instead.
     """
-    # Base query from the view
-    query = db.query(sqlalchemy_models.ProductStockView)
-
-    # Apply filters
-    if search_params.productFilter == "r":
-        query = query.filter(sqlalchemy_models.ProductStockView.needs_restock == 1)
-    elif search_params.productFilter == "nr":
-        query = query.filter(sqlalchemy_models.ProductStockView.needs_restock == 0)
-    
-    if search_params.search:
-        # Search in product name (case-insensitive)
-        search_filter = f"%{search_params.search}%"
-        query = query.filter(
-            sqlalchemy_models.ProductStockView.name.ilike(search_filter)
-        )
-
-    # Get total count before pagination
-    total = query.count()
-    
-    if total == 0:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="ไม่พบข้อมูลสต็อกสินค้า"
-        )
-
-    # Calculate pagination
-    total_pages = (total + search_params.limit - 1) // search_params.limit
-    
-    # Apply pagination and ordering
-    stock_data = query.order_by(sqlalchemy_models.ProductStockView.name)\
-                     .offset((search_params.page - 1) * search_params.limit)\
-                     .limit(search_params.limit)\
-                     .all()
-
-    return response_models.PaginatedResponse(
-        items=stock_data,
-        total=total,
-        page=search_params.page,
-        limit=search_params.limit,
-        total_pages=total_pages,
-        has_next=search_params.page < total_pages,
-        has_prev=search_params.page > 1
-    )
-
+    if reaches_archive:
+        return sqlalchemy_models.ProfitabilityReportHistoryView
+    return sqlalchemy_models.ProfitabilityReportView
 
-@router.get("/profitability", response_model=response_models.PaginatedResponse[response_models.ProfitabilityReport])
-def get_profitability_report(
-    db: db_dependency,
-    search_params: request_models.ProfitabilityReportSearchParams = Depends()
-):
+def _profitability_order(view):
     """
-    Retrieve the profit and loss report for each sold product with search and pagination.
+    Latest sales first; sale_item_id keeps the order stable for exports.
     """
-    query = db.query(sqlalchemy_models.ProfitabilityReportView)
+    return (view.sale_datetime.desc(), view.sale_item_id.desc())
 
+def _apply_profitability_filters(query, search_params: request_models.ProfitabilityReportSearchParams, view=sqlalchemy_models.ProfitabilityReportView):
+    """
+    Apply the profitability report search params to a select() on v_profitability_report
+    or v_profitability_report_history.
+    """
     # Apply date filters
     if search_params.start_date:
         try:
             start_date = datetime.strptime(search_params.start_date, "%Y-%m-%d").date()
-            query = query.filter(sqlalchemy_models.ProfitabilityReportView.sale_datetime >= start_date)
+            query = query.filter(view.sale_datetime >= start_date)
         except ValueError:
             raise HTTPException(status_code=400, detail="รูปแบบวันที่ไม่ถูกต้อง ใช้ YYYY-MM-DD")
 
@@ -86,81 +46,168 @@ def get_profitability_report(
             end_date = datetime.strptime(search_params.end_date, "%Y-%m-%d").date()
             # Add one day to include the entire end date
             end_date = datetime.combine(end_date, datetime.max.time())
-            query = query.filter(sqlalchemy_models.ProfitabilityReportView.sale_datetime <= end_date)
+            query = query.filter(view.sale_datetime <= end_date)
         except ValueError:
             raise HTTPException(status_code=400, detail="รูปแบบวันที่ไม่ถูกต้อง ใช้ YYYY-MM-DD")
     
-    # Apply search filter
+    # Apply search filter (product name or SKU, through the product full-text index)
     if search_params.search:
-        # Search in product name (case-insensitive)
-        search_filter = f"%{search_params.search}%"
         query = query.filter(
-            sqlalchemy_models.ProfitabilityReportView.product_name.ilike(search_filter)
+            view.product_id.in_(search.matching_product_ids(search_params.search))
         )
     
     # Apply product filter
     if search_params.product_id:
-        query = query.filter(sqlalchemy_models.ProfitabilityReportView.product_id == search_params.product_id)
+        query = query.filter(view.product_id == search_params.product_id)
+
+    return query
+
+def _parse_as_of(value: str) -> datetime:
+    """
+    YYYY-MM-DD means the end of that day; anything else must be an ISO datetime.
+    """
+    if len(value) == 10:
+        return datetime.combine(datetime.strptime(value, "%Y-%m-%d").date(), datetime.max.time().replace(microsecond=0))
+    return datetime.fromisoformat(value)
+
+@router.get("/product-stock", response_model=response_models.PaginatedResponse[response_models.ProductStock])
+async def get_product_stock_report(
+    db: async_read_db_dependency,
+    search_params: request_models.ProductStockSearchParams = Depends(),
+    accept: serialization.AcceptHeader = None
+):
+    """
+    Retrieve the current product stock data from the v_product_stock view with search and pagination.
+    The view reads the trigger-maintained product_stock_balance table, so no movements are aggregated here.
+    With as_of the stock is rebuilt from the latest stock snapshot before that moment plus the movements since.
+    """
+    view = sqlalchemy_models.ProductStockView
+    if search_params.as_of:
+        try:
+            as_of = _parse_as_of(search_params.as_of)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="รูปแบบ as_of ไม่ถูกต้อง ใช้ YYYY-MM-DD หรือ YYYY-MM-DDTHH:MM:SS")
+        view = snapshots.stock_view_as_of(as_of, await snapshots.alatest_period(db, as_of))
 
-    # Get total count before pagination
-    total = query.count()
+    # Base query from the view, narrowed to the requested fields
+    fields = fieldsets.parse_fields(search_params.fields, response_models.ProductStock)
+    columns = fieldsets.columns(view, fields)
+    query = select(*columns) if columns is not None else select(view)
+
+    # Apply filters
+    if search_params.productFilter == "r":
+        query = query.filter(view.needs_restock == 1)
+    elif search_params.productFilter == "nr":
+        query = query.filter(view.needs_restock == 0)
     
-    if total == 0:
+    if search_params.search:
+        # Search in product name or SKU through the product full-text index
+        query = query.filter(
+            view.product_id.in_(search.matching_product_ids(search_params.search))
+        )
+
+    # Apply pagination and ordering; the total follows include_total
+    page = await pagination.aoffset_paginate(
+        db, query, [view.name], search_params, entities=columns is None
+    )
+
+    if not page.items and search_params.page == 1:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="ไม่พบข้อมูลสต็อกสินค้า"
+        )
+
+    return serialization.page_response(page, response_models.ProductStock, accept, fields)
+
+
+@router.get("/profitability", response_model=response_models.PaginatedResponse[response_models.ProfitabilityReport])
+async def get_profitability_report(
+    db: async_read_db_dependency,
+    search_params: request_models.ProfitabilityReportSearchParams = Depends(),
+    accept: serialization.AcceptHeader = None
+):
+    """
+    Retrieve the profit and loss report for each sold product with search and pagination.
+    Archived sales are included when start_date/end_date reach into the archived period.
+    """
+    view = _profitability_view(
+        await archive.aneeds_history(db, search_params.start_date, search_params.end_date)
+    )
+    fields = fieldsets.parse_fields(search_params.fields, response_models.ProfitabilityReport)
+    columns = fieldsets.columns(view, fields)
+    query = select(*columns) if columns is not None else select(view)
+    query = _apply_profitability_filters(query, search_params, view)
+
+    # Apply pagination and ordering (latest sales first); the total follows include_total
+    page = await pagination.aoffset_paginate(
+        db, query, _profitability_order(view), search_params, entities=columns is None
+    )
+
+    if not page.items and search_params.page == 1:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="ไม่พบข้อมูลกำไรขาดทุนตามเงื่อนไขที่ระบุ"
         )
 
-    # Calculate pagination    
-    total_pages = (total + search_params.limit - 1) // search_params.limit
-    
-    # Apply pagination and ordering (latest sales first)
-    report_data = query.order_by(sqlalchemy_models.ProfitabilityReportView.sale_datetime.desc())\
-                       .offset((search_params.page - 1) * search_params.limit)\
-                       .limit(search_params.limit)\
-                       .all()
-
-    return response_models.PaginatedResponse(
-        items=report_data,
-        total=total,
-        page=search_params.page,
-        limit=search_params.limit,
-        total_pages=total_pages,
-        has_next=search_params.page < total_pages,
-        has_prev=search_params.page > 1
+    return serialization.page_response(page, response_models.ProfitabilityReport, accept, fields)
+
+@router.get("/profitability/export", response_class=StreamingResponse)
+async def export_profitability_report(
+    db: async_read_db_dependency,
+    search_params: request_models.ProfitabilityReportSearchParams = Depends(),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$", description="csv or ndjson")
+):
+    """
+    Stream the full profitability report as CSV or NDJSON with the same filters as /reports/profitability.
+    Rows come from one query over a server-side cursor; page, limit and cursor are ignored.
+    """
+    view = _profitability_view(
+        await archive.aneeds_history(db, search_params.start_date, search_params.end_date)
+    )
+    query = _apply_profitability_filters(select(*view.__table__.columns), search_params, view)
+    return export.export_response(
+        export.astream_rows(query.order_by(*_profitability_order(view)), export_format, bind=db.bind),
+        export_format,
+        "profitability"
     )
 
 @router.get("/product-stock/summary", response_model=response_models.ProductStockSummary)
-def get_product_stock_summary(
-    db: db_dependency,
+@cached("product_stock_summary", depends_on={
+    "product": {"price", "reorder_level"},
+    "inventory_movement": None,
+    "sale_item": {"product_id", "quantity"},
+    "stock_in_item": {"product_id", "quantity"},
+    "stock_in": set(),  # Only inserts/deletes: a delete removes its movements
+    "sale": set(),
+})
+async def get_product_stock_summary(
+    db: async_read_db_dependency,
     needs_restock_only: bool = Query(False, description="Filter only products that need restocking")
 ):
     """
     Get summary statistics for product stock report.
     Scope follows `needs_restock_only`. Percent is computed within the same scope.
+    Served from the report cache until a committed write touches the stock figures.
     """
-    base_q = db.query(sqlalchemy_models.ProductStockView)
+    base_q = select(sqlalchemy_models.ProductStockView)
 
     # Scope: all products or only those needing restock
     if needs_restock_only:
         base_q = base_q.filter(sqlalchemy_models.ProductStockView.needs_restock == 1)
 
-    # Totals within scope
-    total_products = base_q.count()
+    # Count, stock value and restock count within scope in a single pass over the balance rows
+    totals = (await db.execute(base_q.with_only_columns(
+        func.count(sqlalchemy_models.ProductStockView.product_id).label('total_products'),
+        func.sum(
+            sqlalchemy_models.ProductStockView.stock_on_hand
+            * sqlalchemy_models.ProductStockView.price
+        ).label('total_stock_value'),
+        func.sum(sqlalchemy_models.ProductStockView.needs_restock).label('products_needing_restock')
+    ))).first()
 
-    total_stock_value = (
-        base_q.with_entities(
-            func.sum(
-                sqlalchemy_models.ProductStockView.stock_on_hand
-                * sqlalchemy_models.ProductStockView.price
-            )
-        ).scalar() or 0
-    )
-
-    # Count needing restock within the same scope
-    products_needing_restock = base_q.filter(
-        sqlalchemy_models.ProductStockView.needs_restock == 1
-    ).count()
+    total_products = totals.total_products or 0
+    total_stock_value = totals.total_stock_value or 0
+    products_needing_restock = int(totals.products_needing_restock or 0)
 
     restock_percentage = round(
         (products_needing_restock / max(total_products, 1)) * 100, 2
@@ -175,33 +222,45 @@ def get_product_stock_summary(
 
 
 @router.get("/profitability/summary", response_model=response_models.ProfitabilitySummary)
-def get_profitability_summary(
-    db: db_dependency,
+@cached("profitability_summary", depends_on={
+    "sale": {"sale_datetime"},
+    "sale_item": None,
+    "product": {"name"},
+    "stock_in": None,
+    "stock_in_item": None,
+    "inventory_movement": None,
+    "sales_daily_rollup": None,
+})
+async def get_profitability_summary(
+    db: async_read_db_dependency,
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)")
 ):
     """
     Get summary statistics for profitability report.
+    Served from the report cache until a committed write touches sales or costs.
     """
-    q = db.query(sqlalchemy_models.ProfitabilityReportView)
+    window_start = window_end = None
 
-    # Apply date filters
+    # Apply date filters as a half-open [start, end) window of whole days
     if start_date:
         try:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-            q = q.filter(sqlalchemy_models.ProfitabilityReportView.sale_datetime >= start_date_obj)
+            window_start = datetime.combine(datetime.strptime(start_date, "%Y-%m-%d").date(), datetime.min.time())
         except ValueError:
             raise HTTPException(status_code=400, detail="รูปแบบวันที่ไม่ถูกต้อง ใช้ YYYY-MM-DD")
 
     if end_date:
         try:
             end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            end_date_obj = datetime.combine(end_date_obj, datetime.max.time())
-            q = q.filter(sqlalchemy_models.ProfitabilityReportView.sale_datetime <= end_date_obj)
+            # Midnight of the next day includes the entire end date
+            window_end = datetime.combine(end_date_obj + timedelta(days=1), datetime.min.time())
         except ValueError:
             raise HTTPException(status_code=400, detail="รูปแบบวันที่ไม่ถูกต้อง ใช้ YYYY-MM-DD")
 
-    total_sales = q.count()
+    # Whole days come from sales_daily_rollup; only partial days would touch the raw lines
+    totals = await rollup.atotals(db, window_start, window_end)
+
+    total_sales = totals["total_sales"]
 
     if total_sales == 0:
         return response_models.ProfitabilitySummary(
@@ -213,27 +272,13 @@ def get_profitability_summary(
             most_profitable_product=None
         )
 
-    totals = q.with_entities(
-        func.sum(sqlalchemy_models.ProfitabilityReportView.total_revenue).label('total_revenue'),
-        func.sum(sqlalchemy_models.ProfitabilityReportView.total_cogs).label('total_cogs'),
-        func.sum(sqlalchemy_models.ProfitabilityReportView.gross_profit).label('total_gross_profit')
-    ).first()
-
-    total_revenue = float(totals.total_revenue or 0)
-    total_cogs = float(totals.total_cogs or 0)
-    total_gross_profit = float(totals.total_gross_profit or 0)
+    total_revenue = float(totals["total_revenue"] or 0)
+    total_cogs = float(totals["total_cogs"] or 0)
+    total_gross_profit = float(totals["total_gross_profit"] or 0)
 
     average_profit_margin = (total_gross_profit / total_revenue * 100) if total_revenue > 0 else 0.0
 
-    top_products_query = q.with_entities(
-        sqlalchemy_models.ProfitabilityReportView.product_name,
-        func.sum(sqlalchemy_models.ProfitabilityReportView.gross_profit).label('total_profit')
-    ).group_by(
-        sqlalchemy_models.ProfitabilityReportView.product_id,
-        sqlalchemy_models.ProfitabilityReportView.product_name
-    ).order_by(
-        func.sum(sqlalchemy_models.ProfitabilityReportView.gross_profit).desc()
-    ).limit(3).all()
+    top_products_query = await rollup.atop_products(db, window_start, window_end, limit=3)
 
     # Create a list of Pydantic models from the query result
     top_profitable_products_list = []
@@ -1,95 +1,69 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Header
+from fastapi.responses import StreamingResponse, JSONResponse
+from typing import List, Optional
 from datetime import datetime
-from sqlalchemy import or_, and_
-from database import db_dependency
+from pydantic import ValidationError
+from sqlalchemy import or_, and_, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload, joinedload, noload
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_db_dependency, async_read_db_dependency, async_consistent_read_db_dependency
 from models import sqlalchemy_models, request_models, response_models
+from services import pagination, catalog, export, rollup, search, archive, serialization, fieldsets, ledger, sale_queue, reservation, retry
 
 router = APIRouter(
     prefix="/sales",
     tags=["Sales"]
 )
 
-@router.post("/", response_model=response_models.Sale, status_code=status.HTTP_201_CREATED)
-def create_sale(sale: request_models.SaleCreate, db: db_dependency):
+def _items_loader(include_items: bool = True, model=sqlalchemy_models.SaleDB):
     """
-    Create a new sale with multiple items.
-    The total_amount is calculated by a database trigger.
+    Loading strategy for Sale.items on lists: one batched SELECT ... IN for the whole page,
+    or no item query at all for header-only table views.
     """
+    if include_items:
+        return selectinload(model.items)
+    return noload(model.items)
 
-    sale.payment_method = sale.payment_method.capitalize()
-    if sale.payment_method == 'Qr':
-        sale.payment_method = 'QR'
-    if sale.payment_method not in ['Cash', 'Card', 'QR']:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="วิธีการชำระเงินไม่ถูกต้อง")
-    # Create the sale record first, excluding items for now
-    sale_data = sale.model_dump(exclude={"items"})
-    
-    # Total_amount will be handled by existing trigger
-    sale_data["total_amount"] = 0  
-    
-    new_sale = sqlalchemy_models.SaleDB(**sale_data)
-    db.add(new_sale)
-    db.flush()  # Flush to get the new_sale.sale_id
-
-    # Process each item
-    for item in sale.items:
-        # 1. Fetch the product to validate it AND get its price
-        product = db.query(sqlalchemy_models.ProductDB).filter(
-            sqlalchemy_models.ProductDB.product_id == item.product_id
-        ).first()
-        if not product:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Product with ID {item.product_id} not found."
-            )
-        
-        # 2. Determine the unit price
-        item_unit_price = item.unit_price if item.unit_price is not None else product.price
-
-        # 3. Create the sale item with the correct price
-        sale_item = sqlalchemy_models.SaleItemDB(
-            sale_id=new_sale.sale_id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            unit_price=item_unit_price,
-            discount=item.discount
-        )
-        db.add(sale_item)
-        
-    db.commit()
-    db.refresh(new_sale)
-    return new_sale
+def _normalize_payment_method(payment_method: str):
+    """
+    Accept any casing of Cash, Card or QR; None when the method is not supported.
+    """
+    payment_method = payment_method.capitalize()
+    if payment_method == 'Qr':
+        payment_method = 'QR'
+    if payment_method not in ['Cash', 'Card', 'QR']:
+        return None
+    return payment_method
 
-@router.get("/", response_model=response_models.PaginatedResponse[response_models.Sale])
-def get_all_sales(
-    db: db_dependency,
-    search_params: request_models.SaleSearchParams = Depends()
-):
+def _sale_sort_keys(model=sqlalchemy_models.SaleDB):
     """
-    Retrieve all sales with pagination and search functionality.
-    
-    - **search**: Search in notes
-    - **payment_method**: Filter by payment method (Cash, Card, QR)
-    - **start_date/end_date**: Date range filtering (YYYY-MM-DD)
-    - **page**: Page number (starts from 1)
-    - **limit**: Items per page (max 100)
+    Sort keys for sale lists, ending with the primary key as tie-breaker.
     """
-    # Build base query
-    query = db.query(sqlalchemy_models.SaleDB)
-    
-    # Apply search filters
+    return [(model.sale_datetime, True), (model.sale_id, True)]
+
+# Column list of the ft_sale_notes n-gram index
+SALE_SEARCH_COLUMNS = (sqlalchemy_models.SaleDB.notes,)
+
+def _apply_sale_filters(query, search_params: request_models.SaleSearchParams, model=sqlalchemy_models.SaleDB):
+    """
+    Apply the sale search params (notes, payment method, date range) to a select() involving
+    SaleDB, or SaleHistoryView when the window reaches into the archived period.
+    """
+    # Apply search filters; the history view has no FULLTEXT index to match against
     if search_params.search:
-        search_term = f"%{search_params.search}%"
-        query = query.filter(sqlalchemy_models.SaleDB.notes.ilike(search_term))
+        if model is sqlalchemy_models.SaleDB:
+            query = query.filter(search.search_condition(SALE_SEARCH_COLUMNS, search_params.search))
+        else:
+            query = query.filter(search.like_condition((model.notes,), search_params.search))
     
     if search_params.payment_method:
-        query = query.filter(sqlalchemy_models.SaleDB.payment_method == search_params.payment_method)
+        query = query.filter(model.payment_method == search_params.payment_method)
     
     if search_params.start_date:
         try:
             start_date = datetime.strptime(search_params.start_date, "%Y-%m-%d").date()
-            query = query.filter(sqlalchemy_models.SaleDB.sale_datetime >= start_date)
+            query = query.filter(model.sale_datetime >= start_date)
         except ValueError:
             raise HTTPException(status_code=400, detail="รูปแบบวันที่ไม่ถูกต้อง ใช้ YYYY-MM-DD")
     
@@ -98,122 +72,432 @@ def get_all_sales(
             end_date = datetime.strptime(search_params.end_date, "%Y-%m-%d").date()
             # Add one day to include the entire end date
             end_date = datetime.combine(end_date, datetime.max.time())
-            query = query.filter(sqlalchemy_models.SaleDB.sale_datetime <= end_date)
+            query = query.filter(model.sale_datetime <= end_date)
         except ValueError:
             raise HTTPException(status_code=400, detail="รูปแบบวันที่ไม่ถูกต้อง ใช้ YYYY-MM-DD")
+
+    return query
+
+async def _get_sale_with_items(db: AsyncSession, sale_id: int):
+    """
+    Load one sale and its items with a single joined query, replacing any stale state in the session.
+    """
+    result = await db.execute(
+        select(sqlalchemy_models.SaleDB)
+        .options(joinedload(sqlalchemy_models.SaleDB.items))
+        .execution_options(populate_existing=True)
+        .filter(sqlalchemy_models.SaleDB.sale_id == sale_id)
+    )
+    return result.unique().scalars().first()
+
+@router.post(
+    "/",
+    response_model=response_models.Sale,
+    status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_202_ACCEPTED: {"model": response_models.QueuedSaleStatus}}
+)
+async def create_sale(
+    sale: request_models.SaleCreate,
+    db: async_db_dependency,
+    prefer: Optional[str] = Header(None, description="respond-async: queue the sale and answer 202 right away")
+):
+    """
+    Create a new sale with multiple items.
+    The total_amount, unit costs and stock movements are written set-based by services.ledger.
+    Answers 409 when a product has less stock on hand than the sale asks for (SALE_STOCK_CHECK).
+
+    With `Prefer: respond-async` and the sale queue enabled (SALE_QUEUE_DIR), the validated
+    sale is appended to the durable local log instead and the answer is 202 with a
+    provisional id; follow GET /sales/queued/{provisional_id} for the sale_id.
+    """
+
+    sale.payment_method = _normalize_payment_method(sale.payment_method)
+    if sale.payment_method is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="วิธีการชำระเงินไม่ถูกต้อง")
+
+    # 1. Validate every product and fetch default prices in one query
+    requested_ids = [item.product_id for item in sale.items]
+    prices = await catalog.afetch_product_prices(db, requested_ids)
+    missing_ids = catalog.missing_product_ids(requested_ids, prices)
+    if missing_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product with ID {', '.join(map(str, missing_ids))} not found."
+        )
+
+    demand = reservation.sale_demand(sale.items)
+    if prefer and "respond-async" in prefer.lower() and sale_queue.queue.enabled:
+        await reservation.acheck(db, demand)
+        # Freeze what the drain would otherwise take at insert time
+        if sale.sale_datetime is None:
+            sale.sale_datetime = datetime.now()
+        for item in sale.items:
+            if item.unit_price is None:
+                item.unit_price = float(prices[item.product_id])
+        provisional_id = await sale_queue.queue.append(sale)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"provisional_id": provisional_id, "status": "queued"},
+            headers={"Location": f"/sales/queued/{provisional_id}", "Preference-Applied": "respond-async"}
+        )
+
+    # 2. Lock the stock of the sold products, then insert the header, every line, the total
+    #    and the movements set-based. Rerun from the start on a deadlock.
+    async def insert():
+        await reservation.areserve(db, demand)
+        sale_id, = await ledger.ainsert_sales(db, [sale], prices)
+        if sale.items:
+            await rollup.arefresh(db, await rollup.asale_keys(db, [sale_id]))
+        await db.commit()
+        return sale_id
+
+    sale_id = await retry.arun_transaction(db, insert)
+    return await _get_sale_with_items(db, sale_id)
+
+# Longest accepted NDJSON line; keeps the read buffer bounded on malformed uploads
+BULK_MAX_LINE_BYTES = 1024 * 1024
+
+async def _iter_ndjson_lines(request: Request):
+    """
+    Yield (line_number, raw_line) from a streamed request body without reading it all into memory.
+    Blank lines are skipped but still counted. A line longer than BULK_MAX_LINE_BYTES is
+    dropped up to its newline and yielded as (line_number, None), so the rest still runs.
+    """
+    buffer = b""
+    line_no = 0
+    oversized = False  # dropping the rest of an over-long line
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if oversized or len(line) > BULK_MAX_LINE_BYTES:
+                oversized = False
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+        if len(buffer) > BULK_MAX_LINE_BYTES:
+            oversized = True
+            buffer = b""
+    if oversized:
+        yield line_no + 1, None
+    elif buffer.strip():
+        yield line_no + 1, buffer
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, err['loc'])) or 'body'}: {err['msg']}" for err in exc.errors()
+    )
+
+async def _process_sale_chunk(db: AsyncSession, chunk: list) -> list:
+    """
+    Validate and insert one chunk of parsed records in a single transaction.
+    Products are resolved once for the whole chunk. If the transaction fails, the chunk is
+    replayed one record per transaction so only the offending records are reported as errors.
+    """
+    results = {}
+    ready = []
+
+    requested_ids = {item.product_id for _, sale in chunk if not isinstance(sale, str) for item in sale.items}
+    prices = await catalog.afetch_product_prices(db, requested_ids)
+
+    for line_no, sale in chunk:
+        if isinstance(sale, str):
+            results[line_no] = response_models.BulkSaleResult(line=line_no, error=sale)
+            continue
+        sale.payment_method = _normalize_payment_method(sale.payment_method)
+        if sale.payment_method is None:
+            results[line_no] = response_models.BulkSaleResult(line=line_no, error="วิธีการชำระเงินไม่ถูกต้อง")
+            continue
+        missing_ids = catalog.missing_product_ids([item.product_id for item in sale.items], prices)
+        if missing_ids:
+            results[line_no] = response_models.BulkSaleResult(
+                line=line_no, error=f"Product with ID {', '.join(map(str, missing_ids))} not found."
+            )
+            continue
+        ready.append((line_no, sale))
+
+    async def insert(batch):
+        # Stock is granted in line order; refused records are reported and not written
+        shortages = await reservation.areserve_many(db, [reservation.sale_demand(sale.items) for _, sale in batch])
+        accepted = [(line_no, sale) for (line_no, sale), short in zip(batch, shortages) if not short]
+        sale_ids = await ledger.ainsert_sales(db, [sale for _, sale in accepted], prices)
+        await rollup.arefresh(db, await rollup.asale_keys(db, sale_ids))
+        await db.commit()
+        inserted = {line_no: sale_id for (line_no, _), sale_id in zip(accepted, sale_ids)}
+        for (line_no, _), short in zip(batch, shortages):
+            results[line_no] = response_models.BulkSaleResult(
+                line=line_no, sale_id=inserted.get(line_no),
+                error=reservation.shortage_message(short) if short else None
+            )
+
+    try:
+        await retry.arun_transaction(db, lambda: insert(ready))
+    except SQLAlchemyError:
+        await db.rollback()
+        for record in ready:
+            try:
+                await retry.arun_transaction(db, lambda record=record: insert([record]))
+            except SQLAlchemyError as exc:
+                await db.rollback()
+                results[record[0]] = response_models.BulkSaleResult(line=record[0], error=str(getattr(exc, "orig", exc)))
+
+    return [results[line_no] for line_no, _ in chunk]
+
+@router.get("/queued/{provisional_id}", response_model=response_models.QueuedSaleStatus)
+async def get_queued_sale(provisional_id: str, db: async_db_dependency):
+    """
+    State of a sale submitted with Prefer: respond-async: queued (still in the local log),
+    created (with its sale_id) or rejected (with the error). Read from the primary, where
+    the drain worker commits.
+    """
+    queued = await sale_queue.astatus(db, provisional_id)
+    if queued is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการขายที่รอบันทึก")
+    return queued
+
+@router.post("/bulk", response_model=response_models.BulkSaleResponse)
+async def create_sales_bulk(
+    request: Request,
+    db: async_db_dependency,
+    chunk_size: int = Query(default=200, ge=1, le=5000, description="Sales committed per transaction")
+):
+    """
+    Ingest queued offline sales from an NDJSON body (one SaleCreate JSON object per line).
+
+    The body is read as a stream and processed `chunk_size` records per transaction, so memory
+    stays bounded by the chunk size. Invalid records are reported per line and do not abort
+    the rest of the upload.
+    """
+    results = []
+    chunk = []
+    async for line_no, line in _iter_ndjson_lines(request):
+        if line is None:
+            chunk.append((line_no, f"บรรทัดยาวเกิน {BULK_MAX_LINE_BYTES} ไบต์"))
+        else:
+            try:
+                chunk.append((line_no, request_models.SaleCreate.model_validate_json(line)))
+            except ValidationError as exc:
+                chunk.append((line_no, _validation_message(exc)))
+        if len(chunk) >= chunk_size:
+            results.extend(await _process_sale_chunk(db, chunk))
+            chunk = []
+    if chunk:
+        results.extend(await _process_sale_chunk(db, chunk))
+
+    created = sum(1 for result in results if result.sale_id is not None)
+    return response_models.BulkSaleResponse(created=created, failed=len(results) - created, results=results)
+
+@router.get("/", response_model=response_models.PaginatedResponse[response_models.Sale])
+async def get_all_sales(
+    db: async_consistent_read_db_dependency,
+    search_params: request_models.SaleSearchParams = Depends(),
+    accept: serialization.AcceptHeader = None
+):
+    """
+    Retrieve all sales with pagination and search functionality.
     
-    # Get total count before pagination
-    total = query.count()
-    
-    # Apply ordering and pagination
-    sales = query.order_by(sqlalchemy_models.SaleDB.sale_datetime.desc())\
-                 .offset((search_params.page - 1) * search_params.limit)\
-                 .limit(search_params.limit)\
-                 .all()
+    - **search**: Search in notes, ranked by relevance (keyset mode keeps date order)
+    - **payment_method**: Filter by payment method (Cash, Card, QR)
+    - **start_date/end_date**: Date range filtering (YYYY-MM-DD); archived sales are only
+      listed when the range reaches into the archived period
+    - **page**: Page number (starts from 1)
+    - **limit**: Items per page (max 100)
+    - **cursor**: Keyset paging, pass an empty value first and then `next_cursor`
+    - **include_total**: `true` (exact count), `false` (no count) or `estimated` (recent cached count)
+    - **include_items**: Set to false to return sale headers only
+    - **fields**: Comma-separated fields per sale, e.g. `sale_id,sale_datetime,total_amount`
+    """
+    # Build base query: the selected columns only, or whole sales when items are returned
+    model = sqlalchemy_models.SaleDB
+    if await archive.aneeds_history(db, search_params.start_date, search_params.end_date):
+        model = sqlalchemy_models.SaleHistoryView
+    fields = fieldsets.parse_fields(search_params.fields, response_models.Sale)
+    sort_keys = _sale_sort_keys(model)
+    columns = fieldsets.columns(model, fields, sort_keys)
+    if columns is not None:
+        query = select(*columns)
+    else:
+        query = select(model).options(
+            _items_loader(search_params.include_items, model), *fieldsets.load_only(model, fields, sort_keys)
+        )
+    query = _apply_sale_filters(query, search_params, model)
+
+    # Keyset mode: seek on (sale_datetime, sale_id) along idx_sale_datetime instead of OFFSET
+    if search_params.cursor is not None:
+        page = await pagination.akeyset_paginate(
+            db, query, sort_keys, search_params.cursor, search_params.limit, entities=columns is None
+        )
+        if not page.items and not search_params.cursor:
+            raise HTTPException(status_code=404, detail="ไม่พบรายการขาย")
+        return serialization.page_response(page, response_models.Sale, accept, fields)
+
+    # Apply ordering and pagination; the total follows include_total
+    order = pagination.order_by_keys(sort_keys)
+    if search_params.search and model is sqlalchemy_models.SaleDB:
+        rank = search.search_rank(SALE_SEARCH_COLUMNS, search_params.search)
+        if rank is not None:
+            order.insert(0, rank)
+    page = await pagination.aoffset_paginate(db, query, order, search_params, entities=columns is None)
     
-    if not sales and search_params.page == 1:
+    if not page.items and search_params.page == 1:
         raise HTTPException(status_code=404, detail="ไม่พบรายการขาย")
     
-    # Calculate pagination metadata
-    total_pages = (total + search_params.limit - 1) // search_params.limit
-    
-    return response_models.PaginatedResponse(
-        items=sales,
-        total=total,
-        page=search_params.page,
-        limit=search_params.limit,
-        total_pages=total_pages,
-        has_next=search_params.page < total_pages,
-        has_prev=search_params.page > 1
+    return serialization.page_response(page, response_models.Sale, accept, fields)
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_sales(
+    db: async_read_db_dependency,
+    search_params: request_models.SaleSearchParams = Depends(),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$", description="csv or ndjson")
+):
+    """
+    Stream every sale matching the /sales/ filters as CSV or NDJSON, one row per sale item
+    (or one row per sale with include_items=false). Rows come from one query over a
+    server-side cursor; page, limit and cursor are ignored.
+    """
+    model, item_model = sqlalchemy_models.SaleDB, sqlalchemy_models.SaleItemDB
+    if await archive.aneeds_history(db, search_params.start_date, search_params.end_date):
+        model, item_model = sqlalchemy_models.SaleHistoryView, sqlalchemy_models.SaleItemHistoryView
+    sale = model.__table__
+    columns = list(sale.columns)
+    from_clause = sale
+    if search_params.include_items:
+        sale_item = item_model.__table__
+        columns += [column for column in sale_item.columns if column.name != "sale_id"]
+        from_clause = sale.outerjoin(sale_item, sale_item.c.sale_id == sale.c.sale_id)
+
+    query = _apply_sale_filters(select(*columns).select_from(from_clause), search_params, model)
+    order = pagination.order_by_keys(_sale_sort_keys(model))
+    if search_params.include_items:
+        order.append(item_model.sale_item_id)
+    return export.export_response(
+        export.astream_rows(query.order_by(*order), export_format, bind=db.bind),
+        export_format,
+        "sales"
     )
 
 @router.get("/{sale_id}", response_model=response_models.Sale)
-def get_sale_by_id(sale_id: int, db: db_dependency):
+async def get_sale_by_id(sale_id: int, db: async_consistent_read_db_dependency):
     """
-    Retrieve a single sale by its ID, including all its items.
+    Retrieve a single sale by its ID, including all its items. Archived sales are found too.
     """
-    sale = db.query(sqlalchemy_models.SaleDB).filter(
-        sqlalchemy_models.SaleDB.sale_id == sale_id
-    ).first()
+    sale = await _get_sale_with_items(db, sale_id)
+    if sale is None:
+        sale = await db.scalar(
+            select(sqlalchemy_models.SaleHistoryView)
+            .options(selectinload(sqlalchemy_models.SaleHistoryView.items))
+            .filter(sqlalchemy_models.SaleHistoryView.sale_id == sale_id)
+        )
     if sale is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการขายที่ต้องการ")
     return sale
 
 @router.patch("/{sale_id}", response_model=response_models.Sale)
-def update_sale(sale_id: int, sale_update: request_models.SaleUpdate, db: db_dependency):
+async def update_sale(sale_id: int, sale_update: request_models.SaleUpdate, db: async_db_dependency):
     """
     Update a sale's main information (e.g., payment method, notes).
     This does not update the sale items.
     """
-    sale = db.query(sqlalchemy_models.SaleDB).filter(
+    sale = await db.scalar(select(sqlalchemy_models.SaleDB).filter(
         sqlalchemy_models.SaleDB.sale_id == sale_id
-    ).first()
+    ))
     if sale is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการขายที่ต้องการ Update")
 
     update_data = sale_update.model_dump(exclude_unset=True)
+    moves_rollup = bool({"sale_datetime", "payment_method"} & update_data.keys())
+    if moves_rollup:
+        rollup_keys = await rollup.asale_keys(db, [sale_id])
     for key, value in update_data.items():
         setattr(sale, key, value)
+
+    if update_data.get("sale_datetime") is not None:
+        await db.flush()
+        sale_item_ids = select(sqlalchemy_models.SaleItemDB.sale_item_id).filter(
+            sqlalchemy_models.SaleItemDB.sale_id == sale_id
+        )
+        # Keep the SALE movements on the new date so the stock balance sees it
+        await db.execute(
+            update(sqlalchemy_models.InventoryMovementDB)
+            .filter(sqlalchemy_models.InventoryMovementDB.sale_item_id.in_(sale_item_ids))
+            .values(movement_date=sale.sale_datetime)
+            .execution_options(synchronize_session=False)
+        )
+        # Re-freeze the weighted average cost of each line at the new sale date
+        await db.execute(
+            update(sqlalchemy_models.SaleItemDB)
+            .filter(sqlalchemy_models.SaleItemDB.sale_id == sale_id)
+            .values(unit_cost=func.fn_avg_cost_at(
+                sqlalchemy_models.SaleItemDB.product_id, sale.sale_datetime
+            ))
+            .execution_options(synchronize_session=False)
+        )
+
+    if moves_rollup:
+        await db.flush()
+        await rollup.arefresh(db, rollup_keys | await rollup.asale_keys(db, [sale_id]))
         
-    db.commit()
-    db.refresh(sale)
-    return sale
+    await db.commit()
+    return await _get_sale_with_items(db, sale_id)
 
 @router.delete("/{sale_id}", status_code=status.HTTP_200_OK)
-def delete_sale(sale_id: int, db: db_dependency):
+async def delete_sale(sale_id: int, db: async_db_dependency):
     """
     Delete a sale and all its associated items.
     """
-    sale = db.query(sqlalchemy_models.SaleDB).filter(
+    sale = await db.scalar(select(sqlalchemy_models.SaleDB).filter(
         sqlalchemy_models.SaleDB.sale_id == sale_id
-    ).first()
+    ))
     if sale is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการขายที่ต้องการลบ")
 
+    rollup_keys = await rollup.asale_keys(db, [sale_id])
+
     # The database's ON DELETE CASCADE will handle deleting the sale items
-    db.delete(sale)
-    db.commit()
+    await db.delete(sale)
+    await db.flush()
+    await rollup.arefresh(db, rollup_keys)
+    await db.commit()
 
     return {"detail": f"รายการขาย ID {sale_id} และรายการสินค้าขายที่เกี่ยวข้องทั้งหมดได้ถูกลบแล้ว."}
 
 # Endpoints for Sale Items
 
 @router.get("/items/{sale_item_id}", response_model=response_models.SaleItem)
-def get_sale_items(sale_item_id: int, db: db_dependency):
+async def get_sale_items(sale_item_id: int, db: async_consistent_read_db_dependency):
     """
     Retrieve all items for a specific sale.
     """
-    items = db.query(sqlalchemy_models.SaleItemDB).filter(
+    items = await db.scalar(select(sqlalchemy_models.SaleItemDB).filter(
         sqlalchemy_models.SaleItemDB.sale_item_id == sale_item_id
-    ).first()
+    ))
     if not items:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการสินค้าสำหรับการขายนี้")
     return items
 
 @router.post("/{sale_id}/items", response_model=response_models.SaleItem, status_code=status.HTTP_201_CREATED)
-def add_sale_item(sale_id: int, item: request_models.SaleItemCreate, db: db_dependency):
+async def add_sale_item(sale_id: int, item: request_models.SaleItemCreate, db: async_db_dependency):
     """
     Add a new item to an existing sale.
     """
     # Ensure the sale exists
-    sale = db.query(sqlalchemy_models.SaleDB).filter(
+    sale = await db.scalar(select(sqlalchemy_models.SaleDB).filter(
         sqlalchemy_models.SaleDB.sale_id == sale_id
-    ).first()
+    ))
     if not sale:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการขายนี้")
     
-    # Ensure the product exists
-    product = db.query(sqlalchemy_models.ProductDB).filter(
-        sqlalchemy_models.ProductDB.product_id == item.product_id
-    ).first()
+    # Ensure the product exists (catalog cache)
+    product = (await catalog.afetch_products(db, [item.product_id])).get(item.product_id)
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"ไม่พบสินค้า ID {item.product_id}")
 
     # Prevent adding a duplicate product to the same sale
-    existing_item = db.query(sqlalchemy_models.SaleItemDB).filter(
+    existing_item = await db.scalar(select(sqlalchemy_models.SaleItemDB).filter(
         sqlalchemy_models.SaleItemDB.sale_id == sale_id,
         sqlalchemy_models.SaleItemDB.product_id == item.product_id
-    ).first()
+    ))
     if existing_item:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -221,75 +505,91 @@ def add_sale_item(sale_id: int, item: request_models.SaleItemCreate, db: db_depe
         )
     
     if item.unit_price is None:
-        item.unit_price = product.price
+        item.unit_price = product["price"]
 
-    new_item = sqlalchemy_models.SaleItemDB(
-        sale_id=sale_id,
-        **item.model_dump()
-    )
-    db.add(new_item)
-    # The database trigger will automatically update the sale's total_amount
-    db.commit()
-    db.refresh(new_item)
-    return new_item
+    # Read before the transaction: a retried attempt starts with the session expired
+    sale_date = sale.sale_datetime.date()
+    row = {"sale_id": sale_id, **item.model_dump()}
+
+    async def insert():
+        await reservation.areserve(db, {item.product_id: item.quantity})
+        # services.ledger also updates the sale's total_amount and writes the movement
+        sale_item_id = await ledger.ainsert_sale_item(db, row)
+        await rollup.arefresh(db, {(sale_date, item.product_id)})
+        await db.commit()
+        return sale_item_id
+
+    sale_item_id = await retry.arun_transaction(db, insert)
+    return await db.get(sqlalchemy_models.SaleItemDB, sale_item_id)
 
 @router.patch("/{sale_id}/items/{item_id}", response_model=response_models.SaleItem)
-def update_sale_item(sale_id: int, item_id: int, item_update: request_models.SaleItemUpdate, db: db_dependency):
+async def update_sale_item(sale_id: int, item_id: int, item_update: request_models.SaleItemUpdate, db: async_db_dependency):
     """
     Update a specific item in a sale.
     """
-    sale_item = db.query(sqlalchemy_models.SaleItemDB).filter(
+    sale_item = await db.scalar(select(sqlalchemy_models.SaleItemDB).filter(
         sqlalchemy_models.SaleItemDB.sale_item_id == item_id,
         sqlalchemy_models.SaleItemDB.sale_id == sale_id
-    ).first()
+    ))
     if sale_item is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการสินค้าขายนี้")
 
     # If product_id is being updated, validate it
     if item_update.product_id is not None and item_update.product_id != sale_item.product_id:
-        product = db.query(sqlalchemy_models.ProductDB).filter(
-            sqlalchemy_models.ProductDB.product_id == item_update.product_id
-        ).first()
-        if not product:
+        if not await catalog.afetch_products(db, [item_update.product_id]):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
                 detail=f"ไม่พบสินค้า ID {item_update.product_id} ที่ต้องการ Update."
             )
         # Check for duplicates
-        existing_item = db.query(sqlalchemy_models.SaleItemDB).filter(
+        existing_item = await db.scalar(select(sqlalchemy_models.SaleItemDB).filter(
             sqlalchemy_models.SaleItemDB.sale_id == sale_id,
             sqlalchemy_models.SaleItemDB.product_id == item_update.product_id,
             sqlalchemy_models.SaleItemDB.sale_item_id != item_id
-        ).first()
+        ))
         if existing_item:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"สินค้า ID {item_update.product_id} มีอยู่แล้วในรายการขายนี้"
             )
             
-    update_data = item_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(sale_item, key, value)
-        
-    # The database trigger will automatically update the sale's total_amount
-    db.commit()
-    db.refresh(sale_item)
+    values = item_update.model_dump(exclude_unset=True)
+
+    async def apply_update():
+        # Reload the line under a row lock: concurrent edits of it run one after the other
+        await db.refresh(sale_item, with_for_update=True)
+        product_id = values.get("product_id") or sale_item.product_id
+        quantity = values.get("quantity") or sale_item.quantity
+        # Only stock taken beyond what the line already holds needs to be on hand
+        extra = quantity - (sale_item.quantity if product_id == sale_item.product_id else 0)
+        if extra > 0:
+            await reservation.areserve(db, {product_id: extra})
+        rollup_keys = await rollup.asale_keys(db, [sale_id])
+        # services.ledger also adjusts the sale's total_amount and the line's movement
+        await ledger.aupdate_sale_item(db, sale_item, values)
+        await rollup.arefresh(db, rollup_keys | await rollup.asale_keys(db, [sale_id]))
+        await db.commit()
+
+    await retry.arun_transaction(db, apply_update)
+    await db.refresh(sale_item)
     return sale_item
 
 @router.delete("/{sale_id}/items/{item_id}", status_code=status.HTTP_200_OK)
-def delete_sale_item(sale_id: int, item_id: int, db: db_dependency):
+async def delete_sale_item(sale_id: int, item_id: int, db: async_db_dependency):
     """
     Delete a specific item from a sale.
     """
-    sale_item = db.query(sqlalchemy_models.SaleItemDB).filter(
+    sale_item = await db.scalar(select(sqlalchemy_models.SaleItemDB).filter(
         sqlalchemy_models.SaleItemDB.sale_item_id == item_id,
         sqlalchemy_models.SaleItemDB.sale_id == sale_id
-    ).first()
+    ))
     if sale_item is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ไม่พบรายการสินค้าขายที่ต้องการลบ.")
-        
-    db.delete(sale_item)
-    # The database trigger will automatically update the sale's total_amount
-    db.commit()
+
+    rollup_keys = await rollup.asale_keys(db, [sale_id])
+    # services.ledger also adjusts the sale's total_amount and removes the line's movement
+    await ledger.adelete_sale_item(db, sale_item)
+    await rollup.arefresh(db, rollup_keys)
+    await db.commit()
 
     return {"detail": f"สินค้า ID {item_id} ได้ถูกลบออกจากรายการขาย ID {sale_id}."}
\ No newline at end of file
@@ -1,78 +1,131 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from datetime import datetime
-from database import db_dependency
+from database import async_db_dependency, async_consistent_read_db_dependency
 from models import sqlalchemy_models, request_models, response_models
-from sqlalchemy import or_, and_
+from services import pagination, catalog, rollup, search, serialization, fieldsets, ledger, retry
+from sqlalchemy import and_, select
+from sqlalchemy.orm import selectinload, joinedload, noload
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(
     prefix="/stock-in",
     tags=["Stock In"]
 )
 
+def _items_loader(include_items: bool = True):
+    """
+    Loading strategy for StockIn.items on lists: one batched SELECT ... IN for the whole page,
+    or no item query at all for header-only table views.
+    """
+    if include_items:
+        return selectinload(sqlalchemy_models.StockInDB.items)
+    return noload(sqlalchemy_models.StockInDB.items)
+
+async def _get_stock_in_with_items(db: AsyncSession, stock_in_id: int):
+    """
+    Load one stock in record and its items with a single joined query, replacing any stale state in the session.
+    """
+    result = await db.execute(
+        select(sqlalchemy_models.StockInDB)
+        .options(joinedload(sqlalchemy_models.StockInDB.items))
+        .execution_options(populate_existing=True)
+        .filter(sqlalchemy_models.StockInDB.stock_in_id == stock_in_id)
+    )
+    return result.unique().scalars().first()
+
+async def _refresh_sale_rollup(db: AsyncSession, product_ids, stock_in_id: int = None, stock_in_date=None):
+    """
+    Stock-in item writes re-freeze the unit_cost of later sale lines (services.ledger, or
+    trg_before_stock_in_delete), so bring the affected sales_daily_rollup rows along. Pass stock_in_date when the
+    stock in record itself is being deleted.
+    """
+    await db.flush()
+    if stock_in_date is None:
+        stock_in_date = await db.scalar(select(sqlalchemy_models.StockInDB.stock_in_date).filter(
+            sqlalchemy_models.StockInDB.stock_in_id == stock_in_id
+        ))
+    await rollup.arefresh_from(db, product_ids, stock_in_date)
+
 @router.post("/", response_model=response_models.StockIn, status_code=status.HTTP_201_CREATED)
-def create_stock_in(stock_in: request_models.StockInCreate, db: db_dependency):
+async def create_stock_in(stock_in: request_models.StockInCreate, db: async_db_dependency):
     """
     Create a new stock in entry with multiple items.
     """
-    # Validate all products exist
-    for item in stock_in.items:
-        product = db.query(sqlalchemy_models.ProductDB).filter(
-            sqlalchemy_models.ProductDB.product_id == item.product_id
-        ).first()
-        if not product:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"ไม่พบสินค้า ID: {item.product_id}"
-            )
+    # Validate all products exist in one query and report every missing one
+    requested_ids = [item.product_id for item in stock_in.items]
+    found = await catalog.afetch_product_prices(db, requested_ids)
+    missing_ids = catalog.missing_product_ids(requested_ids, found)
+    if missing_ids:
+        raise HTTPException(
+            status_code=404, 
+            detail=f"ไม่พบสินค้า ID: {', '.join(map(str, missing_ids))}"
+        )
     
     # Create stock_in record using request model
     stock_in_data = stock_in.model_dump(exclude={"items"})
-    stock_in_data["total_cost"] = 0  # Will be calculated by database trigger
-    
-    new_stock_in = sqlalchemy_models.StockInDB(**stock_in_data)
-    db.add(new_stock_in)
-    db.flush()  # Get the stock_in_id without committing
-    
-    # Create stock_in items
-    for item in stock_in.items:
-        stock_in_item = sqlalchemy_models.StockInItemDB(
-            stock_in_id=new_stock_in.stock_in_id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            unit_cost=item.unit_cost
-        )
-        db.add(stock_in_item)
+    stock_in_data["total_cost"] = 0  # Added up from the lines by ledger.ainsert_stock_in_items
     
-    db.commit()
-    db.refresh(new_stock_in)
-    return new_stock_in
+    async def insert():
+        new_stock_in = sqlalchemy_models.StockInDB(**stock_in_data)
+        db.add(new_stock_in)
+        await db.flush()  # Get the stock_in_id without committing
+
+        # Create all stock_in items, the total and the movements set-based
+        if stock_in.items:
+            await ledger.ainsert_stock_in_items(db, new_stock_in.stock_in_id, [
+                item.model_dump() for item in stock_in.items
+            ])
+            await _refresh_sale_rollup(db, requested_ids, stock_in_id=new_stock_in.stock_in_id)
+
+        await db.commit()
+        return new_stock_in.stock_in_id
+
+    # The movements lock the same balance rows as concurrent sales; rerun on a deadlock
+    stock_in_id = await retry.arun_transaction(db, insert)
+    return await _get_stock_in_with_items(db, stock_in_id)
 
 @router.get("/", response_model=response_models.PaginatedResponse[response_models.StockIn])
-def get_all_stock_in(
-    db: db_dependency,
-    search_params: request_models.StockInSearchParams = Depends()
+async def get_all_stock_in(
+    db: async_consistent_read_db_dependency,
+    search_params: request_models.StockInSearchParams = Depends(),
+    accept: serialization.AcceptHeader = None
 ):
     """
     Retrieve all stock in records with pagination and search functionality.
     
-    - **search**: Search in ref no. or notes
+    - **search**: Search in ref no. or notes, ranked by relevance (keyset mode keeps date order)
     - **start_date/end_date**: Date range filtering (YYYY-MM-DD)
     - **page**: Page number (starts from 1)
     - **limit**: Items per page (max 100)
+    - **cursor**: Keyset paging, pass an empty value first and then `next_cursor`
+    - **include_total**: `true` (exact count), `false` (no count) or `estimated` (recent cached count)
+    - **include_items**: Set to false to return stock in headers only
+    - **fields**: Comma-separated fields per record, e.g. `stock_in_id,ref_no,total_cost`
     """
-    # Build base query
-    query = db.query(sqlalchemy_models.StockInDB)
+    # Sort keys, ending with the primary key as tie-breaker
+    sort_keys = [
+        (sqlalchemy_models.StockInDB.stock_in_date, True),
+        (sqlalchemy_models.StockInDB.stock_in_id, True)
+    ]
+
+    # Build base query: the selected columns only, or whole records when items are returned
+    fields = fieldsets.parse_fields(search_params.fields, response_models.StockIn)
+    columns = fieldsets.columns(sqlalchemy_models.StockInDB, fields, sort_keys)
+    if columns is not None:
+        query = select(*columns)
+    else:
+        query = select(sqlalchemy_models.StockInDB).options(
+            _items_loader(search_params.include_items),
+            *fieldsets.load_only(sqlalchemy_models.StockInDB, fields, sort_keys)
+        )
     
-    # Apply search filters
+    # Apply search filters through the ft_stock_in_ref_notes n-gram index
+    search_columns = (sqlalchemy_models.StockInDB.ref_no, sqlalchemy_models.StockInDB.notes)
+    rank = None
     if search_params.search:
-        search_term = f"%{search_params.search}%"
-        query = query.filter(
-            or_(
-                sqlalchemy_models.StockInDB.ref_no.ilike(search_term),
-                sqlalchemy_models.StockInDB.notes.ilike(search_term)
-            )
-        )
+        query = query.filter(search.search_condition(search_columns, search_params.search))
+        rank = search.search_rank(search_columns, search_params.search)
     
     if search_params.start_date:
         try:
@@ -90,51 +143,44 @@ def get_all_stock_in(
         except ValueError:
             raise HTTPException(status_code=400, detail="รูปแบบวันที่ไม่ถูกต้อง ใช้ YYYY-MM-DD")
     
-    # Get total count before pagination
-    total = query.count()
-    
-    # Apply ordering and pagination
-    stock_ins = query.order_by(sqlalchemy_models.StockInDB.stock_in_date.desc())\
-                    .offset((search_params.page - 1) * search_params.limit)\
-                    .limit(search_params.limit)\
-                    .all()
+    # Keyset mode: seek on (stock_in_date, stock_in_id) along idx_stock_in_date instead of OFFSET
+    if search_params.cursor is not None:
+        page = await pagination.akeyset_paginate(
+            db, query, sort_keys, search_params.cursor, search_params.limit, entities=columns is None
+        )
+        if not page.items and not search_params.cursor:
+            raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าเข้า")
+        return serialization.page_response(page, response_models.StockIn, accept, fields)
+
+    # Apply ordering and pagination; the total follows include_total
+    order = pagination.order_by_keys(sort_keys)
+    if rank is not None:
+        order.insert(0, rank)
+    page = await pagination.aoffset_paginate(db, query, order, search_params, entities=columns is None)
     
-    if not stock_ins and search_params.page == 1:
+    if not page.items and search_params.page == 1:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าเข้า")
     
-    # Calculate pagination metadata
-    total_pages = (total + search_params.limit - 1) // search_params.limit
-    
-    return response_models.PaginatedResponse(
-        items=stock_ins,
-        total=total,
-        page=search_params.page,
-        limit=search_params.limit,
-        total_pages=total_pages,
-        has_next=search_params.page < total_pages,
-        has_prev=search_params.page > 1
-    )
+    return serialization.page_response(page, response_models.StockIn, accept, fields)
 
 @router.get("/{stock_in_id}", response_model=response_models.StockIn)
-def get_stock_in_by_id(stock_in_id: int, db: db_dependency):
+async def get_stock_in_by_id(stock_in_id: int, db: async_consistent_read_db_dependency):
     """
     Retrieve a single stock in record by its ID with all items.
     """
-    stock_in = db.query(sqlalchemy_models.StockInDB).filter(
-        sqlalchemy_models.StockInDB.stock_in_id == stock_in_id
-    ).first()
+    stock_in = await _get_stock_in_with_items(db, stock_in_id)
     if stock_in is None:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าเข้าที่ต้องการ")
     return stock_in
 
 @router.patch("/{stock_in_id}", response_model=response_models.StockIn)
-def update_stock_in(stock_in_id: int, stock_in_update: request_models.StockInUpdate, db: db_dependency):
+async def update_stock_in(stock_in_id: int, stock_in_update: request_models.StockInUpdate, db: async_db_dependency):
     """
     Update a stock in record's basic information (not items).
     """
-    stock_in = db.query(sqlalchemy_models.StockInDB).filter(
+    stock_in = await db.scalar(select(sqlalchemy_models.StockInDB).filter(
         sqlalchemy_models.StockInDB.stock_in_id == stock_in_id
-    ).first()
+    ))
     if stock_in is None:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าเข้าที่ต้องการ Update")
     
@@ -143,147 +189,156 @@ def update_stock_in(stock_in_id: int, stock_in_update: request_models.StockInUpd
     for key, value in update_data.items():
         setattr(stock_in, key, value)
     
-    db.commit()
-    db.refresh(stock_in)
-    return stock_in
+    await db.commit()
+    return await _get_stock_in_with_items(db, stock_in_id)
 
 @router.delete("/{stock_in_id}", status_code=status.HTTP_200_OK)
-def delete_stock_in(stock_in_id: int, db: db_dependency):
+async def delete_stock_in(stock_in_id: int, db: async_db_dependency):
     """
     Delete a stock in record and all its items.
     """
-    stock_in = db.query(sqlalchemy_models.StockInDB).filter(
+    stock_in = await db.scalar(select(sqlalchemy_models.StockInDB).filter(
         sqlalchemy_models.StockInDB.stock_in_id == stock_in_id
-    ).first()
+    ))
     if stock_in is None:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าเข้าที่ต้องการลบ")
         
+    product_ids = (await db.scalars(select(sqlalchemy_models.StockInItemDB.product_id).filter(
+        sqlalchemy_models.StockInItemDB.stock_in_id == stock_in_id
+    ))).all()
+
     # Due to CASCADE DELETE, stock_in_items will be automatically deleted
-    db.delete(stock_in)
-    db.commit()
+    await db.delete(stock_in)
+    await _refresh_sale_rollup(db, product_ids, stock_in_date=stock_in.stock_in_date)
+    await db.commit()
     
     return {"detail": f"รายการสินค้าเข้า ID: {stock_in_id} และรายการสินค้าเข้าที่เกี่ยวข้องถูกลบเรียบร้อยแล้ว"}
 
 # Stock In Items endpoints
 @router.get("/items/{stock_in_item_id}", response_model=response_models.StockInItem)
-def get_stock_in_items(stock_in_item_id: int, db: db_dependency):
+async def get_stock_in_items(stock_in_item_id: int, db: async_consistent_read_db_dependency):
     """
     Retrieve specific item in stock in record.
     """
     # Check if stock_in_item exists
-    stock_in_item = db.query(sqlalchemy_models.StockInItemDB).filter(
+    stock_in_item = await db.scalar(select(sqlalchemy_models.StockInItemDB).filter(
         sqlalchemy_models.StockInItemDB.stock_in_item_id == stock_in_item_id
-    ).first()
+    ))
     if stock_in_item is None:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าเข้า")
     
-    items = db.query(sqlalchemy_models.StockInItemDB).filter(
+    items = await db.scalar(select(sqlalchemy_models.StockInItemDB).filter(
         sqlalchemy_models.StockInItemDB.stock_in_item_id == stock_in_item_id
-    ).first()
+    ))
     return items
 
 @router.post("/{stock_in_id}/items", response_model=response_models.StockInItem, status_code=status.HTTP_201_CREATED)
-def add_stock_in_item(stock_in_id: int, item: request_models.StockInItemCreate, db: db_dependency):
+async def add_stock_in_item(stock_in_id: int, item: request_models.StockInItemCreate, db: async_db_dependency):
     """
     Add a new item to an existing stock in record.
     """
     # Check if stock_in exists
-    stock_in = db.query(sqlalchemy_models.StockInDB).filter(
+    stock_in = await db.scalar(select(sqlalchemy_models.StockInDB).filter(
         sqlalchemy_models.StockInDB.stock_in_id == stock_in_id
-    ).first()
+    ))
     if stock_in is None:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าเข้า")
     
-    # Check if product exists
-    product = db.query(sqlalchemy_models.ProductDB).filter(
-        sqlalchemy_models.ProductDB.product_id == item.product_id
-    ).first()
-    if not product:
+    # Check if product exists (catalog cache)
+    if not await catalog.afetch_products(db, [item.product_id]):
         raise HTTPException(status_code=404, detail=f"ไม่พบสินค้า ID: {item.product_id}")
     
     # Check if item already exists for this product in this stock_in
-    existing_item = db.query(sqlalchemy_models.StockInItemDB).filter(
+    existing_item = await db.scalar(select(sqlalchemy_models.StockInItemDB).filter(
         sqlalchemy_models.StockInItemDB.stock_in_id == stock_in_id,
         sqlalchemy_models.StockInItemDB.product_id == item.product_id
-    ).first()
+    ))
     if existing_item:
         raise HTTPException(
             status_code=400, 
             detail=f"สินค้า ID {item.product_id} มีอยู่แล้วในรายการสินค้าเข้านี้"
         )
     
-    # Create new stock_in item
-    new_item = sqlalchemy_models.StockInItemDB(
-        stock_in_id=stock_in_id,
-        **item.model_dump()
-    )
-    db.add(new_item)
-    
-    # Database trigger will recalculate total_cost automatically
-    db.commit()
-    db.refresh(new_item)
-    return new_item
+    # Read before the transaction: a retried attempt starts with the session expired
+    stock_in_date = stock_in.stock_in_date
+
+    async def insert():
+        # Create new stock_in item; services.ledger also updates total_cost and writes the movement
+        stock_in_item_id = await ledger.ainsert_stock_in_item(db, stock_in_id, item.model_dump())
+        await _refresh_sale_rollup(db, [item.product_id], stock_in_date=stock_in_date)
+        await db.commit()
+        return stock_in_item_id
+
+    # The movement locks the same balance rows as concurrent sales; rerun on a deadlock
+    stock_in_item_id = await retry.arun_transaction(db, insert)
+    return await db.get(sqlalchemy_models.StockInItemDB, stock_in_item_id)
 
 @router.patch("/{stock_in_id}/items/{item_id}", response_model=response_models.StockInItem)
-def update_stock_in_item(stock_in_id: int, item_id: int, item_update: request_models.StockInItemUpdate, db: db_dependency):
+async def update_stock_in_item(stock_in_id: int, item_id: int, item_update: request_models.StockInItemUpdate, db: async_db_dependency):
     """
     Update a specific stock in item.
     """
     # Check if stock_in item exists and belongs to the stock_in
-    stock_in_item = db.query(sqlalchemy_models.StockInItemDB).filter(
+    stock_in_item = await db.scalar(select(sqlalchemy_models.StockInItemDB).filter(
         sqlalchemy_models.StockInItemDB.stock_in_item_id == item_id,
         sqlalchemy_models.StockInItemDB.stock_in_id == stock_in_id
-    ).first()
+    ))
     if stock_in_item is None:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าในการนำเข้า")
     
     # If product_id is being updated, validate it exists and not duplicate
     if item_update.product_id is not None and item_update.product_id != stock_in_item.product_id:
-        product = db.query(sqlalchemy_models.ProductDB).filter(
-            sqlalchemy_models.ProductDB.product_id == item_update.product_id
-        ).first()
-        if not product:
+        if not await catalog.afetch_products(db, [item_update.product_id]):
             raise HTTPException(status_code=404, detail=f"ไม่พบสินค้า ID: {item_update.product_id}")
         
         # Check for duplicate product in same stock_in (excluding current item)
-        existing_item = db.query(sqlalchemy_models.StockInItemDB).filter(
+        existing_item = await db.scalar(select(sqlalchemy_models.StockInItemDB).filter(
             sqlalchemy_models.StockInItemDB.stock_in_id == stock_in_id,
             sqlalchemy_models.StockInItemDB.product_id == item_update.product_id,
             sqlalchemy_models.StockInItemDB.stock_in_item_id != item_id
-        ).first()
+        ))
         if existing_item:
             raise HTTPException(
                 status_code=400, 
                 detail=f"สินค้า ID {item_update.product_id} มีอยู่แล้วในรายการสินค้าเข้านี้"
             )
     
-    # Update item
     update_data = item_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(stock_in_item, key, value)
-    
-    # Database trigger will recalculate total_cost automatically
-    db.commit()
-    db.refresh(stock_in_item)
+
+    async def apply_update():
+        # Reload the line under a row lock: a retried attempt starts with the session expired
+        await db.refresh(stock_in_item, with_for_update=True)
+        # Update item; services.ledger also adjusts total_cost and the movement
+        product_ids = {stock_in_item.product_id, update_data.get("product_id") or stock_in_item.product_id}
+        await ledger.aupdate_stock_in_item(db, stock_in_item, update_data)
+        await _refresh_sale_rollup(db, product_ids, stock_in_id=stock_in_id)
+        await db.commit()
+
+    await retry.arun_transaction(db, apply_update)
+    await db.refresh(stock_in_item)
     return stock_in_item
 
 @router.delete("/{stock_in_id}/items/{item_id}", status_code=status.HTTP_200_OK)
-def delete_stock_in_item(stock_in_id: int, item_id: int, db: db_dependency):
+async def delete_stock_in_item(stock_in_id: int, item_id: int, db: async_db_dependency):
     """
     Delete a specific stock in item.
     """
     # Check if stock_in item exists and belongs to the stock_in
-    stock_in_item = db.query(sqlalchemy_models.StockInItemDB).filter(
+    stock_in_item = await db.scalar(select(sqlalchemy_models.StockInItemDB).filter(
         sqlalchemy_models.StockInItemDB.stock_in_item_id == item_id,
         sqlalchemy_models.StockInItemDB.stock_in_id == stock_in_id
-    ).first()
+    ))
     if stock_in_item is None:
         raise HTTPException(status_code=404, detail="ไม่พบรายการสินค้าในการนำเข้า")
     
-    # Delete the item
-    db.delete(stock_in_item)
-    
-    # Database trigger will recalculate total_cost automatically
-    db.commit()
+    async def remove():
+        # Reload the line under a row lock: a retried attempt starts with the session expired
+        await db.refresh(stock_in_item, with_for_update=True)
+        # Delete the item; services.ledger also adjusts total_cost and removes the movement
+        await ledger.adelete_stock_in_item(db, stock_in_item)
+        await _refresh_sale_rollup(db, [stock_in_item.product_id], stock_in_id=stock_in_id)
+        await db.commit()
+
+    await retry.arun_transaction(db, remove)
     
     return {"detail": f"รายการสินค้า ID {item_id} ถูกลบออกจากการนำเข้า ID {stock_in_id}เรียบร้อยแล้ว"}
@@ -0,0 +1,189 @@
+import logging
+from datetime import date, datetime
+from sqlalchemy import select, insert, delete, update, func, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import DBAPIError
+from config import ARCHIVE_BATCH_SIZE
+from database import engine
+from models import sqlalchemy_models
+
+logger = logging.getLogger(__name__)
+
+State = sqlalchemy_models.ArchiveStateDB
+SaleDB = sqlalchemy_models.SaleDB
+SaleItemDB = sqlalchemy_models.SaleItemDB
+MovementDB = sqlalchemy_models.InventoryMovementDB
+SaleArchive = sqlalchemy_models.SaleArchiveDB
+SaleItemArchive = sqlalchemy_models.SaleItemArchiveDB
+MovementArchive = sqlalchemy_models.InventoryMovementArchiveDB
+
+# Monthly RANGE COLUMNS partitioned tables, see mysql/init.sql
+PARTITIONED_TABLES = ("sale_archive", "sale_item_archive", "inventory_movement_archive")
+
+# MESSAGE_TEXT signalled by sp_assert_not_archived
+ARCHIVED_PERIOD_SIGNAL = "ARCHIVED_PERIOD"
+
+# ---- Reading ---------------------------------------------------------------
+
+def _parse_day(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+def reaches_archive(archived_before: datetime, start_date: str = None, end_date: str = None) -> bool:
+    """
+    Whether a YYYY-MM-DD date window reaches into the archived period. Invalid dates are
+    ignored here and left for the endpoint's own filters to reject.
+    """
+    return any(
+        day is not None and day < archived_before
+        for day in (_parse_day(start_date), _parse_day(end_date))
+    )
+
+def needs_history(db: Session, start_date: str = None, end_date: str = None) -> bool:
+    """
+    True when a list must read the v_*_history views instead of the hot tables. Lists without
+    a date window only read the hot tables, so the archive boundary is not even looked up.
+    """
+    if not start_date and not end_date:
+        return False
+    return reaches_archive(db.scalar(select(State.archived_before)), start_date, end_date)
+
+async def aneeds_history(db: AsyncSession, start_date: str = None, end_date: str = None) -> bool:
+    """
+    Async variant of needs_history.
+    """
+    if not start_date and not end_date:
+        return False
+    return reaches_archive(await db.scalar(select(State.archived_before)), start_date, end_date)
+
+def is_archived_period_error(exc: DBAPIError) -> bool:
+    """
+    Whether a database error is sp_assert_not_archived rejecting a write into the archived period.
+    """
+    return ARCHIVED_PERIOD_SIGNAL in str(exc.orig)
+
+# ---- Archiving -------------------------------------------------------------
+
+def _month_start(day: date) -> datetime:
+    return datetime(day.year, day.month, 1)
+
+def _next_month(moment: datetime) -> datetime:
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+def _ensure_partitions(connection: Connection, first: datetime, until: datetime):
+    """
+    Give every archive table one partition per month in [first, until) by splitting pmax.
+    Nothing has been archived at or after the current boundary, so pmax is empty and the
+    REORGANIZE only rewrites metadata.
+    """
+    for table in PARTITIONED_TABLES:
+        existing = set(connection.scalars(text(
+            "SELECT partition_name FROM information_schema.partitions "
+            "WHERE table_schema = DATABASE() AND table_name = :table"
+        ), {"table": table}))
+        month = _month_start(first)
+        while month < until:
+            name = f"p{month:%Y%m}"
+            if name not in existing:
+                connection.execute(text(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ("
+                    f"PARTITION {name} VALUES LESS THAN ('{_next_month(month):%Y-%m-%d %H:%M:%S}'), "
+                    f"PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+                ))
+            month = _next_month(month)
+
+def _archive_sale_batch(connection: Connection, before: datetime, batch_size: int) -> int:
+    """
+    Move one batch of sales dated before `before`, with their items and movements, in one
+    short transaction. Returns the number of sales moved.
+    """
+    with connection.begin():
+        sale_ids = list(connection.scalars(
+            select(SaleDB.sale_id).where(SaleDB.sale_datetime < before)
+            .order_by(SaleDB.sale_id).limit(batch_size).with_for_update()
+        ))
+        if not sale_ids:
+            return 0
+        item_ids = select(SaleItemDB.sale_item_id).where(SaleItemDB.sale_id.in_(sale_ids))
+        connection.execute(insert(SaleArchive).from_select(
+            [column.name for column in SaleDB.__table__.columns],
+            select(*SaleDB.__table__.columns).where(SaleDB.sale_id.in_(sale_ids))
+        ))
+        item_columns = [column.name for column in SaleItemDB.__table__.columns]
+        connection.execute(insert(SaleItemArchive).from_select(
+            item_columns + ["sale_datetime"],
+            select(*SaleItemDB.__table__.columns, SaleDB.sale_datetime)
+            .join(SaleDB, SaleDB.sale_id == SaleItemDB.sale_id)
+            .where(SaleItemDB.sale_id.in_(sale_ids))
+        ))
+        connection.execute(insert(MovementArchive).from_select(
+            [column.name for column in MovementDB.__table__.columns],
+            select(*MovementDB.__table__.columns).where(MovementDB.sale_item_id.in_(item_ids))
+        ))
+        # Movements first: with @archiving set their delete trigger leaves the balance alone,
+        # and the sale delete then cascades to sale_item without touching inventory_movement
+        connection.execute(delete(MovementDB).where(MovementDB.sale_item_id.in_(item_ids)))
+        connection.execute(delete(SaleDB).where(SaleDB.sale_id.in_(sale_ids)))
+    return len(sale_ids)
+
+def _archive_movement_batch(connection: Connection, before: datetime, batch_size: int) -> int:
+    """
+    Move one batch of the remaining (stock-in and opening) movements dated before `before`.
+    """
+    with connection.begin():
+        movement_ids = list(connection.scalars(
+            select(MovementDB.movement_id).where(MovementDB.movement_date < before)
+            .order_by(MovementDB.movement_id).limit(batch_size).with_for_update()
+        ))
+        if not movement_ids:
+            return 0
+        connection.execute(insert(MovementArchive).from_select(
+            [column.name for column in MovementDB.__table__.columns],
+            select(*MovementDB.__table__.columns).where(MovementDB.movement_id.in_(movement_ids))
+        ))
+        connection.execute(delete(MovementDB).where(MovementDB.movement_id.in_(movement_ids)))
+    return len(movement_ids)
+
+def archive_before(before: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> dict:
+    """
+    Move sales, sale items and movements dated before the first day of `before`'s month
+    into the archive tables.
+
+    The boundary in archive_state is raised first, so from then on the database rejects
+    writes into the period and date windows reaching it read the history views (which still
+    see rows not moved yet). Rows then move in batches of `batch_size`, one short
+    transaction each, so no lock is held for long. Safe to rerun after an interruption.
+    """
+    before = _month_start(before)
+    moved = {"sales": 0, "movements": 0}
+    with engine.connect() as connection:
+        with connection.begin():
+            current = connection.scalar(select(State.archived_before).with_for_update())
+            if before > current:
+                connection.execute(update(State).where(State.id == 1).values(archived_before=before))
+            else:
+                before = current
+            first = min(filter(None, (
+                connection.scalar(select(func.min(SaleDB.sale_datetime))),
+                connection.scalar(select(func.min(MovementDB.movement_date))),
+            )), default=None)
+        if first is None or first >= before:
+            return moved
+
+        _ensure_partitions(connection, first, before)
+        connection.execute(text("SET @archiving = 1"))
+        connection.commit()
+        try:
+            while count := _archive_sale_batch(connection, before, batch_size):
+                moved["sales"] += count
+                logger.info("Archived %s sales", moved["sales"])
+            while count := _archive_movement_batch(connection, before, batch_size):
+                moved["movements"] += count
+        finally:
+            connection.execute(text("SET @archiving = NULL"))
+            connection.commit()
+    return moved
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL
+from models import sqlalchemy_models
+
+class ProductCache:
+    """
+    In-process LRU cache of products with TTL expiry, keyed by product_id with a SKU index.
+
+    Entries are plain dicts shaped like response_models.Product (price kept as Decimal).
+    The product and category routers drop what they change after their commit; the TTL
+    bounds how stale an entry can get from writes made by other processes. Products that
+    do not exist are not cached, so a new product is found on its first lookup.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # product_id -> (expires_at, product)
+        self._by_sku = {}              # sku -> product_id
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped on every invalidation
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _drop(self, product_id):
+        _, product = self._entries.pop(product_id)
+        if product["sku"] is not None and self._by_sku.get(product["sku"]) == product_id:
+            del self._by_sku[product["sku"]]
+
+    def _get(self, product_id):
+        entry = self._entries.get(product_id)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(product_id)
+                self.hits += 1
+                return entry[1]
+            self._drop(product_id)
+            self.expirations += 1
+        self.misses += 1
+        return None
+
+    def get_many(self, product_ids) -> dict:
+        """
+        The fresh cached products among product_ids, by product_id.
+        """
+        with self._lock:
+            products = {product_id: self._get(product_id) for product_id in product_ids}
+            return {product_id: product for product_id, product in products.items() if product is not None}
+
+    def get_by_sku(self, sku: str):
+        with self._lock:
+            product_id = self._by_sku.get(sku)
+            if product_id is None:
+                self.misses += 1
+                return None
+            return self._get(product_id)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, products, generation: int):
+        """
+        Store products read when generation() returned `generation`. If any invalidation
+        happened in the meantime they may already be stale, so they are not stored.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            expires_at = time.monotonic() + self.ttl
+            for product in products:
+                if product["product_id"] in self._entries:
+                    self._drop(product["product_id"])
+                self._entries[product["product_id"]] = (expires_at, product)
+                if product["sku"] is not None:
+                    self._by_sku[product["sku"]] = product["product_id"]
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, product_id: int = None, sku: str = None):
+        """
+        Drop a product after a committed write, by its id and by the SKU it had before.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in (product_id, self._by_sku.get(sku) if sku else None):
+                if key in self._entries:
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_sku.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+product_cache = ProductCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
+
+def _products_statement(condition):
+    return select(
+        sqlalchemy_models.ProductDB.product_id,
+        sqlalchemy_models.ProductDB.name,
+        sqlalchemy_models.ProductDB.sku,
+        sqlalchemy_models.ProductDB.price,
+        sqlalchemy_models.ProductDB.reorder_level,
+        sqlalchemy_models.ProductDB.category_id,
+        sqlalchemy_models.CategoryDB.name.label("category_name")
+    ).outerjoin(
+        sqlalchemy_models.CategoryDB,
+        sqlalchemy_models.CategoryDB.category_id == sqlalchemy_models.ProductDB.category_id
+    ).filter(condition)
+
+def _product(row) -> dict:
+    return {
+        "product_id": row.product_id,
+        "name": row.name,
+        "category": {"category_id": row.category_id, "name": row.category_name} if row.category_id is not None else None,
+        "sku": row.sku,
+        "price": row.price,
+        "reorder_level": row.reorder_level,
+    }
+
+def fetch_products(db: Session, product_ids) -> dict:
+    """
+    Resolve a set of product IDs to products (dicts), from the cache and one IN (...) query
+    for the rest. Product IDs that do not exist are simply absent from the result.
+    """
+    product_ids = set(product_ids)
+    products = product_cache.get_many(product_ids)
+    missing = product_ids - products.keys()
+    if missing:
+        generation = product_cache.generation()
+        rows = db.execute(_products_statement(sqlalchemy_models.ProductDB.product_id.in_(missing))).all()
+        loaded = [_product(row) for row in rows]
+        product_cache.put(loaded, generation)
+        products.update((product["product_id"], product) for product in loaded)
+    return products
+
+async def afetch_products(db: AsyncSession, product_ids) -> dict:
+    """
+    Async variant of fetch_products.
+    """
+    product_ids = set(product_ids)
+    products = product_cache.get_many(product_ids)
+    missing = product_ids - products.keys()
+    if missing:
+        generation = product_cache.generation()
+        rows = (await db.execute(_products_statement(sqlalchemy_models.ProductDB.product_id.in_(missing)))).all()
+        loaded = [_product(row) for row in rows]
+        product_cache.put(loaded, generation)
+        products.update((product["product_id"], product) for product in loaded)
+    return products
+
+def fetch_product_prices(db: Session, product_ids) -> dict:
+    """
+    Resolve a set of product IDs to their default prices (through fetch_products).
+    Product IDs that do not exist are simply absent from the result.
+    """
+    return {product_id: product["price"] for product_id, product in fetch_products(db, product_ids).items()}
+
+async def afetch_product_prices(db: AsyncSession, product_ids) -> dict:
+    """
+    Async variant of fetch_product_prices.
+    """
+    return {product_id: product["price"] for product_id, product in (await afetch_products(db, product_ids)).items()}
+
+def fetch_product_by_sku(db: Session, sku: str):
+    """
+    The product (dict) with this SKU, from the cache's SKU index or one indexed query; None if there is none.
+    """
+    product = product_cache.get_by_sku(sku)
+    if product is None:
+        generation = product_cache.generation()
+        row = db.execute(_products_statement(sqlalchemy_models.ProductDB.sku == sku)).first()
+        if row is None:
+            return None
+        product = _product(row)
+        product_cache.put([product], generation)
+    return product
+
+def missing_product_ids(product_ids, found: dict) -> list:
+    """
+    Every requested product ID that was not found, sorted for a stable error message.
+    """
+    return sorted(set(product_ids) - found.keys())
@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.responses import StreamingResponse
+from database import SessionLocal, AsyncSessionLocal
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _encode_header(columns, fmt: str) -> str:
+    if fmt != "csv":
+        return ""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(columns)
+    return buffer.getvalue()
+
+def _encode_batch(columns, rows, fmt: str) -> str:
+    """
+    Encode one batch of result rows as CSV lines or NDJSON objects.
+    """
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [value.isoformat() if isinstance(value, (datetime, date)) else value for value in row]
+            for row in rows
+        )
+        return buffer.getvalue()
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+def stream_rows(statement, fmt: str, bind=None):
+    """
+    Stream a Core select() through a sync session with a server-side cursor.
+    The session is opened by the generator itself, so it lives exactly as long as the response body.
+    Pass the routed session's bind (db.get_bind()) to read from the engine read routing picked.
+    """
+    with SessionLocal(bind=bind) if bind is not None else SessionLocal() as db:
+        result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        yield _encode_header(columns, fmt)
+        for rows in result.partitions():
+            yield _encode_batch(columns, rows, fmt)
+
+async def astream_rows(statement, fmt: str, bind=None):
+    """
+    Async variant of stream_rows, using AsyncSession.stream(); `bind` is the routed
+    AsyncSession's bind (db.bind).
+    """
+    async with AsyncSessionLocal(bind=bind) if bind is not None else AsyncSessionLocal() as db:
+        result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        yield _encode_header(columns, fmt)
+        async for rows in result.partitions():
+            yield _encode_batch(columns, rows, fmt)
+
+def export_response(body, fmt: str, filename: str) -> StreamingResponse:
+    """
+    Wrap a stream_rows/astream_rows generator in a downloadable StreamingResponse.
+    """
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
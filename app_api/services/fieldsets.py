@@ -0,0 +1,53 @@
+from fastapi import HTTPException, status
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only as _load_only
+
+# Sparse fieldsets (`fields=name,price` on list and report endpoints).
+# A selection of plain columns is read with a narrowed SELECT list into Row tuples, with no
+# ORM identity map or attribute tracking. A selection that includes a relationship (sale or
+# stock in items, a product's category) still loads entities, narrowed with load_only.
+# Either way the sort key columns are read too, since keyset cursors are built from them.
+
+def parse_fields(fields: str, response_model: type):
+    """
+    The requested field names in response model order, or None when `fields` is not given.
+    """
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(response_model.model_fields)
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"fields ไม่ถูกต้อง ฟิลด์ที่เลือกได้คือ: {', '.join(response_model.model_fields)}"
+        )
+    return tuple(name for name in response_model.model_fields if name in requested)
+
+def _relationships(model) -> set:
+    return set(inspect(model).mapper.relationships.keys())
+
+def _column_names(model, fields, keys) -> list:
+    names = [name for name in fields if name not in _relationships(model)]
+    for column, _ in keys:
+        if column.key not in names:
+            names.append(column.key)
+    return names
+
+def columns(model, fields, keys=()):
+    """
+    Columns to select for a fields= selection made only of plain columns, or None when
+    the whole entity (or a relationship) has to be loaded. `model` may be a mapped class
+    or an aliased one; `keys` are the (column, descending) sort keys of the list.
+    """
+    if fields is None or _relationships(model) & set(fields):
+        return None
+    return [getattr(model, name) for name in _column_names(model, fields, keys)]
+
+def load_only(model, fields, keys=()) -> list:
+    """
+    Loader options narrowing an entity load to the selected columns (plus the primary key
+    and sort keys); empty when no selection was made.
+    """
+    if fields is None:
+        return []
+    return [_load_only(*(getattr(model, name) for name in _column_names(model, fields, keys)))]
@@ -0,0 +1,286 @@
+from sqlalchemy import select, insert, update, delete, func, text, literal, null
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import sqlalchemy_models
+
+# Set-based write path for sale and stock in lines.
+# The per-row sale_item / stock_in_item triggers (retired in 009_set_based_writes.sql) updated
+# the header row and inserted one movement for every line, so a 200-line sale updated its
+# sale row 200 times while holding its lock. Here a batch of lines costs a fixed number of
+# statements: one INSERT of the lines (unit_cost frozen inline), one UPDATE of the header
+# totals and one INSERT ... SELECT of the movements. The inventory_movement triggers still
+# maintain product_stock_balance, snapshots and the archived-period check.
+#
+# Movements are inserted in product_id order, so their triggers update the balance rows in
+# the same order as services.reservation locks them and concurrent writers cannot deadlock
+# on them.
+#
+# The arithmetic is the triggers': each line adds ROUND(amount, 2) to its header, as storing
+# `total + amount` into DECIMAL(10,2) did, and edits adjust by `- old + new` in one step.
+
+SaleDB = sqlalchemy_models.SaleDB
+SaleItemDB = sqlalchemy_models.SaleItemDB
+StockInDB = sqlalchemy_models.StockInDB
+StockInItemDB = sqlalchemy_models.StockInItemDB
+MovementDB = sqlalchemy_models.InventoryMovementDB
+BalanceDB = sqlalchemy_models.ProductStockBalanceDB
+
+_MOVEMENT_COLUMNS = [
+    MovementDB.product_id, MovementDB.movement_type, MovementDB.quantity, MovementDB.unit_cost,
+    MovementDB.sale_price, MovementDB.sale_item_id, MovementDB.stock_in_item_id, MovementDB.movement_date
+]
+
+def _sale_price(item=SaleItemDB):
+    return item.unit_price * (1 - item.discount)
+
+def _sale_amount(item=SaleItemDB):
+    return item.quantity * _sale_price(item)
+
+def _stock_in_amount(item=StockInItemDB):
+    return item.quantity * item.unit_cost
+
+def _sale_datetime_of(sale_id):
+    return select(SaleDB.sale_datetime).filter(SaleDB.sale_id == sale_id).scalar_subquery()
+
+def _stock_in_date_of(stock_in_id):
+    return select(StockInDB.stock_in_date).filter(StockInDB.stock_in_id == stock_in_id).scalar_subquery()
+
+async def _assert_not_archived(db: AsyncSession, stock_in_id: int):
+    """
+    sp_assert_not_archived for a stock in, before its lines change. Archived lines have no
+    movement left in inventory_movement whose trigger would check it.
+    """
+    stock_in_date = await db.scalar(select(StockInDB.stock_in_date).filter(StockInDB.stock_in_id == stock_in_id))
+    await db.execute(text("CALL sp_assert_not_archived(:at)"), {"at": stock_in_date})
+
+# ---- Sales -----------------------------------------------------------------
+
+def _sale_item_rows(sale_id: int, items, prices: dict) -> list:
+    """
+    Rows for a multi-row sale_item INSERT, falling back to the product price when unit_price is omitted.
+    """
+    return [
+        {
+            "sale_id": sale_id,
+            "product_id": item.product_id,
+            "quantity": item.quantity,
+            "unit_price": item.unit_price if item.unit_price is not None else prices[item.product_id],
+            "discount": item.discount
+        }
+        for item in items
+    ]
+
+async def ainsert_sales(db: AsyncSession, sales: list, prices: dict) -> list:
+    """
+    Insert validated SaleCreate requests: headers one by one (for their IDs), then the lines
+    of all of them together, with Core statements only (no ORM objects kept in the session).
+    `prices` maps product_id -> default unit price. Returns the new sale IDs in order.
+    """
+    sale_ids = []
+    rows = []
+    for sale in sales:
+        sale_data = sale.model_dump(exclude={"items"}, exclude_none=True)
+        sale_data["total_amount"] = 0  # Added up from the lines by ainsert_sale_items
+        result = await db.execute(insert(SaleDB).values(**sale_data))
+        sale_ids.append(result.inserted_primary_key[0])
+        rows += _sale_item_rows(sale_ids[-1], sale.items, prices)
+    await ainsert_sale_items(db, rows)
+    return sale_ids
+
+async def ainsert_sale_items(db: AsyncSession, rows: list):
+    """
+    Insert the lines (dicts of sale_id, product_id, quantity, unit_price, discount) of any
+    number of newly created sales with one statement each for the lines, the header totals
+    and the movements. Each line's unit_cost is frozen at its sale's date.
+    """
+    if not rows:
+        return
+    await db.execute(insert(SaleItemDB).values([
+        {**row, "unit_cost": func.fn_avg_cost_at(row["product_id"], _sale_datetime_of(row["sale_id"]))}
+        for row in rows
+    ]))
+    await _aapply_new_sale_items(db, SaleItemDB.sale_id.in_({row["sale_id"] for row in rows}))
+
+async def ainsert_sale_item(db: AsyncSession, row: dict) -> int:
+    """
+    Insert one line into an existing sale; returns its sale_item_id.
+    """
+    result = await db.execute(insert(SaleItemDB).values(
+        **row, unit_cost=func.fn_avg_cost_at(row["product_id"], _sale_datetime_of(row["sale_id"]))
+    ))
+    sale_item_id = result.inserted_primary_key[0]
+    await _aapply_new_sale_items(db, SaleItemDB.sale_item_id == sale_item_id)
+    return sale_item_id
+
+async def _aapply_new_sale_items(db: AsyncSession, lines):
+    """
+    Header totals and SALE movements for the freshly inserted lines matching `lines`.
+    """
+    totals = select(
+        SaleItemDB.sale_id, func.sum(func.round(_sale_amount(), 2)).label("amount")
+    ).filter(lines).group_by(SaleItemDB.sale_id).subquery()
+    await db.execute(
+        update(SaleDB)
+        .where(SaleDB.sale_id == totals.c.sale_id)
+        .values(total_amount=SaleDB.total_amount + totals.c.amount)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(insert(MovementDB).from_select(_MOVEMENT_COLUMNS, select(
+        SaleItemDB.product_id, literal("SALE"), -SaleItemDB.quantity, null(),
+        _sale_price(), SaleItemDB.sale_item_id, null(), SaleDB.sale_datetime
+    ).join(SaleDB, SaleDB.sale_id == SaleItemDB.sale_id).filter(lines).order_by(SaleItemDB.product_id)))
+
+async def aupdate_sale_item(db: AsyncSession, sale_item, values: dict):
+    """
+    Apply `values` to a loaded sale line: re-freeze its cost when it moves to another product,
+    adjust the sale total and update its movement.
+    """
+    values = {key: value for key, value in values.items() if getattr(sale_item, key) != value}
+    if not values:
+        return
+    if "product_id" in values:
+        values["unit_cost"] = func.fn_avg_cost_at(values["product_id"], _sale_datetime_of(sale_item.sale_id))
+    old_amount = sale_item.quantity * sale_item.unit_price * (1 - sale_item.discount)
+
+    await db.execute(
+        update(SaleItemDB).filter(SaleItemDB.sale_item_id == sale_item.sale_item_id)
+        .values(**values).execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(SaleDB)
+        .where(SaleDB.sale_id == SaleItemDB.sale_id, SaleItemDB.sale_item_id == sale_item.sale_item_id)
+        .values(total_amount=SaleDB.total_amount - old_amount + _sale_amount())
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(MovementDB)
+        .where(MovementDB.sale_item_id == SaleItemDB.sale_item_id, SaleItemDB.sale_item_id == sale_item.sale_item_id)
+        .values(quantity=-SaleItemDB.quantity, sale_price=_sale_price(), product_id=SaleItemDB.product_id)
+        .execution_options(synchronize_session=False)
+    )
+
+async def adelete_sale_item(db: AsyncSession, sale_item):
+    """
+    Delete a loaded sale line with its movement, taking its amount off the sale total.
+    """
+    await db.execute(
+        update(SaleDB)
+        .where(SaleDB.sale_id == SaleItemDB.sale_id, SaleItemDB.sale_item_id == sale_item.sale_item_id)
+        .values(total_amount=SaleDB.total_amount - _sale_amount())
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(delete(MovementDB).filter(MovementDB.sale_item_id == sale_item.sale_item_id))
+    await db.execute(delete(SaleItemDB).filter(SaleItemDB.sale_item_id == sale_item.sale_item_id))
+
+# ---- Stock in --------------------------------------------------------------
+
+async def ainsert_stock_in_items(db: AsyncSession, stock_in_id: int, rows: list):
+    """
+    Insert stock in lines (dicts of product_id, quantity, unit_cost) with one statement each
+    for the lines, the header total and the movements, then re-freeze later sale costs.
+    """
+    if not rows:
+        return
+    await db.execute(insert(StockInItemDB), [{**row, "stock_in_id": stock_in_id} for row in rows])
+    await _aapply_new_stock_in_items(db, StockInItemDB.stock_in_id == stock_in_id)
+    await arefreeze_sale_costs(db, {row["product_id"] for row in rows}, _stock_in_date_of(stock_in_id))
+
+async def ainsert_stock_in_item(db: AsyncSession, stock_in_id: int, row: dict) -> int:
+    """
+    Insert one line into an existing stock in; returns its stock_in_item_id.
+    """
+    result = await db.execute(insert(StockInItemDB).values(**row, stock_in_id=stock_in_id))
+    stock_in_item_id = result.inserted_primary_key[0]
+    await _aapply_new_stock_in_items(db, StockInItemDB.stock_in_item_id == stock_in_item_id)
+    await arefreeze_sale_costs(db, {row["product_id"]}, _stock_in_date_of(stock_in_id))
+    return stock_in_item_id
+
+async def _aapply_new_stock_in_items(db: AsyncSession, lines):
+    """
+    Header total and STOCK_IN movements for the freshly inserted lines matching `lines`.
+    """
+    totals = select(
+        StockInItemDB.stock_in_id, func.sum(_stock_in_amount()).label("amount")
+    ).filter(lines).group_by(StockInItemDB.stock_in_id).subquery()
+    await db.execute(
+        update(StockInDB)
+        .where(StockInDB.stock_in_id == totals.c.stock_in_id)
+        .values(total_cost=StockInDB.total_cost + totals.c.amount)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(insert(MovementDB).from_select(_MOVEMENT_COLUMNS, select(
+        StockInItemDB.product_id, literal("STOCK_IN"), StockInItemDB.quantity, StockInItemDB.unit_cost,
+        null(), null(), StockInItemDB.stock_in_item_id, StockInDB.stock_in_date
+    ).join(StockInDB, StockInDB.stock_in_id == StockInItemDB.stock_in_id).filter(lines).order_by(StockInItemDB.product_id)))
+
+async def aupdate_stock_in_item(db: AsyncSession, stock_in_item, values: dict):
+    """
+    Apply `values` to a loaded stock in line: adjust the stock in total, update its movement
+    and re-freeze the later sale costs of the product(s) involved.
+    """
+    await _assert_not_archived(db, stock_in_item.stock_in_id)
+    values = {key: value for key, value in values.items() if getattr(stock_in_item, key) != value}
+    if not values:
+        return
+    old_amount = stock_in_item.quantity * stock_in_item.unit_cost
+    product_ids = {stock_in_item.product_id, values.get("product_id", stock_in_item.product_id)}
+    line = StockInItemDB.stock_in_item_id == stock_in_item.stock_in_item_id
+
+    await db.execute(
+        update(StockInItemDB).filter(line).values(**values).execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(StockInDB)
+        .where(StockInDB.stock_in_id == StockInItemDB.stock_in_id, line)
+        .values(total_cost=StockInDB.total_cost - old_amount + _stock_in_amount())
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(MovementDB)
+        .where(MovementDB.stock_in_item_id == StockInItemDB.stock_in_item_id, line)
+        .values(
+            quantity=StockInItemDB.quantity, unit_cost=StockInItemDB.unit_cost,
+            product_id=StockInItemDB.product_id, movement_date=_stock_in_date_of(stock_in_item.stock_in_id)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await arefreeze_sale_costs(db, product_ids, _stock_in_date_of(stock_in_item.stock_in_id))
+
+async def adelete_stock_in_item(db: AsyncSession, stock_in_item):
+    """
+    Delete a loaded stock in line with its movement, taking its cost off the stock in total
+    and re-freezing the later sale costs of its product.
+    """
+    await _assert_not_archived(db, stock_in_item.stock_in_id)
+    line = StockInItemDB.stock_in_item_id == stock_in_item.stock_in_item_id
+    await db.execute(
+        update(StockInDB)
+        .where(StockInDB.stock_in_id == StockInItemDB.stock_in_id, line)
+        .values(total_cost=StockInDB.total_cost - _stock_in_amount())
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(delete(MovementDB).filter(MovementDB.stock_in_item_id == stock_in_item.stock_in_item_id))
+    await db.execute(delete(StockInItemDB).filter(line))
+    await arefreeze_sale_costs(db, {stock_in_item.product_id}, _stock_in_date_of(stock_in_item.stock_in_id))
+
+async def arefreeze_sale_costs(db: AsyncSession, product_ids, from_date):
+    """
+    sp_refreeze_sale_costs for several products in one UPDATE: re-freeze unit_cost on their
+    sale lines dated at or after `from_date` (a value or scalar subquery), skipping products
+    with no sale that late.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    await db.execute(
+        update(SaleItemDB)
+        .where(
+            SaleDB.sale_id == SaleItemDB.sale_id,
+            SaleItemDB.product_id.in_(product_ids),
+            SaleDB.sale_datetime >= from_date,
+            select(BalanceDB.last_sale_at).filter(
+                BalanceDB.product_id == SaleItemDB.product_id
+            ).scalar_subquery() >= from_date
+        )
+        .values(unit_cost=func.fn_avg_cost_at(SaleItemDB.product_id, SaleDB.sale_datetime))
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,206 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_, select, func
+from sqlalchemy.dialects import mysql
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import COUNT_CACHE_SIZE, COUNT_CACHE_TTL
+from models import response_models
+from services.report_cache import ResponseCache
+
+# Keyset ("cursor") pagination.
+# A cursor is an opaque token holding the sort key values of the last row on a page,
+# ending with a unique tie-breaker (the primary key). The next page seeks past those
+# values with a range condition the index can satisfy, instead of OFFSET skipping rows.
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+def encode_cursor(values) -> str:
+    """
+    Encode the sort key values of a row into an opaque cursor token.
+    """
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, expected_len: int) -> list:
+    """
+    Decode a cursor token back into sort key values.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != expected_len:
+            raise ValueError
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="cursor ไม่ถูกต้อง")
+
+def seek_condition(keys, values):
+    """
+    Build "row comes after values" for the given (column, descending) sort keys:
+    k1 > v1 OR (k1 = v1 AND k2 > v2) OR ... with < for descending keys.
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        after = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, after))
+    return or_(*clauses)
+
+def order_by_keys(keys):
+    return [column.desc() if descending else column.asc() for column, descending in keys]
+
+def apply_keyset(query, keys, cursor: str, limit: int):
+    """
+    Seek past the cursor and fetch one extra row to know whether a next page exists.
+    An empty cursor starts from the first row. Works on both ORM queries and select() statements.
+    """
+    if cursor:
+        query = query.filter(seek_condition(keys, decode_cursor(cursor, len(keys))))
+    return query.order_by(*order_by_keys(keys)).limit(limit + 1)
+
+def keyset_response(rows, keys, cursor: str, limit: int):
+    """
+    Build the PaginatedResponse for a keyset page from the limit+1 fetched rows.
+    """
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column, _ in keys])
+
+    return response_models.PaginatedResponse(
+        items=rows,
+        limit=limit,
+        has_next=has_next,
+        has_prev=bool(cursor),
+        next_cursor=next_cursor
+    )
+
+def keyset_paginate(query, keys, cursor: str, limit: int):
+    """
+    Run a keyset page on an ORM query. `keys` lists (column, descending) pairs and must
+    end with a unique column so that every row has a distinct position.
+    """
+    rows = apply_keyset(query, keys, cursor, limit).all()
+    return keyset_response(rows, keys, cursor, limit)
+
+def _fetch(result, entities: bool) -> list:
+    """
+    ORM entities for select(Model), Row tuples for a select() of columns.
+    """
+    return result.scalars().all() if entities else result.all()
+
+async def akeyset_paginate(db: AsyncSession, stmt, keys, cursor: str, limit: int, entities: bool = True):
+    """
+    Async variant of keyset_paginate for select() statements. Pass entities=False when
+    `stmt` selects columns rather than one entity.
+    """
+    result = await db.execute(apply_keyset(stmt, keys, cursor, limit))
+    return keyset_response(_fetch(result, entities), keys, cursor, limit)
+
+async def acount(db: AsyncSession, stmt) -> int:
+    """
+    Count the rows a select() statement would return, like Query.count().
+    """
+    return await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+
+# Offset ("page") pagination.
+# A page fetches limit+1 rows, so has_next never needs a COUNT. The total is optional:
+# include_total=false skips it, "estimated" reuses a recent COUNT for the same filters
+# (at most COUNT_CACHE_TTL seconds old), and a short page yields the exact total for free.
+
+count_cache = ResponseCache(maxsize=COUNT_CACHE_SIZE, ttl=COUNT_CACHE_TTL)
+
+def _count_key(stmt):
+    compiled = stmt.compile(dialect=mysql.dialect())
+    return (str(compiled), tuple(sorted((k, repr(v)) for k, v in compiled.params.items())))
+
+def _known_total(rows, params):
+    """
+    The exact total when this page is the last one, or None when more rows may follow.
+    """
+    if len(rows) <= params.limit and (rows or params.page == 1):
+        return (params.page - 1) * params.limit + len(rows)
+    return None
+
+def offset_response(rows, params, total=None, total_estimated: bool = False):
+    """
+    Build the PaginatedResponse for an offset page from the limit+1 fetched rows.
+    """
+    total_pages = None
+    if total is not None:
+        total_pages = (total + params.limit - 1) // params.limit
+    return response_models.PaginatedResponse(
+        items=rows[:params.limit],
+        total=total,
+        total_estimated=total_estimated,
+        page=params.page,
+        limit=params.limit,
+        total_pages=total_pages,
+        has_next=len(rows) > params.limit,
+        has_prev=params.page > 1
+    )
+
+def offset_paginate(query, order, params):
+    """
+    Run an offset page on an ORM query, counting only as much as params.include_total asks for.
+    """
+    rows = query.order_by(*order).offset((params.page - 1) * params.limit).limit(params.limit + 1).all()
+    total = _known_total(rows, params)
+    if total is not None or params.include_total == "false":
+        return offset_response(rows, params, total)
+
+    count_query = query.order_by(None)
+    if params.include_total == "estimated":
+        key = _count_key(count_query.statement)
+        hit, total = count_cache.get(key)
+        if not hit:
+            generation = count_cache.generation()
+            total = count_query.count()
+            count_cache.set(key, total, {}, generation)
+        return offset_response(rows, params, total, total_estimated=True)
+    return offset_response(rows, params, count_query.count())
+
+async def aoffset_paginate(db: AsyncSession, stmt, order, params, entities: bool = True):
+    """
+    Async variant of offset_paginate for select() statements. Pass entities=False when
+    `stmt` selects columns rather than one entity.
+    """
+    result = await db.execute(
+        stmt.order_by(*order).offset((params.page - 1) * params.limit).limit(params.limit + 1)
+    )
+    rows = _fetch(result, entities)
+    total = _known_total(rows, params)
+    if total is not None or params.include_total == "false":
+        return offset_response(rows, params, total)
+
+    if params.include_total == "estimated":
+        key = _count_key(stmt.order_by(None))
+        hit, total = count_cache.get(key)
+        if not hit:
+            generation = count_cache.generation()
+            total = await acount(db, stmt)
+            count_cache.set(key, total, {}, generation)
+        return offset_response(rows, params, total, total_estimated=True)
+    return offset_response(rows, params, await acount(db, stmt))
@@ -0,0 +1,113 @@
+import threading
+import time
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the checkout wait-time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class PoolStats:
+    """
+    Live counters for one connection pool: checkout wait-time histogram and
+    connection churn (opened / closed / invalidated), plus a snapshot of the
+    pool's own checked-out and overflow figures.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self._lock = threading.Lock()
+        self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)  # last slot is +Inf
+        self.wait_sum = 0.0
+        self.wait_count = 0
+        self.checkout_failures = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.connections_invalidated = 0
+
+    def observe_wait(self, seconds: float, failed: bool = False):
+        with self._lock:
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_counts[i] += 1
+                    break
+            else:
+                self.wait_counts[-1] += 1
+            self.wait_sum += seconds
+            self.wait_count += 1
+            if failed:
+                self.checkout_failures += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections_opened += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections_closed += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.connections_invalidated += 1
+
+    def attach(self, engine):
+        """
+        Listen for churn events on the engine's pool. Listening on the engine
+        (not the pool object) keeps the listeners across engine.dispose().
+        """
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        self.engine = engine
+        return self
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        with self._lock:
+            cumulative, buckets = 0, []
+            for bound, count in zip(list(WAIT_BUCKETS) + ["+Inf"], self.wait_counts):
+                cumulative += count
+                buckets.append({"le": bound, "count": cumulative})
+            return {
+                "name": self.name,
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow_in_use": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+                "checkout_wait_seconds": {
+                    "buckets": buckets,
+                    "sum": self.wait_sum,
+                    "count": self.wait_count,
+                },
+                "checkout_timeouts": self.checkout_failures,
+                "connections_opened": self.connections_opened,
+                "connections_closed": self.connections_closed,
+                "connections_invalidated": self.connections_invalidated,
+            }
+
+def instrumented_pool_class(base, stats: PoolStats):
+    """
+    Subclass a QueuePool-style class so every checkout records how long it waited
+    for a free connection. The stats object lives on the class, so the pool that
+    engine.dispose() recreates keeps reporting into it.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except Exception:
+            stats.observe_wait(time.perf_counter() - started, failed=True)
+            raise
+        stats.observe_wait(time.perf_counter() - started)
+        return connection
+
+    return type(f"Instrumented{base.__name__}", (base,), {"_do_get": _do_get, "stats": stats})
+
+# One entry per engine, read by the monitoring router
+registry = {}
+
+def register(name: str) -> PoolStats:
+    stats = PoolStats(name)
+    registry[name] = stats
+    return stats
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import threading
+import time
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from config import REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Read-your-writes: after a successful write request the API returns the primary's
+# executed GTID set in this header. A client that sends it back on a route that opted in
+# (database.consistent_read_db_dependency) is served by the replica only once the replica
+# has applied all of it (GTID_SUBSET), otherwise by the primary.
+CONSISTENCY_TOKEN_HEADER = "X-Consistency-Token"
+
+# Methods that never write; everything else gets a consistency token
+_READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_APPLIED_SQL = text("SELECT GTID_SUBSET(:token, @@GLOBAL.gtid_executed)")
+
+class ReplicaMonitor:
+    """
+    Tracks the replica's lag (Seconds_Behind_Source, checked every `interval` seconds by
+    run()) and counts where reads were routed, by reason.
+    """
+
+    def __init__(self, max_lag: float, interval: float):
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lag = None          # None: unknown or replication stopped
+        self.checked_at = None   # time.monotonic() of the last successful check
+        self._lock = threading.Lock()
+        self._routed = {}        # (target, reason) -> count
+
+    def usable(self) -> bool:
+        """
+        Whether reads may go to the replica: its last check is recent and within max_lag.
+        """
+        return (
+            self.lag is not None
+            and self.lag <= self.max_lag
+            and time.monotonic() - self.checked_at <= 3 * self.interval
+        )
+
+    def count(self, target: str, reason: str):
+        with self._lock:
+            self._routed[(target, reason)] = self._routed.get((target, reason), 0) + 1
+
+    async def run(self, engine):
+        """
+        Background task started with the app when a replica is configured.
+        """
+        was_usable = None
+        while True:
+            try:
+                async with engine.connect() as connection:
+                    status = (await connection.execute(text("SHOW REPLICA STATUS"))).mappings().first()
+                # A server that replicates from nothing is its own source (e.g. the primary
+                # itself as REPLICA_DB_HOST in development)
+                self.lag = 0 if status is None else status["Seconds_Behind_Source"]
+                self.checked_at = time.monotonic()
+            except Exception:
+                self.lag = None
+                logger.exception("Replica lag check failed")
+            usable = self.usable()
+            if usable != was_usable:
+                logger.info("Read replica %s (lag %s s)", "in use" if usable else "bypassed", self.lag)
+                was_usable = usable
+            await asyncio.sleep(self.interval)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routed = [
+                {"target": target, "reason": reason, "count": count}
+                for (target, reason), count in sorted(self._routed.items())
+            ]
+        return {
+            "max_lag_seconds": self.max_lag,
+            "lag_seconds": self.lag,
+            "usable": self.usable(),
+            "routed": routed,
+        }
+
+monitor = ReplicaMonitor(REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL)
+
+def has_applied(db, token: str) -> bool:
+    """
+    Whether the replica session `db` has applied every transaction in the GTID set `token`.
+    A malformed token counts as not applied.
+    """
+    try:
+        return bool(db.scalar(_APPLIED_SQL, {"token": token}))
+    except DBAPIError:
+        db.rollback()
+        return False
+
+async def ahas_applied(db, token: str) -> bool:
+    """
+    Async variant of has_applied.
+    """
+    try:
+        return bool(await db.scalar(_APPLIED_SQL, {"token": token}))
+    except DBAPIError:
+        await db.rollback()
+        return False
+
+class ConsistencyTokenMiddleware:
+    """
+    Pure ASGI middleware adding the primary's gtid_executed to the response headers of
+    successful write requests. Only installed when a replica is configured.
+    """
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in _READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            # The endpoint has committed by the time its response starts
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                try:
+                    async with self.engine.connect() as connection:
+                        gtids = await connection.scalar(text("SELECT @@GLOBAL.gtid_executed"))
+                except Exception:
+                    logger.exception("Could not read gtid_executed for the consistency token")
+                    gtids = None
+                if gtids:
+                    token = "".join(gtids.split())  # the server wraps long sets over lines
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (CONSISTENCY_TOKEN_HEADER.lower().encode(), token.encode())
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
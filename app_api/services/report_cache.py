@@ -0,0 +1,177 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from config import REPORT_CACHE_SIZE, REPORT_CACHE_TTL, REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL
+
+# session.info key for tables written in the current transaction
+_PENDING_WRITES = "report_cache_pending_writes"
+
+class ResponseCache:
+    """
+    In-process LRU cache for report responses with TTL expiry.
+
+    Every entry declares the tables (and optionally the columns) it was computed from.
+    Committed writes are reported through invalidate(), which drops only the entries
+    that depend on what changed. The cache is per worker process; the TTL bounds how
+    stale an entry can get from writes made by other processes.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, depends_on, value)
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped on every invalidation
+        self.invalidated_at = float("-inf")  # time.monotonic() of the last invalidation
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Return (True, value) on a fresh hit, (False, None) otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[2]
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def generation(self) -> int:
+        return self._generation
+
+    def set(self, key, value, depends_on: dict, generation: int):
+        """
+        Store a value computed when generation() returned `generation`. If any invalidation
+        happened in the meantime the value may already be stale, so it is not stored.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, depends_on, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, writes):
+        """
+        Drop entries affected by committed writes, given as (table, changed_columns) pairs.
+        changed_columns is None for inserts, deletes and statements without column detail.
+        """
+        with self._lock:
+            self._generation += 1
+            self.invalidated_at = time.monotonic()
+            stale = [
+                key for key, (_, depends_on, _) in self._entries.items()
+                if any(_affects(depends_on, table, columns) for table, columns in writes)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+def _affects(depends_on: dict, table: str, columns) -> bool:
+    if table not in depends_on:
+        return False
+    watched = depends_on[table]
+    return watched is None or columns is None or bool(watched & columns)
+
+report_cache = ResponseCache(maxsize=REPORT_CACHE_SIZE, ttl=REPORT_CACHE_TTL)
+
+def _replica_may_be_behind(db) -> bool:
+    """
+    Whether `db` reads a replica that may not have applied the latest invalidating write yet:
+    caching its result would outlive the invalidation.
+    """
+    return (
+        db is not None and db.info.get("replica", False)
+        and time.monotonic() - report_cache.invalidated_at < REPLICA_MAX_LAG + REPLICA_LAG_CHECK_INTERVAL
+    )
+
+def cached(name: str, depends_on: dict):
+    """
+    Cache an async report endpoint on its normalized query params (everything except `db`).
+
+    depends_on maps table name -> set of columns whose updates change the result, or None
+    for any change. An empty set means only inserts and deletes on that table matter.
+    List the source tables, not the trigger-maintained ones: writes to
+    product_stock_balance happen inside MySQL and are only visible as their causes.
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(**kwargs):
+            key = (name, tuple(sorted((k, v) for k, v in kwargs.items() if k != "db")))
+            hit, value = report_cache.get(key)
+            if hit:
+                return value
+            generation = report_cache.generation()
+            value = await endpoint(**kwargs)
+            if not _replica_may_be_behind(kwargs.get("db")):
+                report_cache.set(key, value, depends_on, generation)
+            return value
+        return wrapper
+    return decorator
+
+# Write tracking. Listening on the Session class covers the sync sessions and the
+# sync_session behind every AsyncSession.
+
+def _pending(session):
+    return session.info.setdefault(_PENDING_WRITES, [])
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session, flush_context):
+    pending = _pending(session)
+    for obj in session.new | session.deleted:
+        pending.append((obj.__table__.name, None))
+    for obj in session.dirty:
+        changed = {attr.key for attr in inspect(obj).attrs if attr.history.has_changes()}
+        if changed:
+            pending.append((obj.__table__.name, changed))
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _pending(orm_execute_state.session).append((table.name, None))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    writes = session.info.pop(_PENDING_WRITES, None)
+    if writes:
+        report_cache.invalidate(writes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_WRITES, None)
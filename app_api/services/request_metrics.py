@@ -0,0 +1,177 @@
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Label for requests that matched no route, so unknown paths cannot blow up the label set
+UNMATCHED_ROUTE = "<unmatched>"
+
+class _RequestTally:
+    """
+    SQL counters of the request in flight. Only the request's own task (and the threads
+    and greenlets it hands work to) touch it, so no lock is needed.
+    """
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+_current = ContextVar("request_metrics_tally", default=None)
+
+class _RouteSeries:
+    __slots__ = ("latency_counts", "latency_sum", "requests", "statements", "db_seconds")
+
+    def __init__(self):
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot is +Inf
+        self.latency_sum = 0.0
+        self.requests = {}  # status code -> count
+        self.statements = 0
+        self.db_seconds = 0.0
+
+class RequestMetrics:
+    """
+    Per route template (method + path template) latency histogram, request counts by status,
+    SQL statement count and cumulative time spent in cursor execution.
+
+    Recording costs one lock per request plus two perf_counter() calls per statement;
+    the Prometheus text is only built when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # (method, route) -> _RouteSeries
+
+    def observe(self, method: str, route: str, status: int, seconds: float, tally: _RequestTally):
+        with self._lock:
+            series = self._series.get((method, route))
+            if series is None:
+                series = self._series[(method, route)] = _RouteSeries()
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    series.latency_counts[i] += 1
+                    break
+            else:
+                series.latency_counts[-1] += 1
+            series.latency_sum += seconds
+            series.requests[status] = series.requests.get(status, 0) + 1
+            series.statements += tally.statements
+            series.db_seconds += tally.db_seconds
+
+    def render(self) -> list:
+        """
+        Prometheus text exposition lines for every recorded route.
+        """
+        with self._lock:
+            series = sorted(self._series.items())
+            lines = [
+                "# HELP http_request_duration_seconds Request latency by route template.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), s in series:
+                labels = f'method="{method}",route="{_escape(route)}"'
+                cumulative = 0
+                for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], s.latency_counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {s.latency_sum}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+            lines += [
+                "# HELP http_requests_total Requests by route template and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route), s in series:
+                for status, count in sorted(s.requests.items()):
+                    lines.append(
+                        f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}'
+                    )
+
+            lines += [
+                "# HELP db_statements_total SQL statements executed while serving the route.",
+                "# TYPE db_statements_total counter",
+            ]
+            for (method, route), s in series:
+                lines.append(f'db_statements_total{{method="{method}",route="{_escape(route)}"}} {s.statements}')
+
+            lines += [
+                "# HELP db_time_seconds_total Time spent in cursor execution while serving the route.",
+                "# TYPE db_time_seconds_total counter",
+            ]
+            for (method, route), s in series:
+                lines.append(f'db_time_seconds_total{{method="{method}",route="{_escape(route)}"}} {s.db_seconds}')
+            return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+request_metrics = RequestMetrics()
+
+# ---- SQLAlchemy cursor hooks -----------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("request_metrics_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tally = _current.get()
+    if tally is None:
+        return
+    started = conn.info.get("request_metrics_started")
+    if started:
+        tally.db_seconds += time.perf_counter() - started.pop()
+    tally.statements += 1
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not run for a failed statement; drop its start time
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("request_metrics_started"):
+        connection.info["request_metrics_started"].pop()
+
+def attach(engine):
+    """
+    Count statements and DB time of every cursor execution on `engine` (a sync Engine,
+    or AsyncEngine.sync_engine) against the request being served, if any.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+# ---- ASGI middleware -------------------------------------------------------
+
+class RequestMetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware task hop) timing each HTTP request until
+    its last body chunk is sent, so streamed exports are measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        tally = _RequestTally()
+        token = _current.set(tally)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            # FastAPI stores the matched APIRoute in the scope; its path is the template
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            request_metrics.observe(scope["method"], route, status_code, elapsed, tally)
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import random
+import threading
+from sqlalchemy.exc import SQLAlchemyError, DBAPIError
+from config import TX_RETRY_ATTEMPTS, TX_RETRY_BASE_DELAY
+
+logger = logging.getLogger(__name__)
+
+# MySQL errors after which the whole transaction can simply run again. InnoDB rolls back
+# the victim of a deadlock entirely; a lock wait timeout only the statement, so the
+# transaction is rolled back here before retrying.
+DEADLOCK = 1213
+LOCK_WAIT_TIMEOUT = 1205
+CONNECTION_ERRORS = {2002, 2003, 2006, 2013}
+_REASONS = {DEADLOCK: "deadlock", LOCK_WAIT_TIMEOUT: "lock_wait_timeout"}
+
+def _errno(exc: SQLAlchemyError):
+    args = getattr(getattr(exc, "orig", None), "args", ())
+    return args[0] if args else None
+
+def is_retryable(exc: SQLAlchemyError) -> bool:
+    """
+    Deadlock or lock wait timeout: the same transaction is likely to succeed when rerun.
+    """
+    return isinstance(exc, DBAPIError) and _errno(exc) in _REASONS
+
+def is_transient(exc: SQLAlchemyError) -> bool:
+    """
+    is_retryable, or the connection to the server was lost.
+    """
+    if not isinstance(exc, DBAPIError):
+        return False
+    return exc.connection_invalidated or _errno(exc) in _REASONS or _errno(exc) in CONNECTION_ERRORS
+
+class RetryStats:
+    """
+    Transactions rerun after a deadlock or lock wait timeout, and those that ran out of attempts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}   # (reason, outcome) -> count
+
+    def count(self, reason: str, outcome: str):
+        with self._lock:
+            self._counts[(reason, outcome)] = self._counts.get((reason, outcome), 0) + 1
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [
+                {"reason": reason, "outcome": outcome, "count": count}
+                for (reason, outcome), count in sorted(self._counts.items())
+            ]
+
+retry_stats = RetryStats()
+
+async def arun_transaction(db, work, attempts: int = TX_RETRY_ATTEMPTS, base_delay: float = TX_RETRY_BASE_DELAY):
+    """
+    Await `work()`, which runs one whole transaction on `db` including its commit, and run
+    it again after a deadlock or lock wait timeout, up to `attempts` times with jittered
+    exponential backoff (base_delay, 2 x base_delay, ...). Anything else propagates.
+    `work` must not keep state from a failed attempt: everything it wrote is rolled back.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await work()
+        except DBAPIError as exc:
+            if not is_retryable(exc):
+                raise
+            await db.rollback()
+            reason = _REASONS[_errno(exc)]
+            if attempt == attempts:
+                retry_stats.count(reason, "gave_up")
+                logger.warning("Transaction failed after %s attempts (%s)", attempts, reason)
+                raise
+            retry_stats.count(reason, "retried")
+            await asyncio.sleep(base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
@@ -0,0 +1,174 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select, insert, delete, func, and_, or_, tuple_, union_all, Date
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import sqlalchemy_models
+
+Rollup = sqlalchemy_models.SalesDailyRollupDB
+SaleDB = sqlalchemy_models.SaleDB
+SaleItemDB = sqlalchemy_models.SaleItemDB
+# Raw partial days may lie in the archived period; the date bounds prune the archive side
+ReportView = sqlalchemy_models.ProfitabilityReportHistoryView
+
+# Same line formulas as v_profitability_report
+_sale_date = func.date(SaleDB.sale_datetime, type_=Date)
+_revenue = SaleItemDB.quantity * SaleItemDB.unit_price * (1 - SaleItemDB.discount)
+_cogs = SaleItemDB.quantity * SaleItemDB.unit_cost
+
+_ROLLUP_COLUMNS = [
+    Rollup.sale_date, Rollup.product_id, Rollup.payment_method,
+    Rollup.line_count, Rollup.quantity, Rollup.revenue, Rollup.cogs, Rollup.gross_profit
+]
+
+def _aggregate_lines(*conditions):
+    return select(
+        _sale_date,
+        SaleItemDB.product_id,
+        SaleDB.payment_method,
+        func.count(),
+        func.sum(SaleItemDB.quantity),
+        func.sum(_revenue),
+        func.sum(_cogs),
+        func.sum(_revenue - _cogs)
+    ).select_from(SaleItemDB).join(
+        SaleDB, SaleDB.sale_id == SaleItemDB.sale_id
+    ).filter(*conditions).group_by(
+        _sale_date, SaleItemDB.product_id, SaleDB.payment_method
+    )
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+# ---- Maintenance, called inside the writing transaction -------------------
+
+async def asale_keys(db: AsyncSession, sale_ids) -> set:
+    """
+    The (sale_date, product_id) rollup keys currently covered by the lines of the given sales.
+    Call it before a change to capture the keys a sale leaves, and after flushing for the keys it enters.
+    """
+    sale_ids = set(sale_ids)
+    if not sale_ids:
+        return set()
+    rows = await db.execute(
+        select(_sale_date, SaleItemDB.product_id).distinct()
+        .join(SaleDB, SaleDB.sale_id == SaleItemDB.sale_id)
+        .filter(SaleItemDB.sale_id.in_(sale_ids))
+    )
+    return {(sale_date, product_id) for sale_date, product_id in rows}
+
+async def arefresh(db: AsyncSession, keys):
+    """
+    Recompute the rollup rows (every payment method) of the given (sale_date, product_id) keys
+    from the raw lines. Idempotent, so over-reporting keys only costs a little work.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    await db.execute(
+        delete(Rollup).where(tuple_(Rollup.sale_date, Rollup.product_id).in_(keys))
+    )
+    await db.execute(
+        insert(Rollup).from_select(_ROLLUP_COLUMNS, _aggregate_lines(
+            # The datetime bounds let MySQL range-scan idx_sale_datetime
+            SaleDB.sale_datetime >= _midnight(keys[0][0]),
+            SaleDB.sale_datetime < _midnight(keys[-1][0] + timedelta(days=1)),
+            tuple_(_sale_date, SaleItemDB.product_id).in_(keys)
+        ))
+    )
+
+async def arefresh_from(db: AsyncSession, product_ids, from_date):
+    """
+    Recompute every rollup row of the given products from `from_date` on. Used after stock-in
+    writes, which re-freeze the unit_cost of later sale lines.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    if isinstance(from_date, datetime):
+        from_date = from_date.date()
+    await db.execute(
+        delete(Rollup).where(Rollup.product_id.in_(product_ids), Rollup.sale_date >= from_date)
+    )
+    await db.execute(
+        insert(Rollup).from_select(_ROLLUP_COLUMNS, _aggregate_lines(
+            SaleItemDB.product_id.in_(product_ids),
+            SaleDB.sale_datetime >= _midnight(from_date)
+        ))
+    )
+
+# ---- Reading ---------------------------------------------------------------
+
+def _split_window(start: datetime = None, end: datetime = None):
+    """
+    Split [start, end) into whole days served by the rollup and at most two partial
+    days that must be read from the raw lines. Either bound may be None (open).
+    Returns (rollup_conditions or None when no whole day is covered, raw_conditions or None).
+    """
+    first_day = None
+    raw_ranges = []
+    if start is not None:
+        first_day = start.date()
+        if start.time() != time.min:
+            first_day += timedelta(days=1)
+    end_day = end.date() if end is not None else None
+
+    if first_day is not None and end_day is not None and first_day >= end_day:
+        return None, [and_(ReportView.sale_datetime >= start, ReportView.sale_datetime < end)]
+
+    rollup_conditions = []
+    if first_day is not None:
+        rollup_conditions.append(Rollup.sale_date >= first_day)
+        if start.time() != time.min:
+            raw_ranges.append(and_(ReportView.sale_datetime >= start, ReportView.sale_datetime < _midnight(first_day)))
+    if end_day is not None:
+        rollup_conditions.append(Rollup.sale_date < end_day)
+        if end.time() != time.min:
+            raw_ranges.append(and_(ReportView.sale_datetime >= _midnight(end_day), ReportView.sale_datetime < end))
+    return rollup_conditions, raw_ranges or None
+
+async def atotals(db: AsyncSession, start: datetime = None, end: datetime = None) -> dict:
+    """
+    Line count, revenue, COGS and gross profit of the sale lines in [start, end).
+    """
+    rollup_conditions, raw_conditions = _split_window(start, end)
+    parts = []
+    if rollup_conditions is not None:
+        parts.append(select(
+            func.sum(Rollup.line_count), func.sum(Rollup.revenue),
+            func.sum(Rollup.cogs), func.sum(Rollup.gross_profit)
+        ).filter(*rollup_conditions))
+    if raw_conditions is not None:
+        parts.append(select(
+            func.count(ReportView.sale_item_id), func.sum(ReportView.total_revenue),
+            func.sum(ReportView.total_cogs), func.sum(ReportView.gross_profit)
+        ).filter(or_(*raw_conditions)))
+
+    totals = {"total_sales": 0, "total_revenue": None, "total_cogs": None, "total_gross_profit": None}
+    for part in parts:
+        row = (await db.execute(part)).first()
+        for key, value in zip(totals, row):
+            if value is not None:
+                totals[key] = value if totals[key] is None else totals[key] + value
+    totals["total_sales"] = int(totals["total_sales"] or 0)
+    return totals
+
+async def atop_products(db: AsyncSession, start: datetime = None, end: datetime = None, limit: int = 3):
+    """
+    The products with the highest gross profit in [start, end), as (product_name, total_profit) rows.
+    """
+    rollup_conditions, raw_conditions = _split_window(start, end)
+    parts = []
+    if rollup_conditions is not None:
+        parts.append(select(Rollup.product_id, Rollup.gross_profit).filter(*rollup_conditions))
+    if raw_conditions is not None:
+        parts.append(select(ReportView.product_id, ReportView.gross_profit).filter(or_(*raw_conditions)))
+    profits = (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+
+    product = sqlalchemy_models.ProductDB
+    total_profit = func.sum(profits.c.gross_profit)
+    return (await db.execute(
+        select(product.name.label("product_name"), total_profit.label("total_profit"))
+        .join(profits, profits.c.product_id == product.product_id)
+        .group_by(product.product_id, product.name)
+        .order_by(total_profit.desc())
+        .limit(limit)
+    )).all()
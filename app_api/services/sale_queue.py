@@ -0,0 +1,442 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import SQLAlchemyError
+from config import (
+    SALE_QUEUE_DIR, SALE_QUEUE_FSYNC_INTERVAL, SALE_QUEUE_BATCH_SIZE,
+    SALE_QUEUE_SEGMENT_BYTES, SALE_QUEUE_RETRY_INTERVAL
+)
+from database import SessionLocal, AsyncSessionLocal
+from models import sqlalchemy_models, request_models
+from services import catalog, ledger, rollup, reservation, retry
+
+logger = logging.getLogger(__name__)
+
+Receipt = sqlalchemy_models.SaleQueueReceiptDB
+
+# Write-ahead queue for sale submissions (POST /sales/ with Prefer: respond-async).
+#
+# The log is a directory of append-only segments (sales-00000001.wal, ...), one record per
+# line: the CRC-32 of the JSON payload in hex, a space, then {"id", "queued_at", "sale"}.
+# Submissions arriving within SALE_QUEUE_FSYNC_INTERVAL share one write + fsync, and each
+# request is answered only once the fsync covering its record returned. A torn record at
+# the end of the last segment (a crash mid-write) fails its CRC and is cut off on startup;
+# it was never acknowledged.
+#
+# The worker drains the log in order, SALE_QUEUE_BATCH_SIZE records per transaction. Each
+# sale is inserted together with its sale_queue_receipt row, and the drained position is
+# saved to `checkpoint` after the commit. A crash between the two replays the batch, and
+# the receipts make the replay skip what was already inserted: exactly-once.
+
+_SEGMENT_PREFIX = "sales-"
+_SEGMENT_SUFFIX = ".wal"
+_CHECKPOINT = "checkpoint"
+_LOCK = "lock"
+
+def _encode(record: dict) -> bytes:
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+def _decode(line: bytes):
+    """
+    The record on a log line, or None when the line is torn or corrupt.
+    """
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+def _fsync_directory(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class SaleQueue:
+    """
+    The log of one API process: group-committed appends, recovery on open(), and the
+    drain worker started by run().
+    """
+
+    def __init__(self, directory: str, fsync_interval: float, batch_size: int, segment_bytes: int, retry_interval: float):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.segment_bytes = segment_bytes
+        self.retry_interval = retry_interval
+        self.enabled = False
+        self._lock_file = None
+        self._file = None            # append handle on the last segment
+        self._durable = (1, 0)       # (segment, offset) up to which the log is fsynced
+        self._position = (1, 0)      # (segment, offset) drained and checkpointed
+        self._queued = set()         # provisional ids appended but not drained yet
+        self._buffer = []            # (line, future) waiting for the next group fsync
+        self._wake = asyncio.Event()       # set by append(), wakes the writer
+        self._appended = asyncio.Event()   # set after each group fsync, wakes the drainer
+        self._writer = None
+        self._stopping = False
+        self.appended = self.drained = self.rejected = self.fsyncs = 0
+
+    # ---- Files ----------------------------------------------------------------
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{segment:08d}{_SEGMENT_SUFFIX}")
+
+    def _segments(self) -> list:
+        return sorted(
+            int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)
+        )
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT)) as f:
+                data = json.load(f)
+            return data["segment"], data["offset"]
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self, position: tuple):
+        """
+        Atomically replace the checkpoint, then delete the segments drained before it.
+        """
+        path = os.path.join(self.directory, _CHECKPOINT)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": position[0], "offset": position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_directory(self.directory)
+        for segment in self._segments():
+            if segment < position[0]:
+                os.remove(self._segment_path(segment))
+
+    def open(self) -> bool:
+        """
+        Take the directory's lock and recover: find the records not drained yet and cut off
+        a torn tail. False when another process owns the directory.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, _LOCK), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.warning("Sale queue %s is owned by another process; queued submissions are disabled here", self.directory)
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+        segments = self._segments() or [1]
+        self._position = self._read_checkpoint() or (segments[0], 0)
+        last = segments[-1]
+        for segment in segments:
+            if segment < self._position[0]:
+                continue
+            offset = self._position[1] if segment == self._position[0] else 0
+            good_end = offset
+            with open(self._segment_path(segment), "ab+") as f:
+                f.seek(offset)
+                for line in f:
+                    record = _decode(line)
+                    if record is None:
+                        break
+                    self._queued.add(record["id"])
+                    good_end += len(line)
+                size = f.seek(0, os.SEEK_END)
+                if good_end < size:
+                    if segment != last:
+                        logger.error("Sale queue segment %s is corrupt after offset %s", segment, good_end)
+                    else:
+                        logger.warning("Cutting a torn record off the sale queue log at offset %s", good_end)
+                        f.truncate(good_end)
+                        f.flush()
+                        os.fsync(f.fileno())
+        self._file = open(self._segment_path(last), "ab")
+        self._durable = (last, self._file.seek(0, os.SEEK_END))
+        _fsync_directory(self.directory)
+        self.enabled = True
+        if self._queued:
+            logger.info("Sale queue: %s submissions to replay", len(self._queued))
+        return True
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def _write(self, lines: list) -> tuple:
+        """
+        Append a group of records, fsync once and rotate to a new segment when the current
+        one is full. Runs in a worker thread. Returns the new durable end.
+        """
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        segment, offset = self._durable[0], self._file.tell()
+        if offset >= self.segment_bytes:
+            self._file.close()
+            segment, offset = segment + 1, 0
+            self._file = open(self._segment_path(segment), "ab")
+            _fsync_directory(self.directory)
+        return segment, offset
+
+    def _read_batch(self) -> tuple:
+        """
+        Up to batch_size records from the drained position to the durable end, and the
+        position after them. Runs in a worker thread.
+        """
+        records = []
+        segment, offset = self._position
+        durable = self._durable
+        while len(records) < self.batch_size and (segment, offset) < durable:
+            end = durable[1] if segment == durable[0] else None
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                while len(records) < self.batch_size and (end is None or offset < end):
+                    line = f.readline()
+                    if not line:
+                        break
+                    record = _decode(line)
+                    if record is None:
+                        # Only possible past the last good record of a corrupt older segment
+                        break
+                    records.append(record)
+                    offset += len(line)
+            if len(records) < self.batch_size and segment < durable[0]:
+                segment, offset = segment + 1, 0
+            else:
+                break
+        return records, (segment, offset)
+
+    # ---- Appending ------------------------------------------------------------
+
+    async def append(self, sale: request_models.SaleCreate) -> str:
+        """
+        Durably append a validated sale and return its provisional id.
+        """
+        provisional_id = uuid.uuid4().hex
+        line = _encode({
+            "id": provisional_id,
+            "queued_at": datetime.now().isoformat(),
+            "sale": sale.model_dump(mode="json"),
+        })
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((line, future))
+        self._wake.set()
+        await future
+        self._queued.add(provisional_id)
+        self.appended += 1
+        return provisional_id
+
+    async def _run_writer(self):
+        while True:
+            await self._wake.wait()
+            if not self._stopping:
+                # Let the submissions arriving meanwhile share the fsync
+                await asyncio.sleep(self.fsync_interval)
+            self._wake.clear()
+            batch, self._buffer = self._buffer, []
+            try:
+                self._durable = await asyncio.to_thread(self._write, [line for line, _ in batch])
+            except Exception as exc:
+                logger.exception("Sale queue write failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.fsyncs += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+            self._appended.set()
+            if self._stopping and not self._buffer:
+                return
+
+    # ---- Draining -------------------------------------------------------------
+
+    async def _run_drainer(self):
+        while True:
+            self._appended.clear()
+            records, position = await asyncio.to_thread(self._read_batch)
+            if not records:
+                if position != self._position:
+                    # Stepped over an empty or fully drained segment
+                    await asyncio.to_thread(self._save_checkpoint, position)
+                    self._position = position
+                    continue
+                await self._appended.wait()
+                continue
+            try:
+                await _apply(records)
+            except Exception:
+                # Transient database errors, or the database being down: the batch stays
+                # at the head of the log
+                logger.exception("Sale queue batch failed; retrying in %s s", self.retry_interval)
+                await asyncio.sleep(self.retry_interval)
+                continue
+            await asyncio.to_thread(self._save_checkpoint, position)
+            self._position = position
+            for record in records:
+                self._queued.discard(record["id"])
+            self.drained += len(records)
+
+    async def run(self):
+        """
+        Background task started with the app when the queue is enabled: group fsyncs and
+        draining, including the replay of whatever open() recovered.
+        """
+        self._writer = asyncio.create_task(self._run_writer())
+        await self._run_drainer()
+
+    async def stop(self):
+        """
+        Stop taking submissions, write out the ones waiting for a group fsync and release
+        the directory. Call after cancelling run(); undrained records are replayed on the
+        next start.
+        """
+        self.enabled = False
+        self._stopping = True
+        self._wake.set()
+        if self._writer is not None:
+            await self._writer
+        self._close()
+
+    def is_queued(self, provisional_id: str) -> bool:
+        return provisional_id in self._queued
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "depth": len(self._queued),
+            "appended": self.appended,
+            "drained": self.drained,
+            "rejected": self.rejected,
+            "fsyncs": self.fsyncs,
+        }
+
+queue = SaleQueue(
+    SALE_QUEUE_DIR, SALE_QUEUE_FSYNC_INTERVAL, SALE_QUEUE_BATCH_SIZE,
+    SALE_QUEUE_SEGMENT_BYTES, SALE_QUEUE_RETRY_INTERVAL
+)
+
+def _receipt(record: dict, sale_id: int = None, error: str = None) -> dict:
+    return {
+        "provisional_id": record["id"],
+        "sale_id": sale_id,
+        "error": error[:255] if error else None,
+        "queued_at": datetime.fromisoformat(record["queued_at"]),
+    }
+
+async def _insert(db, records: list, prices: dict, rejected: list = ()) -> int:
+    """
+    Reserve stock for the records in log order, insert the granted sales with their receipts,
+    write rejection receipts for the others and for `rejected`, and commit. Returns the
+    number of rejections.
+    """
+    sales = [request_models.SaleCreate.model_validate(record["sale"]) for record in records]
+    shortages = await reservation.areserve_many(db, [reservation.sale_demand(sale.items) for sale in sales])
+    receipts = list(rejected)
+    accepted = []
+    for record, sale, short in zip(records, sales, shortages):
+        if short:
+            receipts.append(_receipt(record, error=reservation.shortage_message(short)))
+        else:
+            accepted.append((record, sale))
+    sale_ids = await ledger.ainsert_sales(db, [sale for _, sale in accepted], prices)
+    receipts += [_receipt(record, sale_id) for (record, _), sale_id in zip(accepted, sale_ids)]
+    if receipts:
+        await db.execute(insert(Receipt), receipts)
+    await rollup.arefresh(db, await rollup.asale_keys(db, sale_ids))
+    await db.commit()
+    return len(receipts) - len(sale_ids)
+
+async def _apply(records: list):
+    """
+    Insert a batch of logged sales in one transaction, skipping the ones a receipt shows
+    were inserted before a restart. Sales the stock on hand cannot cover are rejected.
+    Deadlocks and lock wait timeouts rerun the transaction (services.retry). When the batch
+    fails otherwise, it is replayed one record per transaction and the records that still
+    fail get a receipt with the error (e.g. a sale dated in the archived period). Connection
+    errors, and deadlocks that outlast the retries, are raised instead, to retry the whole
+    batch later.
+    """
+    async with AsyncSessionLocal() as db:
+        done = set((await db.scalars(
+            select(Receipt.provisional_id).filter(Receipt.provisional_id.in_([record["id"] for record in records]))
+        )).all())
+        records = [record for record in records if record["id"] not in done]
+        if not records:
+            return
+
+        product_ids = {item["product_id"] for record in records for item in record["sale"]["items"]}
+        prices = await catalog.afetch_product_prices(db, product_ids)
+        ready, rejected = [], []
+        for record in records:
+            missing_ids = catalog.missing_product_ids([item["product_id"] for item in record["sale"]["items"]], prices)
+            if missing_ids:
+                rejected.append(_receipt(record, error=f"Product with ID {', '.join(map(str, missing_ids))} not found."))
+            else:
+                ready.append(record)
+
+        try:
+            queue.rejected += await retry.arun_transaction(db, lambda: _insert(db, ready, prices, rejected))
+            return
+        except SQLAlchemyError as exc:
+            if retry.is_transient(exc):
+                raise
+            await db.rollback()
+
+        for record in ready:
+            try:
+                queue.rejected += await retry.arun_transaction(db, lambda record=record: _insert(db, [record], prices))
+            except SQLAlchemyError as exc:
+                if retry.is_transient(exc):
+                    raise
+                await db.rollback()
+                await db.execute(insert(Receipt).values(**_receipt(record, error=str(getattr(exc, "orig", exc)))))
+                await db.commit()
+                queue.rejected += 1
+        if rejected:
+            await db.execute(insert(Receipt), rejected)
+            await db.commit()
+            queue.rejected += len(rejected)
+
+async def astatus(db, provisional_id: str):
+    """
+    The state of a queued submission: queued, created (with sale_id) or rejected (with
+    error), or None when the id is unknown. The in-memory set is checked first: a record
+    leaves it only after its receipt has committed.
+    """
+    if queue.is_queued(provisional_id):
+        return {"provisional_id": provisional_id, "status": "queued"}
+    receipt = await db.get(Receipt, provisional_id)
+    if receipt is None:
+        return None
+    return {
+        "provisional_id": provisional_id,
+        "status": "created" if receipt.sale_id is not None else "rejected",
+        "sale_id": receipt.sale_id,
+        "error": receipt.error,
+    }
+
+def prune(keep_days: int) -> int:
+    """
+    Delete receipts older than `keep_days` days. Their provisional ids then read as unknown.
+    """
+    with SessionLocal() as db:
+        result = db.execute(delete(Receipt).where(Receipt.processed_at < datetime.now() - timedelta(days=keep_days)))
+        db.commit()
+    return result.rowcount
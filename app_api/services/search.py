@@ -0,0 +1,61 @@
+import re
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.mysql import match
+from models import sqlalchemy_models
+
+# Must equal ngram_token_size in mysql/my.cnf
+NGRAM_TOKEN_SIZE = 2
+
+# Column list of ft_product_name_sku
+PRODUCT_SEARCH_COLUMNS = (sqlalchemy_models.ProductDB.name, sqlalchemy_models.ProductDB.sku)
+
+# Characters with a meaning in MySQL boolean full-text syntax
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+def _boolean_query(term: str):
+    """
+    Turn user input into a boolean-mode query requiring every word, e.g. 'iphone pro' -> '+"iphone" +"pro"'.
+    With the ngram parser each quoted word becomes a phrase of its bigrams, which matches it as a substring.
+    None when a word is shorter than one n-gram and so cannot be found through the index.
+    """
+    words = _BOOLEAN_OPERATORS.sub(" ", term).split()
+    if not words or any(len(word) < NGRAM_TOKEN_SIZE for word in words):
+        return None
+    return " ".join(f'+"{word}"' for word in words)
+
+def like_condition(columns, term: str):
+    """
+    ILIKE substring search over `columns`, for columns without a usable FULLTEXT index
+    (short words, the archive history views).
+    """
+    pattern = f"%{term.strip()}%"
+    return or_(*[column.ilike(pattern) for column in columns])
+
+def search_condition(columns, term: str):
+    """
+    WHERE clause for a text search over `columns`, which must be exactly the column list
+    of a FULLTEXT ... WITH PARSER ngram index. Falls back to ILIKE for one-character words.
+    """
+    query = _boolean_query(term)
+    if query is None:
+        return like_condition(columns, term)
+    return match(*columns, against=query).in_boolean_mode()
+
+def search_rank(columns, term: str):
+    """
+    ORDER BY expression putting the best matches first, or None when the search falls back to ILIKE.
+    MySQL evaluates the identical MATCH in WHERE and ORDER BY only once.
+    """
+    query = _boolean_query(term)
+    if query is None:
+        return None
+    return match(*columns, against=query).in_boolean_mode().desc()
+
+def matching_product_ids(term: str):
+    """
+    Subquery of the IDs of products whose name or SKU matches, for filtering the report views
+    (which cannot carry a FULLTEXT index themselves) with product_id IN (...).
+    """
+    return select(sqlalchemy_models.ProductDB.product_id).filter(
+        search_condition(PRODUCT_SEARCH_COLUMNS, term)
+    )
@@ -0,0 +1,150 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
+from typing import Annotated, List, Optional, Union, get_args, get_origin
+import msgpack
+import orjson
+from fastapi import Header
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+# Fast response path for large list and report pages.
+# FastAPI validates a returned page against its response_model (from_attributes on every
+# ORM row, nested items included), dumps it to a dict and encodes that with json.dumps.
+# Rows read from the database are already trusted, so here each response model is compiled
+# once into a plain attribute copy with the same coercions (Decimal -> float or int,
+# 0/1 -> bool, date -> datetime), and the result is encoded with orjson, or MessagePack
+# when the client asks for it.
+# Endpoints keep their response_model for the OpenAPI schema; returning a Response
+# skips FastAPI's own validation and encoding.
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_ALIASES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+_JSON_ALIASES = {JSON_MEDIA_TYPE, "application/*", "*/*"}
+
+# The request's Accept header, for content negotiation
+AcceptHeader = Annotated[Optional[str], Header(description="application/json (default) or application/msgpack")]
+
+# PaginatedResponse fields besides items
+PAGE_FIELDS = ("total", "total_estimated", "page", "limit", "total_pages", "has_next", "has_prev", "next_cursor")
+
+def _without_none(annotation):
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+def _is_model(annotation) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+def _to_int(value):
+    # SUM() and arithmetic on integer columns come back from MySQL as DECIMAL
+    return value if type(value) is int else int(value)
+
+def _to_datetime(value):
+    # DATE columns mapped as DateTime come back as date; pydantic widens them to midnight
+    return value if isinstance(value, datetime) else datetime.combine(value, time())
+
+def _caster(annotation):
+    """
+    Conversion applied to a non-NULL attribute value for a field of this type, or None
+    when the value is used as is.
+    """
+    annotation = _without_none(annotation)
+    if _is_model(annotation):
+        return row_serializer(annotation)
+    if get_origin(annotation) in (list, List) and _is_model(get_args(annotation)[0]):
+        nested = row_serializer(get_args(annotation)[0])
+        return lambda rows: [nested(row) for row in rows]
+    if annotation is float:
+        return float
+    if annotation is int:
+        return _to_int
+    if annotation is bool:
+        return bool
+    if annotation is datetime:
+        return _to_datetime
+    return None
+
+@lru_cache(maxsize=None)
+def row_serializer(model: type, fields: tuple = None):
+    """
+    Compile a response model into a function turning an ORM object or Row into the dict
+    that validating and dumping it through `model` would give, without the validation.
+    `fields` (from services.fieldsets.parse_fields) keeps only those fields.
+    """
+    plan = tuple(
+        (name, _caster(field.annotation)) for name, field in model.model_fields.items()
+        if fields is None or name in fields
+    )
+
+    def serialize(row):
+        out = {}
+        for name, cast in plan:
+            value = getattr(row, name, None)
+            out[name] = value if cast is None or value is None else cast(value)
+        return out
+
+    return serialize
+
+def page_payload(page, item_model: type, fields: tuple = None) -> dict:
+    """
+    The PaginatedResponse[item_model] body of a page from services.pagination, with
+    only `fields` in each item when a sparse fieldset was requested.
+    """
+    serialize = row_serializer(item_model, fields)
+    payload = {"items": [serialize(row) for row in page.items]}
+    for name in PAGE_FIELDS:
+        payload[name] = getattr(page, name)
+    return payload
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def prefers_msgpack(accept: str = None) -> bool:
+    """
+    Whether the Accept header ranks MessagePack at least as high as JSON.
+    """
+    if not accept:
+        return False
+    best_json = best_msgpack = 0.0
+    for part in accept.split(","):
+        media_type, _, params = part.partition(";")
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in _MSGPACK_ALIASES:
+            best_msgpack = max(best_msgpack, quality)
+        elif media_type in _JSON_ALIASES:
+            best_json = max(best_json, quality)
+    return best_msgpack > 0 and best_msgpack >= best_json
+
+def render(payload, accept: str = None, status_code: int = 200) -> Response:
+    """
+    Encode a payload built by page_payload/row_serializer as MessagePack when the client
+    prefers it, JSON (orjson) otherwise. Datetimes become ISO 8601 strings in both.
+    """
+    headers = {"Vary": "Accept"}
+    if prefers_msgpack(accept):
+        body = msgpack.packb(payload, default=_default, use_bin_type=True)
+        return Response(body, status_code=status_code, media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+    body = orjson.dumps(payload, default=_default)
+    return Response(body, status_code=status_code, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+def page_response(page, item_model: type, accept: str = None, fields: tuple = None) -> Response:
+    """
+    Render a page from services.pagination without revalidating its rows.
+    """
+    return render(page_payload(page, item_model, fields), accept)
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from datetime import datetime, time, timedelta
+from sqlalchemy import select, insert, delete, func, literal, union_all, and_, text, cast, Integer
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, SessionLocal
+from models import sqlalchemy_models
+
+logger = logging.getLogger(__name__)
+
+Period = sqlalchemy_models.StockSnapshotPeriodDB
+Snapshot = sqlalchemy_models.StockSnapshotDB
+# Hot and archived movements; every read below is bounded by movement_date
+Movement = sqlalchemy_models.InventoryMovementHistoryView
+
+PERIODS = ("day", "week", "month")
+
+# ---- Period arithmetic -----------------------------------------------------
+
+def period_end(moment: datetime, period: str) -> datetime:
+    """
+    Last second of the day, week (Monday to Sunday) or month containing `moment`.
+    """
+    day = moment.date()
+    if period == "day":
+        last = day
+    elif period == "week":
+        last = day + timedelta(days=6 - day.weekday())
+    elif period == "month":
+        next_month = day.replace(day=28) + timedelta(days=4)
+        last = next_month - timedelta(days=next_month.day)
+    else:
+        raise ValueError(f"Unknown snapshot period {period!r}, expected one of {', '.join(PERIODS)}")
+    return datetime.combine(last, time(23, 59, 59))
+
+def period_ends(first: datetime, until: datetime, period: str) -> list:
+    """
+    Ends of every period from the one containing `first` up to the last one finished before `until`.
+    """
+    ends = []
+    end = period_end(first, period)
+    while end < until:
+        ends.append(end)
+        end = period_end(end + timedelta(seconds=1), period)
+    return ends
+
+# ---- Writing ---------------------------------------------------------------
+
+def take_snapshot(db: Session, end: datetime):
+    """
+    Write the closing stock of every product at `end`: the previous valid snapshot plus the
+    movements dated after it, up to `end`. INSERT ... SELECT takes shared locks on the rows it
+    reads, so a backdated movement written meanwhile waits and then invalidates this period.
+    """
+    db.execute(delete(Period).where(Period.period_end == end))
+    db.execute(insert(Period).values(period_end=end))
+
+    previous = db.scalar(
+        select(func.max(Period.period_end)).where(Period.period_end < end).with_for_update(read=True)
+    )
+
+    delta_conditions = [Movement.movement_date <= end]
+    parts = []
+    if previous is not None:
+        delta_conditions.append(Movement.movement_date > previous)
+        parts.append(select(Snapshot.product_id, Snapshot.stock_on_hand, Snapshot.last_movement_at)
+                     .where(Snapshot.period_end == previous))
+    parts.append(select(Movement.product_id, func.sum(Movement.quantity), func.max(Movement.movement_date))
+                 .where(*delta_conditions)
+                 .group_by(Movement.product_id))
+    combined = (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+    product_id, quantity, moved_at = combined.c
+
+    db.execute(insert(Snapshot).from_select(
+        [Snapshot.period_end, Snapshot.product_id, Snapshot.stock_on_hand, Snapshot.last_movement_at],
+        select(literal(end), product_id, func.sum(quantity), func.max(moved_at)).group_by(product_id)
+    ))
+
+def ensure_snapshots(period: str, until: datetime = None) -> list:
+    """
+    Snapshot every finished period (since the first movement) that has no valid snapshot,
+    oldest first, one transaction each. A MySQL named lock keeps concurrent workers from
+    doing the same work; the loser returns an empty list.
+    """
+    until = until or datetime.now()
+    built = []
+    with engine.connect() as lock_connection:
+        if not lock_connection.scalar(text("SELECT GET_LOCK('stock_snapshot', 0)")):
+            return built
+        try:
+            with SessionLocal() as db:
+                # MIN per table uses each movement_date index; MIN over the union view would scan it
+                first = min(filter(None, (
+                    db.scalar(select(func.min(table.movement_date)))
+                    for table in (sqlalchemy_models.InventoryMovementDB, sqlalchemy_models.InventoryMovementArchiveDB)
+                )), default=None)
+                if first is None:
+                    return built
+                existing = set(db.scalars(select(Period.period_end)))
+                for end in period_ends(first, until, period):
+                    if end in existing:
+                        continue
+                    take_snapshot(db, end)
+                    db.commit()
+                    built.append(end)
+        finally:
+            lock_connection.scalar(text("SELECT RELEASE_LOCK('stock_snapshot')"))
+    return built
+
+async def run_periodically(period: str, interval: float):
+    """
+    Background task started with the app: snapshot newly finished periods every `interval` seconds.
+    """
+    while True:
+        try:
+            built = await asyncio.to_thread(ensure_snapshots, period)
+            if built:
+                logger.info("Stock snapshots written for %s", ", ".join(map(str, built)))
+        except Exception:
+            logger.exception("Stock snapshot run failed")
+        await asyncio.sleep(interval)
+
+# ---- Reading ---------------------------------------------------------------
+
+async def alatest_period(db: AsyncSession, as_of: datetime):
+    """
+    The most recent valid snapshot at or before `as_of`, or None.
+    """
+    return await db.scalar(select(func.max(Period.period_end)).where(Period.period_end <= as_of))
+
+def stock_view_as_of(as_of: datetime, snapshot_at: datetime = None):
+    """
+    A stand-in for ProductStockView computed as of `as_of`: the snapshot taken at `snapshot_at`
+    plus the movements dated after it. With no snapshot every movement up to `as_of` is summed.
+    """
+    product = sqlalchemy_models.ProductDB
+    delta_conditions = [Movement.movement_date <= as_of]
+    if snapshot_at is not None:
+        delta_conditions.append(Movement.movement_date > snapshot_at)
+    delta = select(
+        Movement.product_id,
+        func.sum(Movement.quantity).label("quantity"),
+        func.max(Movement.movement_date).label("moved_at")
+    ).where(*delta_conditions).group_by(Movement.product_id).subquery()
+
+    stock = func.coalesce(delta.c.quantity, 0)
+    last_movement_at = delta.c.moved_at
+    from_clause = product.__table__.outerjoin(delta, delta.c.product_id == product.product_id)
+    if snapshot_at is not None:
+        stock = func.coalesce(Snapshot.stock_on_hand, 0) + stock
+        last_movement_at = func.coalesce(delta.c.moved_at, Snapshot.last_movement_at)
+        from_clause = from_clause.outerjoin(Snapshot.__table__, and_(
+            Snapshot.product_id == product.product_id,
+            Snapshot.period_end == snapshot_at
+        ))
+
+    stock_as_of = select(
+        product.product_id,
+        product.name,
+        product.price,
+        product.reorder_level,
+        cast(stock, Integer).label("stock_on_hand"),  # SUM() is DECIMAL in MySQL
+        (stock <= product.reorder_level).label("needs_restock"),
+        last_movement_at.label("last_movement_at")
+    ).select_from(from_clause).subquery("v_product_stock_as_of")
+    return aliased(sqlalchemy_models.ProductStockView, stock_as_of, adapt_on_names=True)
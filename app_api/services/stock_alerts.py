@@ -0,0 +1,303 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func, event
+from sqlalchemy.orm import Session
+from config import STOCK_ALERT_POLL_INTERVAL, STOCK_ALERT_BUFFER_SIZE, STOCK_ALERT_GAP_TIMEOUT, STOCK_ALERT_LATE_WINDOW
+from database import SessionLocal, AsyncSessionLocal
+from models import sqlalchemy_models
+
+logger = logging.getLogger(__name__)
+
+AlertEvent = sqlalchemy_models.StockAlertEventDB
+Product = sqlalchemy_models.ProductDB
+StockView = sqlalchemy_models.ProductStockView
+
+# Committed writes to these tables can move a product across its reorder level
+WATCHED_TABLES = {"product", "sale", "sale_item", "stock_in", "stock_in_item", "inventory_movement"}
+
+# Events read per query, by the poller and by subscribers catching up from the table
+FETCH_LIMIT = 500
+
+# Idle subscribers get an SSE comment this often so proxies keep the connection open
+KEEPALIVE_SECONDS = 15
+
+# session.info key set when the current transaction wrote a watched table
+_PENDING_WRITES = "stock_alerts_pending_writes"
+
+def _as_dict(alert, name) -> dict:
+    return {
+        "seq": alert.seq,
+        "product_id": alert.product_id,
+        "name": name,
+        "needs_restock": bool(alert.needs_restock),
+        "stock_on_hand": alert.stock_on_hand,
+        "reorder_level": alert.reorder_level,
+        "created_at": alert.created_at.isoformat(),
+    }
+
+def _events_after(seq: int):
+    return (
+        select(AlertEvent, Product.name)
+        .outerjoin(Product, Product.product_id == AlertEvent.product_id)
+        .where(AlertEvent.seq > seq)
+        .order_by(AlertEvent.seq)
+        .limit(FETCH_LIMIT)
+    )
+
+def _events_in(seqs: list):
+    return (
+        select(AlertEvent, Product.name)
+        .outerjoin(Product, Product.product_id == AlertEvent.product_id)
+        .where(AlertEvent.seq.in_(seqs))
+        .order_by(AlertEvent.seq)
+    )
+
+class AlertHub:
+    """
+    Fans the stock_alert_event feed out to every subscriber of this worker.
+
+    One poller task reads new events (a primary key range scan) right after a local write
+    commits and every `poll_interval` seconds otherwise, keeps the most recent ones in memory
+    and wakes the subscribers. Events carry the product's absolute state, so a client that
+    sees one twice (after a reset, or a reconnect) can apply it again safely.
+
+    AUTO_INCREMENT values are handed out before commit, so a seq can become visible after a
+    higher one. Delivery stops at such a hole for up to `gap_timeout`; after that the later
+    events go out and the hole is watched for `late_window` more (a bulk import, a queue
+    drain batch or a transaction waiting on a lock), delivering its event when it commits.
+    The resume id sent with each event is therefore the highest seq up to which every event
+    has been delivered, not always the event's own seq: resuming from it may repeat events
+    but never misses one that committed within `late_window`.
+    """
+
+    def __init__(self, buffer_size: int, poll_interval: float, gap_timeout: float, late_window: float):
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+        self.late_window = late_window
+        self.buffer = deque(maxlen=buffer_size)  # (position, resume id, event) in delivery order
+        self.position = 0  # events delivered by this worker
+        self.last_seq = 0  # every event up to here has been delivered or skipped
+        self._skipped = {}  # seq of a hole passed over -> time.monotonic() when it was
+        self._evicted_seq = 0  # highest seq that left the buffer (or predates it)
+        self._gap_since = None
+        self._loop = None
+        self._ready = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._changed = asyncio.Event()  # replaced each time events are published
+
+    @property
+    def watermark(self) -> int:
+        """
+        Every event up to this seq has been delivered (or its hole outlived late_window).
+        """
+        return min(self._skipped) - 1 if self._skipped else self.last_seq
+
+    # ---- Poller ------------------------------------------------------------
+
+    async def run(self):
+        """
+        Background task started with the app.
+        """
+        self._loop = asyncio.get_running_loop()
+        while not self._ready.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    self.last_seq = await db.scalar(select(func.coalesce(func.max(AlertEvent.seq), 0)))
+                self._evicted_seq = self.last_seq
+                self._ready.set()
+            except Exception:
+                logger.exception("Stock alert feed unavailable, retrying")
+                await asyncio.sleep(self.poll_interval)
+        while True:
+            self._wake.clear()
+            try:
+                await self._poll()
+            except Exception:
+                logger.exception("Stock alert poll failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self):
+        """
+        Ask the poller to read new events now. Safe to call from any thread.
+        """
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _poll(self):
+        now = time.monotonic()
+        for seq in [seq for seq, skipped_at in self._skipped.items() if now - skipped_at > self.late_window]:
+            del self._skipped[seq]  # rolled back, or open for longer than any write should be
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(_events_after(self.last_seq))).all()
+            late = []
+            if self._skipped:
+                late = (await db.execute(_events_in(list(self._skipped)))).all()
+        settled = self._settled(rows)
+        for alert, _ in late:
+            del self._skipped[alert.seq]
+        batch = sorted([_as_dict(alert, name) for alert, name in late] + settled, key=lambda alert: alert["seq"])
+        if settled:
+            self.last_seq = settled[-1]["seq"]
+        if batch:
+            self._publish(batch)
+
+    def _publish(self, batch: list):
+        # Sorted by seq, so every event up to min(seq, watermark) is out once this one is
+        watermark = self.watermark
+        for alert in batch:
+            if len(self.buffer) == self.buffer.maxlen:
+                self._evicted_seq = max(self._evicted_seq, self.buffer[0][2]["seq"])
+            self.position += 1
+            self.buffer.append((self.position, min(alert["seq"], watermark), alert))
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _settled(self, rows) -> list:
+        """
+        The leading events of `rows` that can be delivered: stop at a hole in the seq
+        order unless it has been open for longer than gap_timeout, in which case its seqs
+        are remembered in _skipped.
+        """
+        settled, expected = [], self.last_seq + 1
+        for alert, name in rows:
+            if alert.seq != expected:
+                if self._gap_since is None:
+                    self._gap_since = time.monotonic()
+                if time.monotonic() - self._gap_since < self.gap_timeout:
+                    break
+                self._skipped.update((seq, time.monotonic()) for seq in range(expected, alert.seq))
+            self._gap_since = None
+            settled.append(_as_dict(alert, name))
+            expected = alert.seq + 1
+        return settled
+
+    # ---- Subscribers -------------------------------------------------------
+
+    async def subscribe(self, since: int = None):
+        """
+        Async iterator of (kind, payload, resume id) for one subscriber:
+
+        - ("reset", {"seq", "products"}): every product currently at or below its reorder
+          level. Sent first when `since` is missing, ahead of the newest event, or older
+          than the oldest event still stored.
+        - ("crossing", event): a product went to or below its reorder level
+          (needs_restock true) or recovered above it (false).
+        - ("keepalive", None): nothing happened for KEEPALIVE_SECONDS.
+
+        Resuming from `since` (a resume id) replays the events after it from memory, or
+        from the table when they have left the buffer, without rescanning stock.
+        """
+        await self._ready.wait()
+        cursor, position = since, None
+        if cursor is None or cursor > self.last_seq:
+            position, reset = await self._reset()
+            cursor = reset["seq"]
+            yield "reset", reset, cursor
+        while True:
+            changed = self._changed
+            if position is None or (self.buffer and self.buffer[0][0] > position + 1):
+                # Resuming, or this subscriber fell behind the buffer
+                position, pending = await self._replay(cursor)
+                if pending is None:
+                    position, reset = await self._reset()
+                    cursor = reset["seq"]
+                    yield "reset", reset, cursor
+                    continue
+            else:
+                pending = [(resume, alert) for at, resume, alert in self.buffer if at > position]
+                if pending:
+                    position = self.buffer[-1][0]
+            for resume, alert in pending:
+                cursor = max(cursor, resume)
+                yield "crossing", alert, cursor
+            if pending:
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield "keepalive", None, None
+
+    async def _replay(self, cursor: int):
+        """
+        (position, [(resume id, event)]) of every delivered event after resume id `cursor`,
+        from memory when none of them left the buffer, else from the table; the events
+        published after `position` follow live. None instead of the list when some were pruned.
+        """
+        position, watermark = self.position, self.watermark
+        if cursor >= self._evicted_seq:
+            return position, [(resume, alert) for _, resume, alert in self.buffer if alert["seq"] > cursor]
+        pending, seq = [], cursor
+        async with AsyncSessionLocal() as db:
+            oldest = await db.scalar(select(func.min(AlertEvent.seq)))
+            if oldest is None or oldest > cursor + 1:
+                return position, None
+            while True:
+                rows = (await db.execute(_events_after(seq))).all()
+                # Everything up to the watermark had committed, so it is all in this read
+                pending += [(max(cursor, min(alert.seq, watermark)), _as_dict(alert, name)) for alert, name in rows]
+                if len(rows) < FETCH_LIMIT:
+                    return position, pending
+                seq = rows[-1][0].seq
+
+    async def _reset(self) -> tuple:
+        position, seq = self.position, self.watermark
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(StockView.product_id, StockView.name, StockView.stock_on_hand, StockView.reorder_level)
+                .where(StockView.needs_restock == 1)
+                .order_by(StockView.product_id)
+            )).mappings().all()
+        return position, {"seq": seq, "products": [dict(row) for row in rows]}
+
+hub = AlertHub(STOCK_ALERT_BUFFER_SIZE, STOCK_ALERT_POLL_INTERVAL, STOCK_ALERT_GAP_TIMEOUT, STOCK_ALERT_LATE_WINDOW)
+
+def sse_message(kind: str, payload, resume: int = None) -> str:
+    """
+    Server-Sent Events framing. The resume id goes in `id:`, so a browser EventSource sends
+    it back as Last-Event-ID when it reconnects.
+    """
+    if kind == "keepalive":
+        return ": keepalive\n\n"
+    return f"id: {resume}\nevent: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+# Wake the poller after local commits. Listening on the Session class covers the sync
+# sessions and the sync_session behind every AsyncSession.
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session, flush_context):
+    if any(obj.__table__.name in WATCHED_TABLES for obj in session.new | session.dirty | session.deleted):
+        session.info[_PENDING_WRITES] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in WATCHED_TABLES:
+            orm_execute_state.session.info[_PENDING_WRITES] = True
+
+@event.listens_for(Session, "after_commit")
+def _notify_on_commit(session):
+    if session.info.pop(_PENDING_WRITES, False):
+        hub.notify()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_WRITES, None)
+
+def prune(keep_days: int) -> int:
+    """
+    Delete events older than `keep_days` days. Subscribers resuming from before the oldest
+    remaining event get a reset instead.
+    """
+    with SessionLocal() as db:
+        result = db.execute(delete(AlertEvent).where(AlertEvent.created_at < datetime.now() - timedelta(days=keep_days)))
+        db.commit()
+    return result.rowcount
@@ -19,7 +19,8 @@ CREATE TABLE product(
 		REFERENCES category(category_id)
 		ON UPDATE CASCADE ON DELETE SET NULL,
 	INDEX idx_product_cat (category_id),
-	INDEX idx_product_name (name)	
+	INDEX idx_product_name (name),
+	FULLTEXT INDEX ft_product_name_sku (name, sku) WITH PARSER ngram
 );
 
 
@@ -29,7 +30,8 @@ CREATE TABLE sale(
 	total_amount DECIMAL(10,2) NOT NULL,
 	payment_method ENUM('Cash','Card','QR') NOT NULL,
 	notes VARCHAR(255) NULL,
-	INDEX idx_sale_datetime (sale_datetime)
+	INDEX idx_sale_datetime (sale_datetime),
+	FULLTEXT INDEX ft_sale_notes (notes) WITH PARSER ngram
 );
 
 CREATE TABLE sale_item(
@@ -39,6 +41,7 @@ CREATE TABLE sale_item(
 	quantity INT NOT NULL,
 	unit_price DECIMAL(10,2) NOT NULL,
 	discount DECIMAL(10,2) NOT NULL DEFAULT 0,
+	unit_cost DECIMAL(14,4) NULL, -- Weighted average cost frozen at the time of sale
 	CONSTRAINT fk_sale_item_sale FOREIGN KEY (sale_id)
 		REFERENCES sale(sale_id)
 		ON UPDATE CASCADE ON DELETE CASCADE,
@@ -56,7 +59,8 @@ CREATE TABLE stock_in(
 	stock_in_date DATE NOT NULL,
 	total_cost DECIMAL(10,2) NOT NULL DEFAULT 0,
 	notes VARCHAR(255) NULL,
-	INDEX idx_stock_in_date (stock_in_date)
+	INDEX idx_stock_in_date (stock_in_date),
+	FULLTEXT INDEX ft_stock_in_ref_notes (ref_no, notes) WITH PARSER ngram
 );
 
 CREATE TABLE stock_in_item(
@@ -96,30 +100,176 @@ CREATE TABLE inventory_movement (
     CONSTRAINT fk_im_sale_item FOREIGN KEY (sale_item_id)
         REFERENCES sale_item(sale_item_id)
         ON UPDATE CASCADE ON DELETE SET NULL,
-	INDEX idx_im_product_date (product_id, movement_date)
+	INDEX idx_im_product_date (product_id, movement_date),
+	INDEX idx_im_movement_date (movement_date)
+);
+
+
+-- Running stock balance and weighted average cost per product, maintained by the inventory_movement triggers
+CREATE TABLE product_stock_balance(
+	product_id INT PRIMARY KEY,
+	stock_on_hand INT NOT NULL DEFAULT 0,
+	needs_restock TINYINT(1) NOT NULL DEFAULT 1,
+	last_movement_at DATETIME NULL,
+	cost_quantity INT NOT NULL DEFAULT 0, -- Sum of STOCK_IN/OPENING quantities
+	cost_value DECIMAL(18,4) NOT NULL DEFAULT 0, -- Sum of STOCK_IN/OPENING quantity * unit_cost
+	last_cost_at DATETIME NULL, -- Latest STOCK_IN/OPENING movement_date seen (high-water mark)
+	last_sale_at DATETIME NULL, -- Latest SALE movement_date seen (high-water mark)
+	CONSTRAINT fk_psb_product FOREIGN KEY (product_id)
+		REFERENCES product(product_id)
+		ON UPDATE CASCADE ON DELETE CASCADE,
+	INDEX idx_psb_restock (needs_restock)
+);
+
+-- Closing stock per product at each period end ("stock as of" snapshots).
+-- A period row exists only while its snapshot is valid: a movement dated at or before
+-- period_end deletes the period (and its rows through the cascade), see sp_apply_movement.
+CREATE TABLE stock_snapshot_period(
+	period_end DATETIME PRIMARY KEY,
+	taken_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE stock_snapshot(
+	period_end DATETIME NOT NULL,
+	product_id INT NOT NULL,
+	stock_on_hand INT NOT NULL,
+	last_movement_at DATETIME NULL,
+	PRIMARY KEY (period_end, product_id),
+	CONSTRAINT fk_ss_period FOREIGN KEY (period_end)
+		REFERENCES stock_snapshot_period(period_end)
+		ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT fk_ss_product FOREIGN KEY (product_id)
+		REFERENCES product(product_id)
+		ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+-- Sales per day, product and payment method, maintained by the API on every sale write
+CREATE TABLE sales_daily_rollup(
+	sale_date DATE NOT NULL,
+	product_id INT NOT NULL,
+	payment_method ENUM('Cash','Card','QR') NOT NULL,
+	line_count INT NOT NULL,
+	quantity INT NOT NULL,
+	revenue DECIMAL(18,4) NOT NULL, -- SUM(quantity * unit_price * (1 - discount))
+	cogs DECIMAL(18,4) NULL, -- SUM(quantity * unit_cost), lines without a frozen cost are skipped
+	gross_profit DECIMAL(18,4) NULL, -- SUM(revenue - cogs) over lines with a frozen cost
+	PRIMARY KEY (sale_date, product_id, payment_method),
+	CONSTRAINT fk_sdr_product FOREIGN KEY (product_id)
+		REFERENCES product(product_id)
+		ON UPDATE CASCADE ON DELETE CASCADE,
+	INDEX idx_sdr_product_date (product_id, sale_date)
+);
+
+-- Low-stock alert feed: one row each time a product's needs_restock flips, written by the
+-- product_stock_balance triggers. seq is the resume position of GET /alerts/low-stock/stream.
+CREATE TABLE stock_alert_event(
+	seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+	product_id INT NOT NULL,
+	needs_restock TINYINT(1) NOT NULL, -- 1: at or below reorder_level, 0: recovered above it
+	stock_on_hand INT NOT NULL,
+	reorder_level INT NOT NULL,
+	created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	INDEX idx_sae_created (created_at)
+);
+
+-- One row per sale submitted through the write-ahead queue (POST /sales/ with
+-- Prefer: respond-async), written in the same transaction as the sale. Replaying the
+-- queue log skips every provisional_id already here, so each submission lands once.
+CREATE TABLE sale_queue_receipt(
+	provisional_id CHAR(32) PRIMARY KEY,
+	sale_id INT NULL, -- NULL when the submission was rejected, see error
+	error VARCHAR(255) NULL,
+	queued_at DATETIME NOT NULL,
+	processed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	INDEX idx_sqr_processed (processed_at)
+);
+
+-- =================================================================
+--  ARCHIVE (hot/archive table pairs)
+-- =================================================================
+
+-- Everything dated before archived_before has been moved out of sale, sale_item and
+-- inventory_movement into the *_archive tables below (python manage.py archive).
+-- The archived period is read-only: see sp_assert_not_archived.
+CREATE TABLE archive_state(
+	id TINYINT PRIMARY KEY,
+	archived_before DATETIME NOT NULL
+);
+
+INSERT INTO archive_state (id, archived_before) VALUES (1, '1000-01-01 00:00:00');
+
+-- Archive tables are partitioned by month so date-filtered reads only open the months asked for.
+-- Partitioned InnoDB tables cannot have foreign keys; the rows are immutable copies whose
+-- references were checked while they lived in the hot tables. The partitioning column has to be
+-- part of every unique key, hence the composite primary keys. The archive job splits pmax
+-- (always empty) into one partition per month before moving that month in.
+CREATE TABLE sale_archive(
+	sale_id INT NOT NULL,
+	sale_datetime DATETIME NOT NULL,
+	total_amount DECIMAL(10,2) NOT NULL,
+	payment_method ENUM('Cash','Card','QR') NOT NULL,
+	notes VARCHAR(255) NULL,
+	PRIMARY KEY (sale_id, sale_datetime),
+	INDEX idx_sale_archive_datetime (sale_datetime)
+)
+PARTITION BY RANGE COLUMNS(sale_datetime) (
+	PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+CREATE TABLE sale_item_archive(
+	sale_item_id INT NOT NULL,
+	sale_id INT NOT NULL,
+	sale_datetime DATETIME NOT NULL, -- Copied from the sale, for partitioning
+	product_id INT NOT NULL,
+	quantity INT NOT NULL,
+	unit_price DECIMAL(10,2) NOT NULL,
+	discount DECIMAL(10,2) NOT NULL DEFAULT 0,
+	unit_cost DECIMAL(14,4) NULL,
+	PRIMARY KEY (sale_item_id, sale_datetime),
+	INDEX idx_sale_item_archive_sale (sale_id),
+	INDEX idx_sale_item_archive_product (product_id, sale_datetime)
+)
+PARTITION BY RANGE COLUMNS(sale_datetime) (
+	PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+CREATE TABLE inventory_movement_archive(
+	movement_id INT NOT NULL,
+	product_id INT NOT NULL,
+	movement_type ENUM('STOCK_IN', 'SALE', 'ADJUSTMENT', 'OPENING') NOT NULL,
+	quantity INT NOT NULL,
+	unit_cost DECIMAL(10, 2) NULL,
+	sale_price DECIMAL(10, 2) NULL,
+	movement_date DATETIME NOT NULL,
+	stock_in_item_id INT NULL,
+	sale_item_id INT NULL,
+	notes VARCHAR(255),
+	PRIMARY KEY (movement_id, movement_date),
+	INDEX idx_ima_product_date (product_id, movement_date),
+	INDEX idx_ima_movement_date (movement_date)
+)
+PARTITION BY RANGE COLUMNS(movement_date) (
+	PARTITION pmax VALUES LESS THAN (MAXVALUE)
 );
 
 -- =================================================================
 --  VIEWS
 -- =================================================================
 
--- View for current product stock levels
+-- View for current product stock levels (reads the maintained balance, no aggregation)
 CREATE OR REPLACE VIEW v_product_stock AS
-SELECT 
+SELECT
     p.product_id,
     p.name,
     p.price,
     p.reorder_level,
     c.name AS category_name,
-    COALESCE(SUM(im.quantity), 0) AS stock_on_hand,
-    CASE 
-        WHEN COALESCE(SUM(im.quantity), 0) <= p.reorder_level 
-        THEN 1 ELSE 0 
-    END AS needs_restock
+    b.stock_on_hand,
+    b.needs_restock,
+    b.last_movement_at
 FROM product p
-LEFT JOIN category c ON p.category_id = c.category_id
-LEFT JOIN inventory_movement im ON p.product_id = im.product_id
-GROUP BY p.product_id, p.name, p.price, p.reorder_level, c.name;
+JOIN product_stock_balance b ON b.product_id = p.product_id
+LEFT JOIN category c ON p.category_id = c.category_id;
 
 -- View for calculating profitability of each sale item
 CREATE OR REPLACE VIEW v_profitability_report AS
@@ -135,38 +285,61 @@ SELECT
     si.discount,
     -- 1. Calculate the total revenue from this specific line item
     (si.quantity * si.unit_price * (1 - si.discount)) AS total_revenue,
-    -- 2. Calculate the weighted average cost of the product at the time of sale
-    (SELECT SUM(im_cost.quantity * im_cost.unit_cost) / SUM(im_cost.quantity)
-        FROM inventory_movement im_cost
-        WHERE im_cost.product_id = si.product_id
-          AND im_cost.movement_type IN ('STOCK_IN', 'OPENING')
-          AND im_cost.movement_date <= s.sale_datetime
-    ) AS average_cost_at_sale,
+    -- 2. The weighted average cost of the product at the time of sale, frozen on the line
+    si.unit_cost AS average_cost_at_sale,
     -- 3. Calculate the total cost for the items sold in this line
-    (si.quantity * ( 
-    			SELECT SUM(im_cost.quantity * im_cost.unit_cost) / SUM(im_cost.quantity)
-            FROM inventory_movement im_cost
-            WHERE im_cost.product_id = si.product_id
-              AND im_cost.movement_type IN ('STOCK_IN', 'OPENING')
-              AND im_cost.movement_date <= s.sale_datetime
-        )
-    ) AS total_cogs,
+    (si.quantity * si.unit_cost) AS total_cogs,
     -- 4. Calculate the final profit for this line item
-    (si.quantity * si.unit_price * (1 - si.discount)) - 
-    (si.quantity * (
-            SELECT SUM(im_cost.quantity * im_cost.unit_cost) / SUM(im_cost.quantity)
-            FROM inventory_movement im_cost
-            WHERE im_cost.product_id = si.product_id
-              AND im_cost.movement_type IN ('STOCK_IN', 'OPENING')
-              AND im_cost.movement_date <= s.sale_datetime
-        )
-    ) AS gross_profit
+    (si.quantity * si.unit_price * (1 - si.discount)) - (si.quantity * si.unit_cost) AS gross_profit
 FROM sale_item si
 JOIN sale s ON si.sale_id = s.sale_id
 JOIN product p ON si.product_id = p.product_id
 LEFT JOIN category c ON p.category_id = c.category_id;
 
 
+-- Hot plus archived rows. Read only when a requested date window reaches before
+-- archive_state.archived_before; MySQL pushes the date condition into both branches,
+-- so the archive side is pruned to the requested months.
+CREATE OR REPLACE VIEW v_sale_history AS
+SELECT sale_id, sale_datetime, total_amount, payment_method, notes FROM sale
+UNION ALL
+SELECT sale_id, sale_datetime, total_amount, payment_method, notes FROM sale_archive;
+
+CREATE OR REPLACE VIEW v_sale_item_history AS
+SELECT sale_item_id, sale_id, product_id, quantity, unit_price, discount, unit_cost FROM sale_item
+UNION ALL
+SELECT sale_item_id, sale_id, product_id, quantity, unit_price, discount, unit_cost FROM sale_item_archive;
+
+CREATE OR REPLACE VIEW v_inventory_movement_history AS
+SELECT movement_id, product_id, movement_type, quantity, unit_cost, sale_price, movement_date,
+       stock_in_item_id, sale_item_id, notes
+FROM inventory_movement
+UNION ALL
+SELECT movement_id, product_id, movement_type, quantity, unit_cost, sale_price, movement_date,
+       stock_in_item_id, sale_item_id, notes
+FROM inventory_movement_archive;
+
+CREATE OR REPLACE VIEW v_profitability_report_history AS
+SELECT * FROM v_profitability_report
+UNION ALL
+SELECT
+    si.sale_item_id,
+    si.sale_id,
+    si.sale_datetime,
+    p.product_id,
+    p.name AS product_name,
+    c.name AS category_name,
+    si.quantity,
+    si.unit_price,
+    si.discount,
+    (si.quantity * si.unit_price * (1 - si.discount)) AS total_revenue,
+    si.unit_cost AS average_cost_at_sale,
+    (si.quantity * si.unit_cost) AS total_cogs,
+    (si.quantity * si.unit_price * (1 - si.discount)) - (si.quantity * si.unit_cost) AS gross_profit
+FROM sale_item_archive si
+JOIN product p ON si.product_id = p.product_id
+LEFT JOIN category c ON p.category_id = c.category_id;
+
 -- =================================================================
 --  2. INSERT DATA
 -- =================================================================
@@ -246,109 +419,241 @@ SELECT sii.product_id, 'OPENING', sii.quantity, sii.unit_cost, sii.stock_in_item
 FROM stock_in_item sii
 JOIN stock_in si ON si.stock_in_id = sii.stock_in_id;
 
+-- Seed the stock balance from the movements above (triggers are not created yet)
+INSERT INTO product_stock_balance (product_id, stock_on_hand, needs_restock, last_movement_at,
+                                   cost_quantity, cost_value, last_cost_at, last_sale_at)
+SELECT
+    p.product_id,
+    COALESCE(SUM(im.quantity), 0),
+    COALESCE(SUM(im.quantity), 0) <= p.reorder_level,
+    MAX(im.movement_date),
+    COALESCE(SUM(CASE WHEN im.movement_type IN ('STOCK_IN', 'OPENING') THEN im.quantity END), 0),
+    COALESCE(SUM(CASE WHEN im.movement_type IN ('STOCK_IN', 'OPENING') THEN im.quantity * im.unit_cost END), 0),
+    MAX(CASE WHEN im.movement_type IN ('STOCK_IN', 'OPENING') THEN im.movement_date END),
+    MAX(CASE WHEN im.movement_type = 'SALE' THEN im.movement_date END)
+FROM product p
+LEFT JOIN inventory_movement im ON p.product_id = im.product_id
+GROUP BY p.product_id, p.reorder_level;
+
 -- =================================================================
 --  3. CREATE TRIGGERS
 -- =================================================================
 
 DELIMITER //
 
--- Updates total_cost AND creates the inventory movement record.
-CREATE TRIGGER trg_after_stock_in_item_insert
-AFTER INSERT ON stock_in_item
+-- Rejects a write dated inside the archived period: those rows have left the hot tables,
+-- so balances, totals and costs could no longer be kept consistent.
+-- The archive job sets @archiving = 1 on its own connection and is exempt.
+CREATE PROCEDURE sp_assert_not_archived(IN p_at DATETIME)
+BEGIN
+    IF @archiving IS NULL AND p_at < (SELECT archived_before FROM archive_state WHERE id = 1) THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'ARCHIVED_PERIOD';
+    END IF;
+END//
+
+-- Applies one movement (p_sign = 1) or its reversal (p_sign = -1) to the product's balance row:
+-- stock on hand, restock flag and, for STOCK_IN/OPENING, the running weighted average cost totals.
+-- A backdated movement also invalidates every stock snapshot taken at or after its date.
+-- Skipped while archiving: moving a movement to inventory_movement_archive changes no stock.
+CREATE PROCEDURE sp_apply_movement(
+    IN p_product_id INT,
+    IN p_movement_type VARCHAR(16),
+    IN p_quantity INT,
+    IN p_unit_cost DECIMAL(10,2),
+    IN p_movement_date DATETIME,
+    IN p_sign INT
+)
+apply_movement: BEGIN
+    DECLARE v_is_cost BOOLEAN DEFAULT p_movement_type IN ('STOCK_IN', 'OPENING');
+
+    IF @archiving = 1 THEN
+        LEAVE apply_movement;
+    END IF;
+    CALL sp_assert_not_archived(p_movement_date);
+
+    UPDATE product_stock_balance
+    SET stock_on_hand = stock_on_hand + p_sign * p_quantity,
+        needs_restock = stock_on_hand <= (SELECT reorder_level FROM product WHERE product_id = p_product_id),
+        last_movement_at = (SELECT MAX(movement_date) FROM inventory_movement WHERE product_id = p_product_id),
+        cost_quantity = cost_quantity + IF(v_is_cost, p_sign * p_quantity, 0),
+        cost_value = cost_value + IF(v_is_cost, p_sign * p_quantity * COALESCE(p_unit_cost, 0), 0),
+        last_cost_at = IF(v_is_cost, GREATEST(COALESCE(last_cost_at, p_movement_date), p_movement_date), last_cost_at),
+        last_sale_at = IF(p_movement_type = 'SALE', GREATEST(COALESCE(last_sale_at, p_movement_date), p_movement_date), last_sale_at)
+    WHERE product_id = p_product_id;
+
+    DELETE FROM stock_snapshot_period WHERE period_end >= p_movement_date;
+END apply_movement//
+
+-- Weighted average STOCK_IN/OPENING cost of a product as of p_at.
+-- Uses the running totals unless a cost movement is dated after p_at, then falls back to the history
+-- (hot and archived movements).
+CREATE FUNCTION fn_avg_cost_at(p_product_id INT, p_at DATETIME)
+RETURNS DECIMAL(14,4)
+READS SQL DATA
+BEGIN
+    DECLARE v_last_cost_at DATETIME;
+    DECLARE v_cost_quantity INT;
+    DECLARE v_cost_value DECIMAL(18,4);
+
+    SELECT last_cost_at, cost_quantity, cost_value
+    INTO v_last_cost_at, v_cost_quantity, v_cost_value
+    FROM product_stock_balance
+    WHERE product_id = p_product_id;
+
+    IF v_last_cost_at IS NULL OR v_last_cost_at <= p_at THEN
+        RETURN v_cost_value / NULLIF(v_cost_quantity, 0);
+    END IF;
+
+    RETURN (
+        SELECT SUM(im.quantity * im.unit_cost) / SUM(im.quantity)
+        FROM (
+            SELECT quantity, unit_cost FROM inventory_movement
+            WHERE product_id = p_product_id
+              AND movement_type IN ('STOCK_IN', 'OPENING')
+              AND movement_date <= p_at
+            UNION ALL
+            SELECT quantity, unit_cost FROM inventory_movement_archive
+            WHERE product_id = p_product_id
+              AND movement_type IN ('STOCK_IN', 'OPENING')
+              AND movement_date <= p_at
+        ) im
+    );
+END//
+
+-- Re-freezes unit_cost on the product's sale lines dated at or after p_from.
+-- Called when a stock in is deleted; the API does the same for line writes (services/ledger.py).
+CREATE PROCEDURE sp_refreeze_sale_costs(IN p_product_id INT, IN p_from DATETIME)
+BEGIN
+    IF p_from <= (SELECT last_sale_at FROM product_stock_balance WHERE product_id = p_product_id) THEN
+        UPDATE sale_item si
+        JOIN sale s ON s.sale_id = si.sale_id
+        SET si.unit_cost = fn_avg_cost_at(si.product_id, s.sale_datetime)
+        WHERE si.product_id = p_product_id
+          AND s.sale_datetime >= p_from;
+    END IF;
+END//
+
+-- Every new product starts with an empty balance row.
+CREATE TRIGGER trg_after_product_insert
+AFTER INSERT ON product
+FOR EACH ROW
+BEGIN
+    INSERT INTO product_stock_balance (product_id, stock_on_hand, needs_restock)
+    VALUES (NEW.product_id, 0, 0 <= NEW.reorder_level);
+END//
+
+-- Re-evaluates needs_restock when the reorder level changes.
+CREATE TRIGGER trg_after_product_update
+AFTER UPDATE ON product
+FOR EACH ROW
+BEGIN
+    IF NEW.reorder_level <> OLD.reorder_level THEN
+        UPDATE product_stock_balance
+        SET needs_restock = stock_on_hand <= NEW.reorder_level
+        WHERE product_id = NEW.product_id;
+    END IF;
+END//
+
+-- Low-stock alerts: only the balance rows a write actually touched are re-evaluated (by
+-- sp_apply_movement or trg_after_product_update), so a crossing is recorded here, once.
+CREATE TRIGGER trg_after_product_stock_balance_insert
+AFTER INSERT ON product_stock_balance
 FOR EACH ROW
 BEGIN
-    -- First, update the total cost on the parent table
-    UPDATE stock_in
-    SET total_cost = total_cost + (NEW.quantity * NEW.unit_cost)
-    WHERE stock_in_id = NEW.stock_in_id;
-
-	-- Second, create the corresponding inventory movement record
-    INSERT INTO inventory_movement(product_id, movement_type, quantity, unit_cost, stock_in_item_id, movement_date)
-    SELECT NEW.product_id, 'STOCK_IN', NEW.quantity, NEW.unit_cost, NEW.stock_in_item_id, si.stock_in_date
-    FROM stock_in si WHERE si.stock_in_id = NEW.stock_in_id;
+    IF NEW.needs_restock = 1 THEN
+        INSERT INTO stock_alert_event (product_id, needs_restock, stock_on_hand, reorder_level)
+        SELECT NEW.product_id, 1, NEW.stock_on_hand, reorder_level
+        FROM product WHERE product_id = NEW.product_id;
+    END IF;
 END//
 
--- Adjusts total_cost AND updates the inventory movement record.
-CREATE TRIGGER trg_after_stock_in_item_update
-AFTER UPDATE ON stock_in_item
+CREATE TRIGGER trg_after_product_stock_balance_update
+AFTER UPDATE ON product_stock_balance
 FOR EACH ROW
 BEGIN
-    -- First, adjust the total cost using both OLD and NEW values
-    UPDATE stock_in
-    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost) + (NEW.quantity * NEW.unit_cost)
-    WHERE stock_in_id = OLD.stock_in_id;
-
-    -- Second, update the corresponding inventory movement record
-    UPDATE inventory_movement im
-    JOIN stock_in si ON si.stock_in_id = OLD.stock_in_id
-    SET 
-        im.quantity = NEW.quantity,
-        im.unit_cost = NEW.unit_cost,
-        im.product_id = NEW.product_id,
-        im.movement_date = si.stock_in_date
-    WHERE im.stock_in_item_id = OLD.stock_in_item_id;
+    IF NEW.needs_restock <> OLD.needs_restock THEN
+        INSERT INTO stock_alert_event (product_id, needs_restock, stock_on_hand, reorder_level)
+        SELECT NEW.product_id, NEW.needs_restock, NEW.stock_on_hand, reorder_level
+        FROM product WHERE product_id = NEW.product_id;
+    END IF;
 END//
 
--- Adjusts total_cost AND deletes the inventory movement record.
-CREATE TRIGGER trg_before_stock_in_item_delete
-BEFORE DELETE ON stock_in_item
+-- Keeps product_stock_balance in step with every movement, whichever path wrote it.
+CREATE TRIGGER trg_after_inventory_movement_insert
+AFTER INSERT ON inventory_movement
 FOR EACH ROW
 BEGIN
-    -- First, subtract the item's cost from the parent's total
-    UPDATE stock_in
-    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost)
-    WHERE stock_in_id = OLD.stock_in_id;
+    CALL sp_apply_movement(NEW.product_id, NEW.movement_type, NEW.quantity, NEW.unit_cost, NEW.movement_date, 1);
+END//
 
-    -- Second, delete the corresponding inventory movement record
-    DELETE FROM inventory_movement WHERE stock_in_item_id = OLD.stock_in_item_id;
+CREATE TRIGGER trg_after_inventory_movement_update
+AFTER UPDATE ON inventory_movement
+FOR EACH ROW
+BEGIN
+    IF NEW.product_id <> OLD.product_id
+       OR NEW.movement_type <> OLD.movement_type
+       OR NEW.quantity <> OLD.quantity
+       OR NOT (NEW.unit_cost <=> OLD.unit_cost)
+       OR NEW.movement_date <> OLD.movement_date THEN
+        CALL sp_apply_movement(OLD.product_id, OLD.movement_type, OLD.quantity, OLD.unit_cost, OLD.movement_date, -1);
+        CALL sp_apply_movement(NEW.product_id, NEW.movement_type, NEW.quantity, NEW.unit_cost, NEW.movement_date, 1);
+    END IF;
 END//
 
--- Creates inventory movement AND adjusts sale total_amount after insert.
-CREATE TRIGGER trg_after_sale_item_insert
-AFTER INSERT ON sale_item
+CREATE TRIGGER trg_after_inventory_movement_delete
+AFTER DELETE ON inventory_movement
 FOR EACH ROW
 BEGIN
-  -- First, add the item's value to the sale's total_amount.
-  UPDATE sale
-  SET total_amount = total_amount + (NEW.quantity * NEW.unit_price * (1 - NEW.discount))
-  WHERE sale_id = NEW.sale_id;
-
-  -- Second, create the corresponding inventory movement record.
-  INSERT INTO inventory_movement (product_id, movement_type, quantity, sale_price, sale_item_id, movement_date)
-  SELECT NEW.product_id, 'SALE', -NEW.quantity, NEW.unit_price * (1 - NEW.discount), NEW.sale_item_id, s.sale_datetime
-  FROM sale s WHERE s.sale_id = NEW.sale_id;
+    CALL sp_apply_movement(OLD.product_id, OLD.movement_type, OLD.quantity, OLD.unit_cost, OLD.movement_date, -1);
 END//
 
--- Adjusts inventory movement AND sale total_amount after update.
-CREATE TRIGGER trg_after_sale_item_update
-AFTER UPDATE ON sale_item
+-- Removes the movements explicitly: the FK cascade on stock_in_item would not fire the triggers above.
+-- Then re-freezes the cost of any later sales of the affected products.
+CREATE TRIGGER trg_before_stock_in_delete
+BEFORE DELETE ON stock_in
 FOR EACH ROW
 BEGIN
-  -- First, adjust the sale's total_amount using both OLD and NEW values.
-  UPDATE sale
-  SET total_amount = total_amount - (OLD.quantity * OLD.unit_price * (1 - OLD.discount)) + (NEW.quantity * NEW.unit_price * (1 - NEW.discount))
-  WHERE sale_id = NEW.sale_id;
-
-  -- Second, update the quantity in the corresponding inventory movement record.
-  UPDATE inventory_movement im
-  SET im.quantity = -NEW.quantity, im.sale_price = NEW.unit_price * (1 - NEW.discount), im.product_id = NEW.product_id
-  WHERE sale_item_id = NEW.sale_item_id;
+  DECLARE v_done BOOLEAN DEFAULT FALSE;
+  DECLARE v_product_id INT;
+  DECLARE cur_products CURSOR FOR
+    SELECT DISTINCT product_id FROM stock_in_item WHERE stock_in_id = OLD.stock_in_id;
+  DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_done = TRUE;
+
+  -- Archived movements are no longer in inventory_movement to be reversed
+  CALL sp_assert_not_archived(OLD.stock_in_date);
+
+  DELETE im
+  FROM inventory_movement im
+  JOIN stock_in_item sii
+    ON sii.stock_in_item_id = im.stock_in_item_id
+  WHERE sii.stock_in_id = OLD.stock_in_id;
+
+  OPEN cur_products;
+  refreeze_loop: LOOP
+    FETCH cur_products INTO v_product_id;
+    IF v_done THEN
+      LEAVE refreeze_loop;
+    END IF;
+    CALL sp_refreeze_sale_costs(v_product_id, OLD.stock_in_date);
+  END LOOP;
+  CLOSE cur_products;
 END//
 
--- Deletes inventory movement AND adjusts sale total_amount before delete.
-CREATE TRIGGER trg_before_sale_item_delete
-BEFORE DELETE ON sale_item
+-- Stock-ins dated in the archived period are read-only, and none can be moved into it.
+CREATE TRIGGER trg_before_stock_in_update
+BEFORE UPDATE ON stock_in
 FOR EACH ROW
 BEGIN
-  -- First, subtract the item's value from the sale's total_amount.
-  UPDATE sale
-  SET total_amount = total_amount - (OLD.quantity * OLD.unit_price * (1 - OLD.discount))
-  WHERE sale_id = OLD.sale_id;
-  
-  -- Second, delete the corresponding inventory movement record.
-  DELETE FROM inventory_movement WHERE sale_item_id = OLD.sale_item_id;
+    IF NEW.stock_in_date <> OLD.stock_in_date THEN
+        CALL sp_assert_not_archived(OLD.stock_in_date);
+        CALL sp_assert_not_archived(NEW.stock_in_date);
+    END IF;
 END//
 
+-- sale_item and stock_in_item have no triggers: the API writes their header totals, frozen
+-- unit costs and movements set-based (app_api/services/ledger.py).
+
+-- Removes the movements explicitly: the FK cascade on sale_item would not fire the triggers above.
 CREATE TRIGGER trg_before_sale_delete
 BEFORE DELETE ON sale
 FOR EACH ROW
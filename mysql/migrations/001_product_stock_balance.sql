@@ -0,0 +1,121 @@
+-- =================================================================
+--  001: product_stock_balance
+--  Replaces the GROUP BY over inventory_movement behind v_product_stock
+--  with a per-product balance row kept up to date by triggers.
+--  Run on an existing database during a quiet period: the backfill and
+--  the trigger creation must not interleave with movement writes.
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS product_stock_balance(
+	product_id INT PRIMARY KEY,
+	stock_on_hand INT NOT NULL DEFAULT 0,
+	needs_restock TINYINT(1) NOT NULL DEFAULT 1,
+	last_movement_at DATETIME NULL,
+	CONSTRAINT fk_psb_product FOREIGN KEY (product_id)
+		REFERENCES product(product_id)
+		ON UPDATE CASCADE ON DELETE CASCADE,
+	INDEX idx_psb_restock (needs_restock)
+);
+
+DELETE FROM product_stock_balance;
+
+INSERT INTO product_stock_balance (product_id, stock_on_hand, needs_restock, last_movement_at)
+SELECT
+    p.product_id,
+    COALESCE(SUM(im.quantity), 0),
+    COALESCE(SUM(im.quantity), 0) <= p.reorder_level,
+    MAX(im.movement_date)
+FROM product p
+LEFT JOIN inventory_movement im ON p.product_id = im.product_id
+GROUP BY p.product_id, p.reorder_level;
+
+CREATE OR REPLACE VIEW v_product_stock AS
+SELECT
+    p.product_id,
+    p.name,
+    p.price,
+    p.reorder_level,
+    c.name AS category_name,
+    b.stock_on_hand,
+    b.needs_restock,
+    b.last_movement_at
+FROM product p
+JOIN product_stock_balance b ON b.product_id = p.product_id
+LEFT JOIN category c ON p.category_id = c.category_id;
+
+DROP PROCEDURE IF EXISTS sp_apply_stock_delta;
+DROP TRIGGER IF EXISTS trg_after_product_insert;
+DROP TRIGGER IF EXISTS trg_after_product_update;
+DROP TRIGGER IF EXISTS trg_after_inventory_movement_insert;
+DROP TRIGGER IF EXISTS trg_after_inventory_movement_update;
+DROP TRIGGER IF EXISTS trg_after_inventory_movement_delete;
+DROP TRIGGER IF EXISTS trg_before_stock_in_delete;
+
+DELIMITER //
+
+CREATE PROCEDURE sp_apply_stock_delta(IN p_product_id INT, IN p_delta INT)
+BEGIN
+    UPDATE product_stock_balance
+    SET stock_on_hand = stock_on_hand + p_delta,
+        needs_restock = stock_on_hand <= (SELECT reorder_level FROM product WHERE product_id = p_product_id),
+        last_movement_at = (SELECT MAX(movement_date) FROM inventory_movement WHERE product_id = p_product_id)
+    WHERE product_id = p_product_id;
+END//
+
+CREATE TRIGGER trg_after_product_insert
+AFTER INSERT ON product
+FOR EACH ROW
+BEGIN
+    INSERT INTO product_stock_balance (product_id, stock_on_hand, needs_restock)
+    VALUES (NEW.product_id, 0, 0 <= NEW.reorder_level);
+END//
+
+CREATE TRIGGER trg_after_product_update
+AFTER UPDATE ON product
+FOR EACH ROW
+BEGIN
+    IF NEW.reorder_level <> OLD.reorder_level THEN
+        UPDATE product_stock_balance
+        SET needs_restock = stock_on_hand <= NEW.reorder_level
+        WHERE product_id = NEW.product_id;
+    END IF;
+END//
+
+CREATE TRIGGER trg_after_inventory_movement_insert
+AFTER INSERT ON inventory_movement
+FOR EACH ROW
+BEGIN
+    CALL sp_apply_stock_delta(NEW.product_id, NEW.quantity);
+END//
+
+CREATE TRIGGER trg_after_inventory_movement_update
+AFTER UPDATE ON inventory_movement
+FOR EACH ROW
+BEGIN
+    IF NEW.product_id <> OLD.product_id
+       OR NEW.quantity <> OLD.quantity
+       OR NEW.movement_date <> OLD.movement_date THEN
+        CALL sp_apply_stock_delta(OLD.product_id, -OLD.quantity);
+        CALL sp_apply_stock_delta(NEW.product_id, NEW.quantity);
+    END IF;
+END//
+
+CREATE TRIGGER trg_after_inventory_movement_delete
+AFTER DELETE ON inventory_movement
+FOR EACH ROW
+BEGIN
+    CALL sp_apply_stock_delta(OLD.product_id, -OLD.quantity);
+END//
+
+CREATE TRIGGER trg_before_stock_in_delete
+BEFORE DELETE ON stock_in
+FOR EACH ROW
+BEGIN
+  DELETE im
+  FROM inventory_movement im
+  JOIN stock_in_item sii
+    ON sii.stock_in_item_id = im.stock_in_item_id
+  WHERE sii.stock_in_id = OLD.stock_in_id;
+END//
+
+DELIMITER ;
@@ -0,0 +1,296 @@
+-- =================================================================
+--  002: running weighted average cost
+--  Keeps STOCK_IN/OPENING cost totals on product_stock_balance, freezes
+--  the average cost onto sale_item.unit_cost when the line is written and
+--  re-freezes later sales of a product when a backdated stock in arrives.
+--  v_profitability_report then reads the frozen cost instead of running a
+--  correlated subquery over inventory_movement for every sale line.
+--  Requires 001. Run during a quiet period.
+-- =================================================================
+
+ALTER TABLE product_stock_balance
+	ADD COLUMN cost_quantity INT NOT NULL DEFAULT 0,
+	ADD COLUMN cost_value DECIMAL(18,4) NOT NULL DEFAULT 0,
+	ADD COLUMN last_cost_at DATETIME NULL,
+	ADD COLUMN last_sale_at DATETIME NULL;
+
+ALTER TABLE sale_item
+	ADD COLUMN unit_cost DECIMAL(14,4) NULL;
+
+DROP PROCEDURE IF EXISTS sp_apply_stock_delta;
+DROP PROCEDURE IF EXISTS sp_apply_movement;
+DROP FUNCTION IF EXISTS fn_avg_cost_at;
+DROP PROCEDURE IF EXISTS sp_refreeze_sale_costs;
+DROP TRIGGER IF EXISTS trg_after_inventory_movement_insert;
+DROP TRIGGER IF EXISTS trg_after_inventory_movement_update;
+DROP TRIGGER IF EXISTS trg_after_inventory_movement_delete;
+DROP TRIGGER IF EXISTS trg_before_stock_in_delete;
+DROP TRIGGER IF EXISTS trg_after_stock_in_item_insert;
+DROP TRIGGER IF EXISTS trg_after_stock_in_item_update;
+DROP TRIGGER IF EXISTS trg_before_stock_in_item_delete;
+DROP TRIGGER IF EXISTS trg_before_sale_item_insert;
+DROP TRIGGER IF EXISTS trg_before_sale_item_update;
+DROP TRIGGER IF EXISTS trg_after_sale_item_update;
+
+DELIMITER //
+
+CREATE PROCEDURE sp_apply_movement(
+    IN p_product_id INT,
+    IN p_movement_type VARCHAR(16),
+    IN p_quantity INT,
+    IN p_unit_cost DECIMAL(10,2),
+    IN p_movement_date DATETIME,
+    IN p_sign INT
+)
+BEGIN
+    DECLARE v_is_cost BOOLEAN DEFAULT p_movement_type IN ('STOCK_IN', 'OPENING');
+
+    UPDATE product_stock_balance
+    SET stock_on_hand = stock_on_hand + p_sign * p_quantity,
+        needs_restock = stock_on_hand <= (SELECT reorder_level FROM product WHERE product_id = p_product_id),
+        last_movement_at = (SELECT MAX(movement_date) FROM inventory_movement WHERE product_id = p_product_id),
+        cost_quantity = cost_quantity + IF(v_is_cost, p_sign * p_quantity, 0),
+        cost_value = cost_value + IF(v_is_cost, p_sign * p_quantity * COALESCE(p_unit_cost, 0), 0),
+        last_cost_at = IF(v_is_cost, GREATEST(COALESCE(last_cost_at, p_movement_date), p_movement_date), last_cost_at),
+        last_sale_at = IF(p_movement_type = 'SALE', GREATEST(COALESCE(last_sale_at, p_movement_date), p_movement_date), last_sale_at)
+    WHERE product_id = p_product_id;
+END//
+
+CREATE FUNCTION fn_avg_cost_at(p_product_id INT, p_at DATETIME)
+RETURNS DECIMAL(14,4)
+READS SQL DATA
+BEGIN
+    DECLARE v_last_cost_at DATETIME;
+    DECLARE v_cost_quantity INT;
+    DECLARE v_cost_value DECIMAL(18,4);
+
+    SELECT last_cost_at, cost_quantity, cost_value
+    INTO v_last_cost_at, v_cost_quantity, v_cost_value
+    FROM product_stock_balance
+    WHERE product_id = p_product_id;
+
+    IF v_last_cost_at IS NULL OR v_last_cost_at <= p_at THEN
+        RETURN v_cost_value / NULLIF(v_cost_quantity, 0);
+    END IF;
+
+    RETURN (
+        SELECT SUM(im.quantity * im.unit_cost) / SUM(im.quantity)
+        FROM inventory_movement im
+        WHERE im.product_id = p_product_id
+          AND im.movement_type IN ('STOCK_IN', 'OPENING')
+          AND im.movement_date <= p_at
+    );
+END//
+
+CREATE PROCEDURE sp_refreeze_sale_costs(IN p_product_id INT, IN p_from DATETIME)
+BEGIN
+    IF p_from <= (SELECT last_sale_at FROM product_stock_balance WHERE product_id = p_product_id) THEN
+        UPDATE sale_item si
+        JOIN sale s ON s.sale_id = si.sale_id
+        SET si.unit_cost = fn_avg_cost_at(si.product_id, s.sale_datetime)
+        WHERE si.product_id = p_product_id
+          AND s.sale_datetime >= p_from;
+    END IF;
+END//
+
+CREATE TRIGGER trg_after_inventory_movement_insert
+AFTER INSERT ON inventory_movement
+FOR EACH ROW
+BEGIN
+    CALL sp_apply_movement(NEW.product_id, NEW.movement_type, NEW.quantity, NEW.unit_cost, NEW.movement_date, 1);
+END//
+
+CREATE TRIGGER trg_after_inventory_movement_update
+AFTER UPDATE ON inventory_movement
+FOR EACH ROW
+BEGIN
+    IF NEW.product_id <> OLD.product_id
+       OR NEW.movement_type <> OLD.movement_type
+       OR NEW.quantity <> OLD.quantity
+       OR NOT (NEW.unit_cost <=> OLD.unit_cost)
+       OR NEW.movement_date <> OLD.movement_date THEN
+        CALL sp_apply_movement(OLD.product_id, OLD.movement_type, OLD.quantity, OLD.unit_cost, OLD.movement_date, -1);
+        CALL sp_apply_movement(NEW.product_id, NEW.movement_type, NEW.quantity, NEW.unit_cost, NEW.movement_date, 1);
+    END IF;
+END//
+
+CREATE TRIGGER trg_after_inventory_movement_delete
+AFTER DELETE ON inventory_movement
+FOR EACH ROW
+BEGIN
+    CALL sp_apply_movement(OLD.product_id, OLD.movement_type, OLD.quantity, OLD.unit_cost, OLD.movement_date, -1);
+END//
+
+CREATE TRIGGER trg_before_stock_in_delete
+BEFORE DELETE ON stock_in
+FOR EACH ROW
+BEGIN
+  DECLARE v_done BOOLEAN DEFAULT FALSE;
+  DECLARE v_product_id INT;
+  DECLARE cur_products CURSOR FOR
+    SELECT DISTINCT product_id FROM stock_in_item WHERE stock_in_id = OLD.stock_in_id;
+  DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_done = TRUE;
+
+  DELETE im
+  FROM inventory_movement im
+  JOIN stock_in_item sii
+    ON sii.stock_in_item_id = im.stock_in_item_id
+  WHERE sii.stock_in_id = OLD.stock_in_id;
+
+  OPEN cur_products;
+  refreeze_loop: LOOP
+    FETCH cur_products INTO v_product_id;
+    IF v_done THEN
+      LEAVE refreeze_loop;
+    END IF;
+    CALL sp_refreeze_sale_costs(v_product_id, OLD.stock_in_date);
+  END LOOP;
+  CLOSE cur_products;
+END//
+
+CREATE TRIGGER trg_after_stock_in_item_insert
+AFTER INSERT ON stock_in_item
+FOR EACH ROW
+BEGIN
+    -- First, update the total cost on the parent table
+    UPDATE stock_in
+    SET total_cost = total_cost + (NEW.quantity * NEW.unit_cost)
+    WHERE stock_in_id = NEW.stock_in_id;
+
+	-- Second, create the corresponding inventory movement record
+    INSERT INTO inventory_movement(product_id, movement_type, quantity, unit_cost, stock_in_item_id, movement_date)
+    SELECT NEW.product_id, 'STOCK_IN', NEW.quantity, NEW.unit_cost, NEW.stock_in_item_id, si.stock_in_date
+    FROM stock_in si WHERE si.stock_in_id = NEW.stock_in_id;
+
+    -- Third, re-freeze the cost of sales dated after a backdated stock in
+    CALL sp_refreeze_sale_costs(NEW.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = NEW.stock_in_id));
+END//
+
+CREATE TRIGGER trg_after_stock_in_item_update
+AFTER UPDATE ON stock_in_item
+FOR EACH ROW
+BEGIN
+    -- First, adjust the total cost using both OLD and NEW values
+    UPDATE stock_in
+    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost) + (NEW.quantity * NEW.unit_cost)
+    WHERE stock_in_id = OLD.stock_in_id;
+
+    -- Second, update the corresponding inventory movement record
+    UPDATE inventory_movement im
+    JOIN stock_in si ON si.stock_in_id = OLD.stock_in_id
+    SET 
+        im.quantity = NEW.quantity,
+        im.unit_cost = NEW.unit_cost,
+        im.product_id = NEW.product_id,
+        im.movement_date = si.stock_in_date
+    WHERE im.stock_in_item_id = OLD.stock_in_item_id;
+
+    -- Third, re-freeze the cost of sales dated after this stock in
+    IF NEW.quantity <> OLD.quantity OR NEW.unit_cost <> OLD.unit_cost OR NEW.product_id <> OLD.product_id THEN
+        CALL sp_refreeze_sale_costs(OLD.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+        IF NEW.product_id <> OLD.product_id THEN
+            CALL sp_refreeze_sale_costs(NEW.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+        END IF;
+    END IF;
+END//
+
+CREATE TRIGGER trg_before_stock_in_item_delete
+BEFORE DELETE ON stock_in_item
+FOR EACH ROW
+BEGIN
+    -- First, subtract the item's cost from the parent's total
+    UPDATE stock_in
+    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost)
+    WHERE stock_in_id = OLD.stock_in_id;
+
+    -- Second, delete the corresponding inventory movement record
+    DELETE FROM inventory_movement WHERE stock_in_item_id = OLD.stock_in_item_id;
+
+    -- Third, re-freeze the cost of sales dated after this stock in
+    CALL sp_refreeze_sale_costs(OLD.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+END//
+
+CREATE TRIGGER trg_before_sale_item_insert
+BEFORE INSERT ON sale_item
+FOR EACH ROW
+BEGIN
+  SET NEW.unit_cost = fn_avg_cost_at(NEW.product_id, (SELECT sale_datetime FROM sale WHERE sale_id = NEW.sale_id));
+END//
+
+CREATE TRIGGER trg_before_sale_item_update
+BEFORE UPDATE ON sale_item
+FOR EACH ROW
+BEGIN
+  IF NEW.product_id <> OLD.product_id THEN
+    SET NEW.unit_cost = fn_avg_cost_at(NEW.product_id, (SELECT sale_datetime FROM sale WHERE sale_id = NEW.sale_id));
+  END IF;
+END//
+
+CREATE TRIGGER trg_after_sale_item_update
+AFTER UPDATE ON sale_item
+FOR EACH ROW
+BEGIN
+  -- Cost re-freezes only touch unit_cost, nothing to propagate then.
+  IF NEW.quantity <> OLD.quantity
+     OR NEW.unit_price <> OLD.unit_price
+     OR NEW.discount <> OLD.discount
+     OR NEW.product_id <> OLD.product_id THEN
+    -- First, adjust the sale's total_amount using both OLD and NEW values.
+    UPDATE sale
+    SET total_amount = total_amount - (OLD.quantity * OLD.unit_price * (1 - OLD.discount)) + (NEW.quantity * NEW.unit_price * (1 - NEW.discount))
+    WHERE sale_id = NEW.sale_id;
+
+    -- Second, update the quantity in the corresponding inventory movement record.
+    UPDATE inventory_movement im
+    SET im.quantity = -NEW.quantity, im.sale_price = NEW.unit_price * (1 - NEW.discount), im.product_id = NEW.product_id
+    WHERE sale_item_id = NEW.sale_item_id;
+  END IF;
+END//
+
+DELIMITER ;
+
+-- Backfill the cost totals from the movement history
+UPDATE product_stock_balance b
+JOIN (
+    SELECT
+        product_id,
+        COALESCE(SUM(CASE WHEN movement_type IN ('STOCK_IN', 'OPENING') THEN quantity END), 0) AS cost_quantity,
+        COALESCE(SUM(CASE WHEN movement_type IN ('STOCK_IN', 'OPENING') THEN quantity * unit_cost END), 0) AS cost_value,
+        MAX(CASE WHEN movement_type IN ('STOCK_IN', 'OPENING') THEN movement_date END) AS last_cost_at,
+        MAX(CASE WHEN movement_type = 'SALE' THEN movement_date END) AS last_sale_at
+    FROM inventory_movement
+    GROUP BY product_id
+) m ON m.product_id = b.product_id
+SET b.cost_quantity = m.cost_quantity,
+    b.cost_value = m.cost_value,
+    b.last_cost_at = m.last_cost_at,
+    b.last_sale_at = m.last_sale_at;
+
+-- Freeze the cost of existing sale lines once (the guarded update trigger does not touch totals)
+UPDATE sale_item si
+JOIN sale s ON s.sale_id = si.sale_id
+SET si.unit_cost = fn_avg_cost_at(si.product_id, s.sale_datetime);
+
+CREATE OR REPLACE VIEW v_profitability_report AS
+SELECT 
+    si.sale_item_id,
+    s.sale_id,
+    s.sale_datetime,
+    p.product_id,
+    p.name AS product_name,
+    c.name AS category_name,
+    si.quantity,
+    si.unit_price,
+    si.discount,
+    -- 1. Calculate the total revenue from this specific line item
+    (si.quantity * si.unit_price * (1 - si.discount)) AS total_revenue,
+    -- 2. The weighted average cost of the product at the time of sale, frozen on the line
+    si.unit_cost AS average_cost_at_sale,
+    -- 3. Calculate the total cost for the items sold in this line
+    (si.quantity * si.unit_cost) AS total_cogs,
+    -- 4. Calculate the final profit for this line item
+    (si.quantity * si.unit_price * (1 - si.discount)) - (si.quantity * si.unit_cost) AS gross_profit
+FROM sale_item si
+JOIN sale s ON si.sale_id = s.sale_id
+JOIN product p ON si.product_id = p.product_id
+LEFT JOIN category c ON p.category_id = c.category_id;
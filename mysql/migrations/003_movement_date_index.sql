@@ -0,0 +1,9 @@
+-- =================================================================
+--  003: index for keyset paging of the movement ledger
+--  idx_im_product_date only serves listings filtered by product; the
+--  unfiltered ledger is ordered by (movement_date, movement_id), which
+--  this index provides (InnoDB appends the primary key).
+-- =================================================================
+
+ALTER TABLE inventory_movement
+	ADD INDEX idx_im_movement_date (movement_date);
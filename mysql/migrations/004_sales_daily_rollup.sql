@@ -0,0 +1,39 @@
+-- =================================================================
+--  004: sales_daily_rollup
+--  Per (day, product, payment method) totals of the sale lines, read
+--  by /reports/profitability/summary instead of scanning every line.
+--  The API keeps it current on each sale and stock-in write; this
+--  script creates it and backfills from the existing sales.
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS sales_daily_rollup(
+	sale_date DATE NOT NULL,
+	product_id INT NOT NULL,
+	payment_method ENUM('Cash','Card','QR') NOT NULL,
+	line_count INT NOT NULL,
+	quantity INT NOT NULL,
+	revenue DECIMAL(18,4) NOT NULL,
+	cogs DECIMAL(18,4) NULL,
+	gross_profit DECIMAL(18,4) NULL,
+	PRIMARY KEY (sale_date, product_id, payment_method),
+	CONSTRAINT fk_sdr_product FOREIGN KEY (product_id)
+		REFERENCES product(product_id)
+		ON UPDATE CASCADE ON DELETE CASCADE,
+	INDEX idx_sdr_product_date (product_id, sale_date)
+);
+
+DELETE FROM sales_daily_rollup;
+
+INSERT INTO sales_daily_rollup (sale_date, product_id, payment_method, line_count, quantity, revenue, cogs, gross_profit)
+SELECT
+    DATE(s.sale_datetime),
+    si.product_id,
+    s.payment_method,
+    COUNT(*),
+    SUM(si.quantity),
+    SUM(si.quantity * si.unit_price * (1 - si.discount)),
+    SUM(si.quantity * si.unit_cost),
+    SUM(si.quantity * si.unit_price * (1 - si.discount) - si.quantity * si.unit_cost)
+FROM sale_item si
+JOIN sale s ON s.sale_id = si.sale_id
+GROUP BY DATE(s.sale_datetime), si.product_id, s.payment_method;
@@ -0,0 +1,16 @@
+-- =================================================================
+--  005: n-gram full-text indexes for the search boxes
+--  Replaces leading-wildcard ILIKE scans on product name/SKU, sale
+--  notes and stock-in ref no./notes. Needs ngram_token_size = 2 and
+--  innodb_ft_enable_stopword = OFF (mysql/my.cnf) to be in effect
+--  before the indexes are built; both are read at server start.
+-- =================================================================
+
+ALTER TABLE product
+	ADD FULLTEXT INDEX ft_product_name_sku (name, sku) WITH PARSER ngram;
+
+ALTER TABLE sale
+	ADD FULLTEXT INDEX ft_sale_notes (notes) WITH PARSER ngram;
+
+ALTER TABLE stock_in
+	ADD FULLTEXT INDEX ft_stock_in_ref_notes (ref_no, notes) WITH PARSER ngram;
@@ -0,0 +1,58 @@
+-- =================================================================
+--  006: periodic stock snapshots
+--  Closing stock per product at each period end, for "stock as of"
+--  reports (/reports/product-stock?as_of=...). Snapshots are written
+--  by the API (services/snapshots.py, `python manage.py
+--  snapshot-stock`); sp_apply_movement deletes every period at or
+--  after the date of a backdated movement so no stale snapshot is read.
+--  Requires 002.
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS stock_snapshot_period(
+	period_end DATETIME PRIMARY KEY,
+	taken_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS stock_snapshot(
+	period_end DATETIME NOT NULL,
+	product_id INT NOT NULL,
+	stock_on_hand INT NOT NULL,
+	last_movement_at DATETIME NULL,
+	PRIMARY KEY (period_end, product_id),
+	CONSTRAINT fk_ss_period FOREIGN KEY (period_end)
+		REFERENCES stock_snapshot_period(period_end)
+		ON UPDATE CASCADE ON DELETE CASCADE,
+	CONSTRAINT fk_ss_product FOREIGN KEY (product_id)
+		REFERENCES product(product_id)
+		ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+DROP PROCEDURE IF EXISTS sp_apply_movement;
+
+DELIMITER //
+
+CREATE PROCEDURE sp_apply_movement(
+    IN p_product_id INT,
+    IN p_movement_type VARCHAR(16),
+    IN p_quantity INT,
+    IN p_unit_cost DECIMAL(10,2),
+    IN p_movement_date DATETIME,
+    IN p_sign INT
+)
+BEGIN
+    DECLARE v_is_cost BOOLEAN DEFAULT p_movement_type IN ('STOCK_IN', 'OPENING');
+
+    UPDATE product_stock_balance
+    SET stock_on_hand = stock_on_hand + p_sign * p_quantity,
+        needs_restock = stock_on_hand <= (SELECT reorder_level FROM product WHERE product_id = p_product_id),
+        last_movement_at = (SELECT MAX(movement_date) FROM inventory_movement WHERE product_id = p_product_id),
+        cost_quantity = cost_quantity + IF(v_is_cost, p_sign * p_quantity, 0),
+        cost_value = cost_value + IF(v_is_cost, p_sign * p_quantity * COALESCE(p_unit_cost, 0), 0),
+        last_cost_at = IF(v_is_cost, GREATEST(COALESCE(last_cost_at, p_movement_date), p_movement_date), last_cost_at),
+        last_sale_at = IF(p_movement_type = 'SALE', GREATEST(COALESCE(last_sale_at, p_movement_date), p_movement_date), last_sale_at)
+    WHERE product_id = p_product_id;
+
+    DELETE FROM stock_snapshot_period WHERE period_end >= p_movement_date;
+END//
+
+DELIMITER ;
@@ -0,0 +1,301 @@
+-- =================================================================
+--  007: hot/archive table pairs
+--  sale, sale_item and inventory_movement keep their foreign keys and
+--  triggers and only hold the recent (hot) period. Older months are
+--  moved in small batches by `python manage.py archive` into the
+--  *_archive tables, which are partitioned by month. The archived
+--  period becomes read-only (sp_assert_not_archived), and the
+--  v_*_history views serve date windows that reach into it.
+--  Requires 002 and 006.
+-- =================================================================
+
+-- Everything dated before archived_before has been moved out of sale, sale_item and
+-- inventory_movement into the *_archive tables below (python manage.py archive).
+-- The archived period is read-only: see sp_assert_not_archived.
+CREATE TABLE IF NOT EXISTS archive_state(
+	id TINYINT PRIMARY KEY,
+	archived_before DATETIME NOT NULL
+);
+
+INSERT IGNORE INTO archive_state (id, archived_before) VALUES (1, '1000-01-01 00:00:00');
+
+-- Archive tables are partitioned by month so date-filtered reads only open the months asked for.
+-- Partitioned InnoDB tables cannot have foreign keys; the rows are immutable copies whose
+-- references were checked while they lived in the hot tables. The partitioning column has to be
+-- part of every unique key, hence the composite primary keys. The archive job splits pmax
+-- (always empty) into one partition per month before moving that month in.
+CREATE TABLE IF NOT EXISTS sale_archive(
+	sale_id INT NOT NULL,
+	sale_datetime DATETIME NOT NULL,
+	total_amount DECIMAL(10,2) NOT NULL,
+	payment_method ENUM('Cash','Card','QR') NOT NULL,
+	notes VARCHAR(255) NULL,
+	PRIMARY KEY (sale_id, sale_datetime),
+	INDEX idx_sale_archive_datetime (sale_datetime)
+)
+PARTITION BY RANGE COLUMNS(sale_datetime) (
+	PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+CREATE TABLE IF NOT EXISTS sale_item_archive(
+	sale_item_id INT NOT NULL,
+	sale_id INT NOT NULL,
+	sale_datetime DATETIME NOT NULL, -- Copied from the sale, for partitioning
+	product_id INT NOT NULL,
+	quantity INT NOT NULL,
+	unit_price DECIMAL(10,2) NOT NULL,
+	discount DECIMAL(10,2) NOT NULL DEFAULT 0,
+	unit_cost DECIMAL(14,4) NULL,
+	PRIMARY KEY (sale_item_id, sale_datetime),
+	INDEX idx_sale_item_archive_sale (sale_id),
+	INDEX idx_sale_item_archive_product (product_id, sale_datetime)
+)
+PARTITION BY RANGE COLUMNS(sale_datetime) (
+	PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+CREATE TABLE IF NOT EXISTS inventory_movement_archive(
+	movement_id INT NOT NULL,
+	product_id INT NOT NULL,
+	movement_type ENUM('STOCK_IN', 'SALE', 'ADJUSTMENT', 'OPENING') NOT NULL,
+	quantity INT NOT NULL,
+	unit_cost DECIMAL(10, 2) NULL,
+	sale_price DECIMAL(10, 2) NULL,
+	movement_date DATETIME NOT NULL,
+	stock_in_item_id INT NULL,
+	sale_item_id INT NULL,
+	notes VARCHAR(255),
+	PRIMARY KEY (movement_id, movement_date),
+	INDEX idx_ima_product_date (product_id, movement_date),
+	INDEX idx_ima_movement_date (movement_date)
+)
+PARTITION BY RANGE COLUMNS(movement_date) (
+	PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+-- Hot plus archived rows. Read only when a requested date window reaches before
+-- archive_state.archived_before; MySQL pushes the date condition into both branches,
+-- so the archive side is pruned to the requested months.
+CREATE OR REPLACE VIEW v_sale_history AS
+SELECT sale_id, sale_datetime, total_amount, payment_method, notes FROM sale
+UNION ALL
+SELECT sale_id, sale_datetime, total_amount, payment_method, notes FROM sale_archive;
+
+CREATE OR REPLACE VIEW v_sale_item_history AS
+SELECT sale_item_id, sale_id, product_id, quantity, unit_price, discount, unit_cost FROM sale_item
+UNION ALL
+SELECT sale_item_id, sale_id, product_id, quantity, unit_price, discount, unit_cost FROM sale_item_archive;
+
+CREATE OR REPLACE VIEW v_inventory_movement_history AS
+SELECT movement_id, product_id, movement_type, quantity, unit_cost, sale_price, movement_date,
+       stock_in_item_id, sale_item_id, notes
+FROM inventory_movement
+UNION ALL
+SELECT movement_id, product_id, movement_type, quantity, unit_cost, sale_price, movement_date,
+       stock_in_item_id, sale_item_id, notes
+FROM inventory_movement_archive;
+
+CREATE OR REPLACE VIEW v_profitability_report_history AS
+SELECT * FROM v_profitability_report
+UNION ALL
+SELECT
+    si.sale_item_id,
+    si.sale_id,
+    si.sale_datetime,
+    p.product_id,
+    p.name AS product_name,
+    c.name AS category_name,
+    si.quantity,
+    si.unit_price,
+    si.discount,
+    (si.quantity * si.unit_price * (1 - si.discount)) AS total_revenue,
+    si.unit_cost AS average_cost_at_sale,
+    (si.quantity * si.unit_cost) AS total_cogs,
+    (si.quantity * si.unit_price * (1 - si.discount)) - (si.quantity * si.unit_cost) AS gross_profit
+FROM sale_item_archive si
+JOIN product p ON si.product_id = p.product_id
+LEFT JOIN category c ON p.category_id = c.category_id;
+
+DROP PROCEDURE IF EXISTS sp_assert_not_archived;
+DROP PROCEDURE IF EXISTS sp_apply_movement;
+DROP FUNCTION IF EXISTS fn_avg_cost_at;
+DROP TRIGGER IF EXISTS trg_before_stock_in_delete;
+DROP TRIGGER IF EXISTS trg_before_stock_in_update;
+DROP TRIGGER IF EXISTS trg_after_stock_in_item_update;
+DROP TRIGGER IF EXISTS trg_before_stock_in_item_delete;
+
+DELIMITER //
+
+-- Rejects a write dated inside the archived period: those rows have left the hot tables,
+-- so the triggers below could no longer keep balances, totals and costs consistent.
+-- The archive job sets @archiving = 1 on its own connection and is exempt.
+CREATE PROCEDURE sp_assert_not_archived(IN p_at DATETIME)
+BEGIN
+    IF @archiving IS NULL AND p_at < (SELECT archived_before FROM archive_state WHERE id = 1) THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'ARCHIVED_PERIOD';
+    END IF;
+END//
+
+-- Applies one movement (p_sign = 1) or its reversal (p_sign = -1) to the product's balance row:
+-- stock on hand, restock flag and, for STOCK_IN/OPENING, the running weighted average cost totals.
+-- A backdated movement also invalidates every stock snapshot taken at or after its date.
+-- Skipped while archiving: moving a movement to inventory_movement_archive changes no stock.
+CREATE PROCEDURE sp_apply_movement(
+    IN p_product_id INT,
+    IN p_movement_type VARCHAR(16),
+    IN p_quantity INT,
+    IN p_unit_cost DECIMAL(10,2),
+    IN p_movement_date DATETIME,
+    IN p_sign INT
+)
+apply_movement: BEGIN
+    DECLARE v_is_cost BOOLEAN DEFAULT p_movement_type IN ('STOCK_IN', 'OPENING');
+
+    IF @archiving = 1 THEN
+        LEAVE apply_movement;
+    END IF;
+    CALL sp_assert_not_archived(p_movement_date);
+
+    UPDATE product_stock_balance
+    SET stock_on_hand = stock_on_hand + p_sign * p_quantity,
+        needs_restock = stock_on_hand <= (SELECT reorder_level FROM product WHERE product_id = p_product_id),
+        last_movement_at = (SELECT MAX(movement_date) FROM inventory_movement WHERE product_id = p_product_id),
+        cost_quantity = cost_quantity + IF(v_is_cost, p_sign * p_quantity, 0),
+        cost_value = cost_value + IF(v_is_cost, p_sign * p_quantity * COALESCE(p_unit_cost, 0), 0),
+        last_cost_at = IF(v_is_cost, GREATEST(COALESCE(last_cost_at, p_movement_date), p_movement_date), last_cost_at),
+        last_sale_at = IF(p_movement_type = 'SALE', GREATEST(COALESCE(last_sale_at, p_movement_date), p_movement_date), last_sale_at)
+    WHERE product_id = p_product_id;
+
+    DELETE FROM stock_snapshot_period WHERE period_end >= p_movement_date;
+END apply_movement//
+
+-- Weighted average STOCK_IN/OPENING cost of a product as of p_at.
+-- Uses the running totals unless a cost movement is dated after p_at, then falls back to the history
+-- (hot and archived movements).
+CREATE FUNCTION fn_avg_cost_at(p_product_id INT, p_at DATETIME)
+RETURNS DECIMAL(14,4)
+READS SQL DATA
+BEGIN
+    DECLARE v_last_cost_at DATETIME;
+    DECLARE v_cost_quantity INT;
+    DECLARE v_cost_value DECIMAL(18,4);
+
+    SELECT last_cost_at, cost_quantity, cost_value
+    INTO v_last_cost_at, v_cost_quantity, v_cost_value
+    FROM product_stock_balance
+    WHERE product_id = p_product_id;
+
+    IF v_last_cost_at IS NULL OR v_last_cost_at <= p_at THEN
+        RETURN v_cost_value / NULLIF(v_cost_quantity, 0);
+    END IF;
+
+    RETURN (
+        SELECT SUM(im.quantity * im.unit_cost) / SUM(im.quantity)
+        FROM (
+            SELECT quantity, unit_cost FROM inventory_movement
+            WHERE product_id = p_product_id
+              AND movement_type IN ('STOCK_IN', 'OPENING')
+              AND movement_date <= p_at
+            UNION ALL
+            SELECT quantity, unit_cost FROM inventory_movement_archive
+            WHERE product_id = p_product_id
+              AND movement_type IN ('STOCK_IN', 'OPENING')
+              AND movement_date <= p_at
+        ) im
+    );
+END//
+
+-- Removes the movements explicitly: the FK cascade on stock_in_item would not fire the triggers above.
+-- Then re-freezes the cost of any later sales of the affected products.
+CREATE TRIGGER trg_before_stock_in_delete
+BEFORE DELETE ON stock_in
+FOR EACH ROW
+BEGIN
+  DECLARE v_done BOOLEAN DEFAULT FALSE;
+  DECLARE v_product_id INT;
+  DECLARE cur_products CURSOR FOR
+    SELECT DISTINCT product_id FROM stock_in_item WHERE stock_in_id = OLD.stock_in_id;
+  DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_done = TRUE;
+
+  -- Archived movements are no longer in inventory_movement to be reversed
+  CALL sp_assert_not_archived(OLD.stock_in_date);
+
+  DELETE im
+  FROM inventory_movement im
+  JOIN stock_in_item sii
+    ON sii.stock_in_item_id = im.stock_in_item_id
+  WHERE sii.stock_in_id = OLD.stock_in_id;
+
+  OPEN cur_products;
+  refreeze_loop: LOOP
+    FETCH cur_products INTO v_product_id;
+    IF v_done THEN
+      LEAVE refreeze_loop;
+    END IF;
+    CALL sp_refreeze_sale_costs(v_product_id, OLD.stock_in_date);
+  END LOOP;
+  CLOSE cur_products;
+END//
+
+-- Stock-ins dated in the archived period are read-only, and none can be moved into it.
+CREATE TRIGGER trg_before_stock_in_update
+BEFORE UPDATE ON stock_in
+FOR EACH ROW
+BEGIN
+    IF NEW.stock_in_date <> OLD.stock_in_date THEN
+        CALL sp_assert_not_archived(OLD.stock_in_date);
+        CALL sp_assert_not_archived(NEW.stock_in_date);
+    END IF;
+END//
+
+-- Adjusts total_cost AND updates the inventory movement record.
+CREATE TRIGGER trg_after_stock_in_item_update
+AFTER UPDATE ON stock_in_item
+FOR EACH ROW
+BEGIN
+    CALL sp_assert_not_archived((SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+
+    -- First, adjust the total cost using both OLD and NEW values
+    UPDATE stock_in
+    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost) + (NEW.quantity * NEW.unit_cost)
+    WHERE stock_in_id = OLD.stock_in_id;
+
+    -- Second, update the corresponding inventory movement record
+    UPDATE inventory_movement im
+    JOIN stock_in si ON si.stock_in_id = OLD.stock_in_id
+    SET 
+        im.quantity = NEW.quantity,
+        im.unit_cost = NEW.unit_cost,
+        im.product_id = NEW.product_id,
+        im.movement_date = si.stock_in_date
+    WHERE im.stock_in_item_id = OLD.stock_in_item_id;
+
+    -- Third, re-freeze the cost of sales dated after this stock in
+    IF NEW.quantity <> OLD.quantity OR NEW.unit_cost <> OLD.unit_cost OR NEW.product_id <> OLD.product_id THEN
+        CALL sp_refreeze_sale_costs(OLD.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+        IF NEW.product_id <> OLD.product_id THEN
+            CALL sp_refreeze_sale_costs(NEW.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+        END IF;
+    END IF;
+END//
+
+-- Adjusts total_cost AND deletes the inventory movement record.
+CREATE TRIGGER trg_before_stock_in_item_delete
+BEFORE DELETE ON stock_in_item
+FOR EACH ROW
+BEGIN
+    CALL sp_assert_not_archived((SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+
+    -- First, subtract the item's cost from the parent's total
+    UPDATE stock_in
+    SET total_cost = total_cost - (OLD.quantity * OLD.unit_cost)
+    WHERE stock_in_id = OLD.stock_in_id;
+
+    -- Second, delete the corresponding inventory movement record
+    DELETE FROM inventory_movement WHERE stock_in_item_id = OLD.stock_in_item_id;
+
+    -- Third, re-freeze the cost of sales dated after this stock in
+    CALL sp_refreeze_sale_costs(OLD.product_id, (SELECT stock_in_date FROM stock_in WHERE stock_in_id = OLD.stock_in_id));
+END//
+
+DELIMITER ;
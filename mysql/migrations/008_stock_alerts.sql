@@ -0,0 +1,51 @@
+-- =================================================================
+--  008: low-stock alert feed
+--  The product_stock_balance triggers record every flip of
+--  needs_restock in stock_alert_event. The API pushes those rows to
+--  subscribers of GET /alerts/low-stock/stream (Server-Sent Events),
+--  which resume from the last seq they received.
+--  Requires 001.
+-- =================================================================
+
+-- Low-stock alert feed: one row each time a product's needs_restock flips, written by the
+-- product_stock_balance triggers. seq is the resume position of GET /alerts/low-stock/stream.
+CREATE TABLE IF NOT EXISTS stock_alert_event(
+	seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+	product_id INT NOT NULL,
+	needs_restock TINYINT(1) NOT NULL, -- 1: at or below reorder_level, 0: recovered above it
+	stock_on_hand INT NOT NULL,
+	reorder_level INT NOT NULL,
+	created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	INDEX idx_sae_created (created_at)
+);
+
+DROP TRIGGER IF EXISTS trg_after_product_stock_balance_insert;
+DROP TRIGGER IF EXISTS trg_after_product_stock_balance_update;
+
+DELIMITER //
+
+-- Low-stock alerts: only the balance rows a write actually touched are re-evaluated (by
+-- sp_apply_movement or trg_after_product_update), so a crossing is recorded here, once.
+CREATE TRIGGER trg_after_product_stock_balance_insert
+AFTER INSERT ON product_stock_balance
+FOR EACH ROW
+BEGIN
+    IF NEW.needs_restock = 1 THEN
+        INSERT INTO stock_alert_event (product_id, needs_restock, stock_on_hand, reorder_level)
+        SELECT NEW.product_id, 1, NEW.stock_on_hand, reorder_level
+        FROM product WHERE product_id = NEW.product_id;
+    END IF;
+END//
+
+CREATE TRIGGER trg_after_product_stock_balance_update
+AFTER UPDATE ON product_stock_balance
+FOR EACH ROW
+BEGIN
+    IF NEW.needs_restock <> OLD.needs_restock THEN
+        INSERT INTO stock_alert_event (product_id, needs_restock, stock_on_hand, reorder_level)
+        SELECT NEW.product_id, NEW.needs_restock, NEW.stock_on_hand, reorder_level
+        FROM product WHERE product_id = NEW.product_id;
+    END IF;
+END//
+
+DELIMITER ;
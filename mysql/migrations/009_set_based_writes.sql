@@ -0,0 +1,23 @@
+-- =================================================================
+--  009: set-based sale and stock in line writes
+--  The API writes sale_item and stock_in_item lines together with
+--  their header totals, frozen unit costs and inventory movements in
+--  a few set-based statements per request (app_api/services/ledger.py),
+--  so the per-row triggers that did the same for every line retire.
+--  Writes to these two tables from outside the API must now go
+--  through the API, or maintain totals and movements themselves.
+--  The inventory_movement, product_stock_balance, product and stock_in
+--  / sale header triggers stay: balances, snapshots, alerts, the
+--  archived-period check and header deletes are unchanged.
+--  Requires 002 and 007.
+-- =================================================================
+
+DROP TRIGGER IF EXISTS trg_before_sale_item_insert;
+DROP TRIGGER IF EXISTS trg_before_sale_item_update;
+DROP TRIGGER IF EXISTS trg_after_sale_item_insert;
+DROP TRIGGER IF EXISTS trg_after_sale_item_update;
+DROP TRIGGER IF EXISTS trg_before_sale_item_delete;
+
+DROP TRIGGER IF EXISTS trg_after_stock_in_item_insert;
+DROP TRIGGER IF EXISTS trg_after_stock_in_item_update;
+DROP TRIGGER IF EXISTS trg_before_stock_in_item_delete;
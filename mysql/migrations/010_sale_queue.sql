@@ -0,0 +1,18 @@
+-- =================================================================
+--  010: write-ahead queue receipts
+--  POST /sales/ with Prefer: respond-async appends the sale to a
+--  local log and answers 202 with a provisional id; a worker drains
+--  the log into MySQL. Each drained submission leaves a receipt here,
+--  written in the sale's own transaction, which makes replaying the
+--  log after a restart exactly-once and backs
+--  GET /sales/queued/{provisional_id}.
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS sale_queue_receipt(
+	provisional_id CHAR(32) PRIMARY KEY,
+	sale_id INT NULL, -- NULL when the submission was rejected, see error
+	error VARCHAR(255) NULL,
+	queued_at DATETIME NOT NULL,
+	processed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	INDEX idx_sqr_processed (processed_at)
+);
@@ -0,0 +1,21 @@
+-- =================================================================
+--  Read replica bootstrap (db-replica service)
+--  Replicates everything from the db service by GTID auto-positioning,
+--  schema included (init.sql runs on the source and reaches the
+--  replica through the binary log), so the replica must start from an
+--  empty volume together with, or after, a fresh source.
+-- =================================================================
+
+CHANGE REPLICATION SOURCE TO
+    SOURCE_HOST = 'db',
+    SOURCE_PORT = 3306,
+    SOURCE_USER = 'root',
+    SOURCE_PASSWORD = 'rootpass',
+    SOURCE_AUTO_POSITION = 1,
+    GET_SOURCE_PUBLIC_KEY = 1,
+    SOURCE_CONNECT_RETRY = 5;
+
+START REPLICA;
+
+-- Also reject writes from SUPER accounts (the API connects as root); replication is exempt
+SET PERSIST super_read_only = ON;